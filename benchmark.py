@@ -0,0 +1,279 @@
+import argparse, json, multiprocessing, os, platform, random, resource, subprocess, sys, time
+
+import blockchain
+import metrics
+from blockchain import (
+    generate_wallet, sign_transaction, compute_tx_hash, verify_signature, verify_signatures,
+    get_block_reward, create_block, consensus_protocol, transaction_fee, TX_VERSION,
+)
+from peers import PeerConnectionManager
+from storage import NodeStorage
+
+# 벤치마크
+# - 재현 가능한 합성 지갑/트랜잭션/체인 생성 (seed 고정)
+# - 메모리 저장소(memory://)에서 실행하므로 MongoDB 없이 측정
+# - 시나리오별 처리량(txs/sec, blocks/sec), 지연 p50/p99, 최대 RSS를 출력하고 JSON으로 저장해 커밋 간 비교
+#
+# 사용 예)
+#   python benchmark.py --blocks 20 --txs-per-block 512 --json bench.json
+#   python benchmark.py --json after.json --compare bench.json
+#   python benchmark.py --scenario consensus_sync --metrics bench.prom
+
+scenarios = ["sign", "verify", "verify_batch", "block_reward", "create_block", "consensus_sync"]
+
+# ---------- 합성 데이터 ----------
+
+def make_wallets(count, seed):
+    rng = random.Random(seed)
+    return [generate_wallet(entropy=rng.randbytes) for _ in range(count)]
+
+def make_transactions(wallets, count, seed, timestamp=None):
+    rng = random.Random(seed)
+    timestamp = time.time() if timestamp is None else timestamp
+    txs = []
+    for i in range(count):
+        sender, private_key = wallets[rng.randrange(len(wallets))]
+        recipient = wallets[rng.randrange(len(wallets))][0]
+        tx = {
+            "version": TX_VERSION,
+            "sender": sender,
+            "recipient": recipient,
+            "amount": round(rng.uniform(0.01, 5.0), 2),
+            "fee": transaction_fee,
+            "timestamp": timestamp + i * 1e-3,
+        }
+        tx["signature"] = sign_transaction(private_key, tx)
+        tx["tx_hash"] = compute_tx_hash(tx)
+        txs.append(tx)
+    return txs
+
+# 지갑마다 같은 초기 잔고를 accounts 컬렉션에 기록 (생성 노드/동기화 노드 공통)
+def fund_wallets(accounts, wallets, balance=1_000_000.0):
+    accounts.insert_many([{"address": public_key, "balance": balance} for public_key, _ in wallets])
+
+# blocks 개 블록, 블록당 txs_per_block 개 트랜잭션의 체인 생성 (블록 생성 지연 목록 반환)
+def build_chain(node, wallets, blocks, txs_per_block, seed, miner_address):
+    latencies = []
+    for height in range(blocks):
+        txs = make_transactions(wallets, txs_per_block, seed + height)
+        if txs:
+            node.tx_pool.insert_many(txs)
+        start = time.perf_counter()
+        create_block(node.blocks, node.tx_pool, 0, miner_address=miner_address)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+# ---------- 통계 ----------
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024    # macOS: 바이트, Linux: KB
+
+def summarize(latencies, ops, elapsed, unit="txs", extra=None):
+    result = {
+        "ops": ops,
+        "seconds": round(elapsed, 6),
+        f"{unit}_per_sec": round(ops / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+        "peak_rss_mb": round(peak_rss_mb(), 2),
+    }
+    result.update(extra or {})
+    return result
+
+def _timed(fn, items):
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - start
+
+# ---------- 시나리오 ----------
+
+def bench_sign(args):
+    wallets = make_wallets(args.wallets, args.seed)
+    rng = random.Random(args.seed)
+    items = []
+    for i in range(args.txs):
+        public_key, private_key = wallets[i % len(wallets)]
+        items.append((private_key, {"version": TX_VERSION, "sender": public_key, "recipient": wallets[rng.randrange(len(wallets))][0],
+                                    "amount": 1.0, "fee": transaction_fee, "timestamp": 1_700_000_000 + i}))
+    latencies, elapsed = _timed(lambda item: sign_transaction(*item), items)
+    return summarize(latencies, len(items), elapsed)
+
+def bench_verify(args):
+    blockchain.clear_vk_cache()
+    txs = make_transactions(make_wallets(args.wallets, args.seed), args.txs, args.seed)
+    latencies, elapsed = _timed(verify_signature, txs)
+    return summarize(latencies, len(txs), elapsed, extra={"vk_cache": blockchain.get_vk_cache_stats()})
+
+def bench_verify_batch(args):
+    blockchain.clear_vk_cache()
+    txs = make_transactions(make_wallets(args.wallets, args.seed), args.txs, args.seed)
+    batch = max(1, args.txs_per_block)
+    batches = [txs[i:i + batch] for i in range(0, len(txs), batch)]
+    latencies, elapsed = _timed(lambda chunk: verify_signatures(chunk, workers=args.workers), batches)
+    return summarize(latencies, len(txs), elapsed, extra={"batch_size": batch, "workers": args.workers})
+
+def bench_block_reward(args):
+    heights = list(range(1, args.reward_calls + 1))
+    latencies, elapsed = _timed(get_block_reward, heights)
+    return summarize(latencies, len(heights), elapsed, unit="calls")
+
+def bench_create_block(args):
+    node = NodeStorage(f"memory://bench-create-{os.getpid()}-{time.time_ns()}")
+    wallets = make_wallets(args.wallets, args.seed)
+    fund_wallets(node.accounts, wallets)
+    latencies = build_chain(node, wallets, args.blocks, args.txs_per_block, args.seed, wallets[0][0])
+    elapsed = sum(latencies)
+    txs = sum(len(blk["transactions"]) for blk in node.blocks.find({}, {"transactions.sender": 1}))
+    return summarize(latencies, txs, elapsed, extra={
+        "blocks": args.blocks,
+        "blocks_per_sec": round(args.blocks / elapsed, 2) if elapsed > 0 else 0.0,
+    })
+
+def bench_consensus_sync(args):
+    suffix = f"{os.getpid()}-{time.time_ns()}"
+    producer_uri = f"memory://bench-producer-{suffix}"
+    producer = NodeStorage(producer_uri)
+    follower = NodeStorage(f"memory://bench-follower-{suffix}")
+    wallets = make_wallets(args.wallets, args.seed)
+    fund_wallets(producer.accounts, wallets)
+    fund_wallets(follower.accounts, wallets)
+    build_chain(producer, wallets, args.blocks, args.txs_per_block, args.seed, wallets[0][0])
+    follower.peers.insert_one({"uri": producer_uri, "public_key": "bench", "timestamp": time.time()})
+
+    manager = PeerConnectionManager(allowed_schemes=("memory://",))
+    start = time.perf_counter()
+    consensus_protocol(follower.blocks, follower.peers, follower.tx_pool, 0, None, peer_manager=manager)
+    elapsed = time.perf_counter() - start
+    manager.close()
+
+    # 합의 마지막 단계에서 팔로워가 만든 블록은 제외
+    produced = producer.blocks.count_documents({})
+    synced_query = {"index": {"$lte": produced}}
+    synced = follower.blocks.count_documents(synced_query)
+    txs = sum(len(blk["transactions"]) for blk in follower.blocks.find(synced_query, {"transactions.sender": 1}))
+    return summarize([elapsed], txs, elapsed, extra={
+        "blocks": synced,
+        "blocks_per_sec": round(synced / elapsed, 2) if elapsed > 0 else 0.0,
+        "synced": synced == produced,
+    })
+
+_BENCHES = {
+    "sign": bench_sign,
+    "verify": bench_verify,
+    "verify_batch": bench_verify_batch,
+    "block_reward": bench_block_reward,
+    "create_block": bench_create_block,
+    "consensus_sync": bench_consensus_sync,
+}
+
+def _run_isolated(name, args, queue):
+    queue.put(_BENCHES[name](args))
+
+# 시나리오 실행 (isolate=True면 시나리오마다 새 프로세스 → 시나리오별 최대 RSS)
+def run_scenario(name, args):
+    if not args.isolate:
+        return _BENCHES[name](args)
+    context = multiprocessing.get_context("fork" if sys.platform != "win32" else "spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_isolated, args=(name, args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+# ---------- 출력 / 비교 ----------
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def _throughput_key(result):
+    return next((k for k in result if k.endswith("_per_sec") and k != "blocks_per_sec"), None)
+
+def compare(results, baseline):
+    lines = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        key = _throughput_key(result)
+        changes = []
+        for metric in (key, "p50_ms", "p99_ms", "peak_rss_mb"):
+            if metric and base.get(metric):
+                changes.append(f"{metric} {100 * (result[metric] - base[metric]) / base[metric]:+.1f}%")
+        lines.append(f"{name:16s} " + ", ".join(changes))
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="XperChain 벤치마크")
+    parser.add_argument("--scenario", action="append", choices=scenarios, help="실행할 시나리오 (여러 번 지정 가능, 기본: 전체)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--wallets", type=int, default=50)
+    parser.add_argument("--txs", type=int, default=2000, help="서명/검증 시나리오 트랜잭션 수")
+    parser.add_argument("--blocks", type=int, default=20, help="체인 시나리오 블록 수")
+    parser.add_argument("--txs-per-block", type=int, default=2 * blockchain.signature_parallel_min,
+                        help="블록당 트랜잭션 수 (signature_parallel_min 미만이면 서명을 직렬로 검증)")
+    parser.add_argument("--reward-calls", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=None, help="서명 일괄 검증 프로세스 수")
+    parser.add_argument("--isolate", action="store_true", help="시나리오마다 별도 프로세스에서 실행")
+    parser.add_argument("--json", dest="json_path", help="결과 JSON 파일 경로 (-: 표준 출력)")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON 파일")
+    parser.add_argument("--metrics", dest="metrics_path", help="단계별 지표를 Prometheus 텍스트 파일로 저장")
+    args = parser.parse_args(argv)
+    if args.metrics_path:
+        metrics.enable()
+
+    results = {}
+    for name in args.scenario or scenarios:
+        results[name] = run_scenario(name, args)
+        result = results[name]
+        key = _throughput_key(result)
+        print(f"{name:16s} {key}={result[key]:>12,.2f}  p50={result['p50_ms']:.3f}ms  p99={result['p99_ms']:.3f}ms  "
+              f"rss={result['peak_rss_mb']:.1f}MB", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("json_path", "compare", "metrics_path")},
+        },
+        "results": results,
+    }
+    if args.json_path == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.metrics_path:
+        metrics.write_textfile(args.metrics_path)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"비교 기준: {args.compare} (commit {baseline.get('meta', {}).get('commit')})", file=sys.stderr)
+        for line in compare(results, baseline):
+            print(line, file=sys.stderr)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,126 @@
 import pandas as pd
 import math
 
-import streamlit as st
-from pymongo import MongoClient
+# Streamlit 없이 실행하는 경우 (채굴 데몬 등 display=False 전용)
+try:
+    import streamlit as st
+except ImportError:
+    st = None
+from pymongo.errors import DuplicateKeyError, PyMongoError
 from datetime import datetime, timedelta, timezone
 import time
+import os, atexit, threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 import hashlib, json, base64
 from ecdsa import VerifyingKey, VerifyingKey, BadSignatureError, SigningKey, SECP256k1
+from ecdsa.ellipticcurve import PointJacobi
+from ecdsa.util import sigencode_string
+
+from ledger import LedgerState
+from pruner import load_block
+from snapshots import get_snapshots, latest_snapshot, snapshot_due, create_snapshot, load_snapshot, restore_accounts, select_snapshot
+from peers import peer_manager as default_peer_manager, poll_peer_tips
+from seen_index import find_included
+from metrics import span, inc, observe
+from mempool import iter_pool_by_fee, tx_size, pool_tx, pool_document, ensure_mempool_indexes, remove_pool_txs, restore_pool_txs
+from encoding import (
+    TX_VERSION, BLOCK_VERSION, BINARY_BLOCK_VERSION, MERKLE_BLOCK_VERSION, signing_digest, compute_tx_hash, get_tx_hash,
+    hash_block, compute_merkle_root, merkle_proof, verify_merkle_proof, is_canonical_hex, is_noncanonical_hex,
+)
 
 block_time_in_min = 1   # 블록 생성 주기(분)
 transaction_fee = 0.01     # 거래 수수료
 
+signature_workers = int(os.environ.get("XPER_SIGNATURE_WORKERS", os.cpu_count() or 1))  # 서명 검증 프로세스 수 (1이면 직렬 처리)
+signature_parallel_min = 256   # 이 개수 미만의 트랜잭션은 직렬로 검증
+
+max_block_txs = 5000           # 블록당 최대 트랜잭션 수 (보상 트랜잭션 제외)
+max_block_bytes = 1_000_000    # 블록당 최대 트랜잭션 바이트 수 (정규 인코딩 기준)
+template_chunk_size = 512      # 블록 템플릿 구성 시 한 번에 검증할 후보 수
+body_batch_size = 100          # 동기화 시 한 번에 받을 블록 본문 수
+header_batch_size = 2000       # 동기화 시 한 번에 받을 블록 헤더 수
+
+vk_cache_size = 4096         # 공개키(VerifyingKey) 캐시 크기
+vk_precompute_uses = 8       # 이 횟수 이상 사용된 공개키는 곱셈 테이블 사전 계산
+
+admission_cache_size = 100_000   # 풀 입장 시 서명 검증을 마친 트랜잭션 해시 기억 개수
+max_tx_future_seconds = 300      # 트랜잭션 시각이 현재보다 이만큼 넘게 앞서면 거부
+
 # 블록 해시 함수
 def generate_hash(contents):
     contents_string = json.dumps(contents, sort_keys=True).encode()
     return hashlib.sha256(contents_string).hexdigest()
 
+# 공개키 캐시 (LRU, 프로세스별로 유지됨)
+_vk_cache = OrderedDict()    # public_key_bytes -> [VerifyingKey, 사용 횟수]
+_vk_cache_lock = threading.Lock()
+_vk_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "precomputed": 0}
+
+def _precompute_verifying_key(vk):
+    # from_string으로 만든 점은 order 정보가 없어 precompute()를 바로 쓸 수 없으므로 다시 구성
+    point = vk.pubkey.point
+    point = PointJacobi(SECP256k1.curve, point.x(), point.y(), 1, SECP256k1.order, generator=True)
+    fast_vk = VerifyingKey.from_public_point(point, curve=SECP256k1, validate_point=False)
+    fast_vk.precompute()
+    return fast_vk
+
+def get_verifying_key(public_key_bytes):
+    with _vk_cache_lock:
+        entry = _vk_cache.get(public_key_bytes)
+        if entry is not None:
+            _vk_cache.move_to_end(public_key_bytes)
+            _vk_cache_stats["hits"] += 1
+            entry[1] += 1
+            if entry[1] != vk_precompute_uses:
+                return entry[0]
+        else:
+            _vk_cache_stats["misses"] += 1
+
+    if entry is None:
+        vk = VerifyingKey.from_string(public_key_bytes, curve=SECP256k1)
+        with _vk_cache_lock:
+            _vk_cache[public_key_bytes] = [vk, 1]
+            while len(_vk_cache) > vk_cache_size:
+                _vk_cache.popitem(last=False)
+                _vk_cache_stats["evictions"] += 1
+        return vk
+
+    # 자주 쓰이는 키 → 사전 계산된 키로 교체
+    fast_vk = _precompute_verifying_key(entry[0])
+    with _vk_cache_lock:
+        entry[0] = fast_vk
+        _vk_cache_stats["precomputed"] += 1
+    return fast_vk
+
+# 공개키 캐시 통계 (캐시 크기 조정용)
+def get_vk_cache_stats():
+    with _vk_cache_lock:
+        stats = dict(_vk_cache_stats)
+        stats["size"] = len(_vk_cache)
+    stats["capacity"] = vk_cache_size
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+def clear_vk_cache():
+    with _vk_cache_lock:
+        _vk_cache.clear()
+        for key in _vk_cache_stats:
+            _vk_cache_stats[key] = 0
+
+_half_order = SECP256k1.order // 2
+
 # 서명 검증 함수
 def verify_signature(tx):
     try:
-        tx_copy = dict(tx)
-        signature_b64 = tx_copy.pop("signature", None)
+        signature_b64 = tx.get("signature")
         if not signature_b64:
             return False
 
-        tx_string = json.dumps(tx_copy, sort_keys=True).encode()
-        tx_hash = hashlib.sha256(tx_string).digest()
+        tx_hash = signing_digest(tx)
 
         public_key_hex = tx["sender"]
         public_key_bytes = bytes.fromhex(public_key_hex)
@@ -34,28 +128,212 @@ def verify_signature(tx):
         if len(public_key_bytes) != 64:
             return False  # SECP256k1 expects uncompressed 64-byte public key
 
-        vk = VerifyingKey.from_string(public_key_bytes, curve=SECP256k1)
+        vk = get_verifying_key(public_key_bytes)
         signature = base64.b64decode(signature_b64)
 
+        # s를 n - s로 바꾼 서명도 수학적으로 유효하므로 낮은 s만 인정 (서명 변형으로 다른 tx_hash를 만들어 재전송하는 것 방지)
+        if len(signature) != 64 or int.from_bytes(signature[32:], "big") > _half_order:
+            return False
+
         return vk.verify(signature, tx_hash)
 
     except (BadSignatureError, ValueError, KeyError):
         return False
 
+# 내 체인을 바꾸는 작업(동기화, 블록 생성) 직렬화용 잠금
+chain_lock = threading.RLock()
+
+# 서명 검증 프로세스 풀
+_signature_executor = None
+_signature_executor_workers = 0
+
+def _get_signature_executor(workers):
+    global _signature_executor, _signature_executor_workers
+    if _signature_executor is None or _signature_executor_workers != workers:
+        _shutdown_signature_executor()
+        _signature_executor = ProcessPoolExecutor(max_workers=workers)
+        _signature_executor_workers = workers
+    return _signature_executor
+
+def _shutdown_signature_executor():
+    global _signature_executor, _signature_executor_workers
+    if _signature_executor is not None:
+        _signature_executor.shutdown(wait=False, cancel_futures=True)
+    _signature_executor = None
+    _signature_executor_workers = 0
+
+atexit.register(_shutdown_signature_executor)
+
+def _verify_signature_chunk(txs):
+    return [verify_signature(tx) for tx in txs]
+
+# 서명 일괄 검증 함수 (입력 순서대로 결과 반환)
+def verify_signatures(txs, workers=None):
+    txs = list(txs)
+    workers = signature_workers if workers is None else workers
+    inc("xper_txs_verified_total", len(txs))
+
+    if workers <= 1 or len(txs) < signature_parallel_min:
+        return _verify_signature_chunk(txs)
+
+    # 같은 송신자의 트랜잭션이 같은 워커로 가도록 정렬 (워커별 공개키 캐시 활용)
+    order = sorted(range(len(txs)), key=lambda i: str(txs[i].get("sender", "")))
+    ordered_txs = [txs[i] for i in order]
+
+    # 워커당 4개 정도의 청크로 나누어 부하 분산
+    chunk_size = max(64, math.ceil(len(txs) / (workers * 4)))
+    chunks = [ordered_txs[i:i + chunk_size] for i in range(0, len(ordered_txs), chunk_size)]
+
+    try:
+        executor = _get_signature_executor(workers)
+        results = [False] * len(txs)
+        position = 0
+        for chunk_result in executor.map(_verify_signature_chunk, chunks):
+            for ok in chunk_result:
+                results[order[position]] = ok
+                position += 1
+        return results
+    except (BrokenProcessPool, OSError):
+        # 프로세스 풀 사용 불가 시 직렬 처리
+        _shutdown_signature_executor()
+        return _verify_signature_chunk(txs)
+
+# ---------- 트랜잭션 풀 입장 검증 ----------
+# 형식, 수수료, 서명, 잔고를 풀에 넣을 때 한 번만 검증하고 내용 해시(compute_tx_hash)를 기억
+# - 같은 프로세스: _verified_txs (LRU)
+# - 다른 프로세스(지갑·RPC에서 입장, 채굴 데몬에서 블록 생성): 풀 문서의 admitted 필드 (mempool.pool_document)
+# → create_block은 기억된 트랜잭션의 서명 검증을 건너뛰고 잔고 등 상태 검사만 수행
+
+class TransactionRejected(ValueError):
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason    # format, hash, fee, duplicate, signature, balance
+
+_verified_txs = OrderedDict()    # 서명 검증을 마친 트랜잭션 내용 해시 (LRU)
+_verified_lock = threading.Lock()
+
+def remember_verified(tx_hashes):
+    with _verified_lock:
+        for tx_hash in tx_hashes:
+            _verified_txs[tx_hash] = True
+            _verified_txs.move_to_end(tx_hash)
+        while len(_verified_txs) > admission_cache_size:
+            _verified_txs.popitem(last=False)
+
+def forget_verified(tx_hashes):
+    with _verified_lock:
+        for tx_hash in tx_hashes:
+            _verified_txs.pop(tx_hash, None)
+
+def is_verified(tx_hash):
+    with _verified_lock:
+        return tx_hash in _verified_txs
+
+# 여러 해시 중 서명 검증을 마친 것 (잠금 1회)
+def verified_subset(tx_hashes):
+    with _verified_lock:
+        return {tx_hash for tx_hash in tx_hashes if tx_hash in _verified_txs}
+
+def _reject(reason, message):
+    inc("xper_txs_rejected_total", reason=reason, stage="admission")
+    raise TransactionRejected(reason, message)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+# 트랜잭션 형식 검사
+def check_tx_format(tx, now=None):
+    now = time.time() if now is None else now
+    for field in ("sender", "recipient", "amount", "timestamp", "signature"):
+        if field not in tx:
+            _reject("format", f"필수 필드 누락: {field}")
+    if not is_canonical_hex(tx["sender"], 64):
+        _reject("format", "보내는 주소는 64바이트 공개키(소문자 hex)여야 합니다.")
+    recipient = tx["recipient"]
+    if not isinstance(recipient, str) or not recipient or recipient == "SYSTEM" or len(recipient) > 256:
+        _reject("format", "받는 주소가 올바르지 않습니다.")
+    if is_noncanonical_hex(recipient, 64):
+        _reject("format", "받는 주소는 소문자 hex로 표기해야 합니다.")
+    if tx.get("version", 1) not in (1, TX_VERSION):
+        _reject("format", f"지원하지 않는 트랜잭션 버전: {tx.get('version')}")
+    if not _is_number(tx["amount"]) or tx["amount"] <= 0:
+        _reject("format", "금액은 0보다 커야 합니다.")
+    if not _is_number(tx.get("fee", 0)) or not _is_number(tx["timestamp"]):
+        _reject("format", "수수료/시각 형식 오류")
+    if tx["timestamp"] > now + max_tx_future_seconds:
+        _reject("format", "트랜잭션 시각이 현재보다 앞섭니다.")
+    if not isinstance(tx["signature"], str) or not tx["signature"]:
+        _reject("format", "서명이 없습니다.")
+    try:
+        tx_size(tx)    # 정규 인코딩 가능 여부 (정수 범위, 필드 길이)
+    except ValueError as e:
+        _reject("format", f"인코딩할 수 없는 트랜잭션: {e}")
+
+# 풀에서 아직 블록에 포함되지 않은 송신자의 지출 합계 (금액 + 수수료)
+def pending_spend(tx_pool, sender, mempool=None):
+    if mempool is not None:
+        mempool.refresh()
+        return mempool.pending_spend(sender)
+    return sum(tx["amount"] + tx.get("fee", 0) for tx in tx_pool.find({"sender": sender}, {"_id": 0, "amount": 1, "fee": 1}))
+
+# 트랜잭션 풀 입장 (검증 후 풀에 저장, tx_hash 반환 / 실패 시 TransactionRejected)
+# blocks를 넘기지 않으면 같은 DB의 blocks 컬렉션에서 이미 포함된 트랜잭션인지 확인
+def admit_transaction(tx_pool, tx, accounts=None, mempool=None, now=None, blocks=None):
+    tx = {k: v for k, v in tx.items() if k != "_id"}
+    check_tx_format(tx, now)
+
+    tx_hash = compute_tx_hash(tx)
+    if tx.get("tx_hash") not in (None, tx_hash):
+        _reject("hash", "tx_hash가 트랜잭션 내용과 다릅니다.")
+    tx["tx_hash"] = tx_hash
+    if tx.get("fee", 0) < transaction_fee:
+        _reject("fee", f"수수료는 {transaction_fee} 이상이어야 합니다.")
+
+    ensure_mempool_indexes(tx_pool)
+    if (mempool is not None and tx_hash in mempool) or tx_pool.find_one({"tx_hash": tx_hash}, {"_id": 1}) is not None:
+        _reject("duplicate", "이미 풀에 있는 트랜잭션입니다.")
+    blocks = tx_pool.database["blocks"] if blocks is None else blocks
+    last_block = blocks.find_one({}, {"_id": 0, "index": 1}, sort=[("index", -1)])
+    if last_block is not None and find_included(blocks, [tx_hash], last_block["index"]):
+        _reject("duplicate", "이미 블록에 포함된 트랜잭션입니다.")
+
+    if not is_verified(tx_hash) and not verify_signature(tx):
+        _reject("signature", "서명 검증 실패")
+    remember_verified([tx_hash])
+
+    accounts = tx_pool.database["accounts"] if accounts is None else accounts
+    available = get_balance(tx["sender"], accounts) - pending_spend(tx_pool, tx["sender"], mempool)
+    if available < tx["amount"] + tx.get("fee", 0):
+        _reject("balance", "잔고 부족 (대기 중인 이체 포함)")
+
+    try:
+        if mempool is not None:
+            mempool.add(tx, admitted=True)
+        else:
+            tx_pool.insert_one(pool_document(tx, admitted=True))
+    except DuplicateKeyError:
+        _reject("duplicate", "이미 풀에 있는 트랜잭션입니다.")
+    inc("xper_txs_admitted_total")
+    return tx_hash
+
 # 서명 생성 함수
 def sign_transaction(private_key, tx_data):
-    tx_copy = dict(tx_data)
-    tx_string = json.dumps(tx_copy, sort_keys=True).encode()
-    tx_hash = hashlib.sha256(tx_string).digest()
+    tx_hash = signing_digest(tx_data)
 
     sk = SigningKey.from_string(bytes.fromhex(private_key), curve=SECP256k1)
-    signature = sk.sign(tx_hash)
+    signature = sk.sign(tx_hash, sigencode=_sigencode_low_s)
 
     return base64.b64encode(signature).decode()
 
-# 지갑 생성 함수
-def generate_wallet():
-    sk = SigningKey.generate(curve=SECP256k1)
+# r || s (32바이트씩), s는 낮은 값(n/2 이하)으로 정규화
+def _sigencode_low_s(r, s, order):
+    if s > order // 2:
+        s = order - s
+    return sigencode_string(r, s, order)
+
+# 지갑 생성 함수 (entropy: 바이트 수를 받아 난수 바이트를 반환하는 함수, 재현 가능한 테스트 지갑용)
+def generate_wallet(entropy=None):
+    sk = SigningKey.generate(curve=SECP256k1, entropy=entropy)
     vk = sk.get_verifying_key()
 
     private_key = sk.to_string().hex()      # 32바이트 개인키 → hex 문자열
@@ -78,6 +356,10 @@ def get_balance(address, accounts):
     account = accounts.find_one({"address": address})
     return account["balance"] if account else 0.0
 
+# 블록 컬렉션과 같은 DB의 accounts 컬렉션
+def get_accounts(blocks):
+    return blocks.database["accounts"]
+
 # 블록 보상 계산 함수
 def get_block_reward(block_height):
     R0 = 10000                   # 초기 보상 
@@ -94,55 +376,142 @@ def verify_blocktime(timestamp_after, timestamp_before, block_time_in_min):
     else:
         return False
     
-# 블록 생성 함수
-def create_block(blocks, tx_pool, block_time_in_min, miner_address=None, display=False):
-    last_block = blocks.find_one(sort=[("index", -1)])
-    last_block_timestamp = last_block["timestamp"] if last_block else 0       
-     
-    if verify_blocktime(timestamp_after = time.time(), timestamp_before = last_block_timestamp, block_time_in_min = block_time_in_min): 
-        raw_txs = list(tx_pool.find({}))                
-        new_index = last_block["index"] + 1 if last_block else 1
+# 블록 템플릿 구성 함수
+# 후보 트랜잭션을 청크 단위로 검증하여 유효한 트랜잭션을 최대 max_txs개 / max_bytes 까지 선택
+# admitted: 풀 문서에 입장 검증 표시가 있는 내용 해시 집합 (후보를 읽으면서 채워질 수 있음)
+# seen_index가 없으면 blocks에서 upto 이하 블록에 포함된 트랜잭션을 조회 (find_included)
+def build_block_template(candidates, ledger, accounts, max_txs=None, max_bytes=None, display=False, verified=None, seen_index=None, admitted=None, blocks=None, upto=0):
+    max_txs = max_block_txs if max_txs is None else max_txs
+    max_bytes = max_block_bytes if max_bytes is None else max_bytes
 
-        # 보상 합계 준비
-        reward = get_block_reward(new_index)
-        total_fees = 0
-        valid_txs = []
-        invalid_txs = []
-        system_tx_count = 0        
-        temp_balances = {}
+    valid_txs = []
+    invalid_txs = []
+    total_fees = 0
+    system_tx_count = 0
+    block_bytes = 0
+    full = False
 
-        for tx in raw_txs:
-            tx = dict(tx)
-            tx.pop("_id", None)
+    candidates = iter(candidates)
+    while not full:
+        chunk = []
+        for tx in candidates:
+            tx = pool_tx(tx)
+            get_tx_hash(tx)
+            chunk.append(tx)
+            if len(chunk) >= template_chunk_size:
+                break
+        if not chunk:
+            break
 
+        # 청크 단위로 잔고 로드 및 서명 일괄 검증
+        ledger.preload(accounts, {address for tx in chunk for address in (tx["sender"], tx["recipient"])})
+        # 풀 입장 시(admitted, 이 프로세스의 입장 기록) 또는 verified(내용 해시 집합)로 서명 검증을 마친 트랜잭션은 다시 검증하지 않음
+        content_hashes = {id(tx): compute_tx_hash(tx) for tx in chunk if tx["sender"] != "SYSTEM"}
+        # 이미 블록에 포함된 트랜잭션 (재전송) → 서명 검증 없이 제외
+        if seen_index is not None:
+            replayed = seen_index.contains(set(content_hashes.values()))
+        elif blocks is not None:
+            replayed = find_included(blocks, content_hashes.values(), upto)
+        else:
+            replayed = set()
+        known = verified_subset(content_hashes.values())
+        unverified = []
+        for tx in chunk:
+            content_hash = content_hashes.get(id(tx))
+            if content_hash is None or content_hash in replayed or content_hash in known:
+                continue
+            if admitted is not None and content_hash in admitted:
+                continue
+            if verified is None or content_hash not in verified:
+                unverified.append(tx)
+        signature_ok = dict(zip(map(id, unverified), verify_signatures(unverified)))
+
+        for tx in chunk:
             sender = tx["sender"]
-            recipient = tx["recipient"]
-            amount = tx["amount"]
-            fee = tx.get("fee", 0)
 
             if sender == "SYSTEM":
                 system_tx_count += 1
                 invalid_txs.append(tx)                
+                inc("xper_txs_rejected_total", reason="system", stage="block_build")
                 continue
 
-            if not verify_signature(tx):
+            if not is_canonical_hex(sender, 64) or is_noncanonical_hex(tx["recipient"], 64):
+                if display:
+                    st.warning(f"❌ 비정규 주소 표기: {sender[:10]}...")
+                invalid_txs.append(tx)
+                inc("xper_txs_rejected_total", reason="format", stage="block_build")
+                continue
+
+            if content_hashes[id(tx)] in replayed:
+                if display:
+                    st.warning(f"❌ 이미 포함된 트랜잭션: {tx['tx_hash'][:12]}...")
+                invalid_txs.append(tx)
+                inc("xper_txs_rejected_total", reason="duplicate", stage="block_build")
+                continue
+
+            if not signature_ok.get(id(tx), True):
                 if display:
                     st.warning(f"❌ 서명 검증 실패: {sender[:10]}...")
                 invalid_txs.append(tx)
+                inc("xper_txs_rejected_total", reason="signature", stage="block_build")
                 continue
 
-            temp_balances[sender] = temp_balances.get(sender, get_balance(sender, blocks))
-            if temp_balances[sender] < amount + fee:
+            size = tx_size(tx)
+            if block_bytes + size > max_bytes:
+                full = True
+                break
+
+            if not ledger.apply_tx(tx):
                 if display:
                     st.warning(f"❌ 잔고 부족: {sender[:10]}...")
                 invalid_txs.append(tx)
+                inc("xper_txs_rejected_total", reason="balance", stage="block_build")
                 continue
 
             # 유효한 거래
-            temp_balances[sender] -= (amount + fee)
-            temp_balances[recipient] = temp_balances.get(recipient, get_balance(recipient, blocks)) + amount
-            total_fees += fee
+            block_bytes += size
+            total_fees += tx.get("fee", 0)
             valid_txs.append(tx)
+            if len(valid_txs) >= max_txs:
+                full = True
+                break
+
+    return valid_txs, invalid_txs, total_fees, system_tx_count
+
+# 블록 생성 함수 (생성한 블록 반환, 생성 시간 조건 미충족 시 None)
+def create_block(blocks, tx_pool, block_time_in_min, miner_address=None, display=False, ledger=None, mempool=None, verified=None, seen_index=None):
+    last_block = blocks.find_one(sort=[("index", -1)])
+    last_block_timestamp = last_block["timestamp"] if last_block else 0       
+     
+    if verify_blocktime(timestamp_after = time.time(), timestamp_before = last_block_timestamp, block_time_in_min = block_time_in_min): 
+        new_index = last_block["index"] + 1 if last_block else 1
+
+        # 보상 합계 준비
+        reward = get_block_reward(new_index)
+
+        # 후보 트랜잭션 (수수료율 높은 순으로 필요한 만큼만 읽음)
+        ensure_mempool_indexes(tx_pool)
+        if mempool is not None:
+            mempool.refresh(full=True)
+            candidates = mempool.iter_best()
+            admitted = mempool.admitted
+        else:
+            admitted = set()
+            candidates = iter_pool_by_fee(tx_pool, batch_size=template_chunk_size, admitted=admitted)
+
+        # 잔고 상태 (없거나 내 체인 끝과 다르면 후보 트랜잭션의 주소만 청크 단위로 로드)
+        ledger = _ledger_at(ledger, last_block["hash"] if last_block else "0")
+        ledger.begin()
+
+        # 재전송 확인용 본 트랜잭션 색인을 내 체인 끝에 맞춤
+        if seen_index is not None:
+            seen_index.sync(last_block)
+
+        with span("block_build"):
+            valid_txs, invalid_txs, total_fees, system_tx_count = build_block_template(
+                candidates, ledger, get_accounts(blocks), display=display, verified=verified, seen_index=seen_index,
+                admitted=admitted, blocks=blocks, upto=new_index - 1,
+            )
 
         # SYSTEM 보상이 아직 추가되지 않았는데, 보상 트랜잭션이 있으면 않됨
         if system_tx_count >=1:
@@ -153,6 +522,7 @@ def create_block(blocks, tx_pool, block_time_in_min, miner_address=None, display
         timestamp = time.time()
         if (reward > 0 or total_fees > 0) and miner_address:
             coinbase_tx = {
+                "version": TX_VERSION,
                 "sender": "SYSTEM",
                 "recipient": miner_address,
                 "amount": reward + total_fees,
@@ -160,36 +530,545 @@ def create_block(blocks, tx_pool, block_time_in_min, miner_address=None, display
                 "signature": "coinbase"
             }
             # 트랜잭션 해시 계산
-            tx_hash = generate_hash(coinbase_tx)            
-            coinbase_tx["tx_hash"] = tx_hash
+            coinbase_tx["tx_hash"] = compute_tx_hash(coinbase_tx)
             valid_txs.insert(0, coinbase_tx)
+            ledger.apply_tx(coinbase_tx)
 
         # 블록 생성
         new_block = {
+            "version": BLOCK_VERSION,
             "index": new_index,
             "timestamp": timestamp,
             "transactions": valid_txs,
             "previous_hash": last_block["hash"] if last_block else "0"
         }
-        new_block["hash"] = generate_hash(new_block)
-        blocks.insert_one(new_block)
-
-        # 트랜잭션 풀 정리
-        for tx in valid_txs + invalid_txs:
-            tx_pool.delete_one({
-                "sender": tx["sender"],
-                "recipient": tx["recipient"],
-                "amount": tx["amount"],
-                "timestamp": tx["timestamp"],
-                "signature": tx["signature"]
-            })
+        with span("block_hash"):
+            new_block["merkle_root"] = compute_merkle_root(valid_txs)
+            new_block["hash"] = hash_block(new_block)
+        try:
+            with span("commit"):
+                blocks.insert_one(new_block)
+        except Exception:
+            ledger.rollback()
+            raise
+        ledger.commit()
+        inc("xper_blocks_created_total")
+        observe("xper_block_txs", len(valid_txs))
+        ledger.height = new_index
+        ledger.tip_hash = new_block["hash"]
+        maybe_snapshot(blocks, ledger)
+        if seen_index is not None:
+            seen_index.add_blocks([new_block])
+
+        # 트랜잭션 풀 정리 (tx_hash 기준 일괄 삭제)
+        with span("pool_cleanup"):
+            if mempool is not None:
+                mempool.remove([tx["tx_hash"] for tx in valid_txs + invalid_txs])
+            remove_pool_txs(tx_pool, valid_txs + invalid_txs)
+            forget_verified(tx["tx_hash"] for tx in valid_txs + invalid_txs)
 
         if display:
             st.success(f"✅ 블록 생성됨: #{new_block['index']} | 트랜잭션 수: {len(valid_txs)} | 보상: {reward} + 수수료 {total_fees}")
+        return new_block
 
     else:
         if display:
             st.info("⏳ 블록 생성 조건(시간간)이 충족되지 않았습니다.")
+        return None
+
+# 블록 헤더 조회 필드 (본문 제외)
+header_projection = {"_id": 0, "version": 1, "index": 1, "hash": 1, "previous_hash": 1, "timestamp": 1, "merkle_root": 1}
+
+# 피어 블록 헤더 조회 (start_index부터 최대 limit개)
+def fetch_headers(peer_blocks, start_index, limit=None):
+    cursor = peer_blocks.find({"index": {"$gte": start_index}}, header_projection).sort("index")
+    if limit:
+        cursor = cursor.limit(limit)
+    return list(cursor)
+
+# 헤더만으로 해시를 다시 계산할 수 있는 블록(머클 루트 포함)은 해시 확인
+# 이전 버전 블록은 트랜잭션이 있어야 계산되므로 본문 단계(verify_block_hash)에서 확인
+def _header_hash_ok(header):
+    if header.get("version", 1) < MERKLE_BLOCK_VERSION:
+        return True
+    try:
+        return hash_block(header) == header["hash"]
+    except (KeyError, ValueError, TypeError):
+        return False
+
+# 헤더 체인 검증 (번호 연속성, 이전 해시 연결, 헤더 해시, 블록 생성 시간)
+def validate_header_chain(headers, anchor, block_time_in_min, display=False):
+    prev_index = anchor["index"] if anchor else 0
+    prev_hash = anchor["hash"] if anchor else "0"
+    prev_time = anchor["timestamp"] if anchor else 0
+
+    for header in headers:
+        if header["index"] != prev_index + 1 or header["previous_hash"] != prev_hash:
+            if display:
+                st.warning(f"❌ 블록 #{header['index']} 헤더 연결 불일치")
+            return False
+        if not verify_blocktime(timestamp_after = header["timestamp"], timestamp_before = prev_time, block_time_in_min = block_time_in_min):
+            if display:
+                st.info(f"⏳ 블록 #{header['index']}은 생성 시간 기준 조건({block_time_in_min}분 경과)을 만족하지 않음")
+            return False
+        if not _header_hash_ok(header):
+            if display:
+                st.warning(f"❌ 블록 #{header['index']} 헤더 해시 불일치")
+            return False
+        prev_index, prev_hash, prev_time = header["index"], header["hash"], header["timestamp"]
+    return True
+
+# 헤더 순서대로 블록 본문을 배치 단위로 조회
+def iter_block_bodies(peer_blocks, headers, batch_size=None):
+    batch_size = body_batch_size if batch_size is None else batch_size
+    for i in range(0, len(headers), batch_size):
+        batch = headers[i:i + batch_size]
+        with span("body_fetch"):
+            bodies = list(peer_blocks.find(
+                {"index": {"$gte": batch[0]["index"], "$lte": batch[-1]["index"]}}, {"_id": 0}
+            ).sort("index"))
+        yield batch, bodies
+
+# 트랜잭션 해시 (블록 본문을 바꾸지 않도록 tx에 저장하지 않음, 기존 블록 JSON 해시 보존)
+def _peek_tx_hash(tx):
+    return tx.get("tx_hash") or compute_tx_hash(tx)
+
+# 블록 해시 검증 (저장된 트랜잭션 해시, 머클 루트 포함)
+def verify_block_hash(blk):
+    version = blk.get("version", 1)
+    if version >= BINARY_BLOCK_VERSION:
+        for tx in blk["transactions"]:
+            if "tx_hash" in tx and tx["tx_hash"] != compute_tx_hash(tx):
+                return False
+    if version >= MERKLE_BLOCK_VERSION and blk.get("merkle_root") != compute_merkle_root(blk["transactions"]):
+        return False
+    return hash_block(blk) == blk["hash"]
+
+# 블록 헤더 필드 (머클 루트 블록은 헤더만으로 해시 검증 가능)
+def block_header(blk):
+    return {k: blk[k] for k in ("version", "index", "timestamp", "previous_hash", "merkle_root", "hash") if k in blk}
+
+# 트랜잭션 포함 증명 생성 (머클 루트가 없는 이전 버전 블록이거나 트랜잭션이 없으면 None)
+def get_tx_proof(blocks, block_index, tx_hash):
+    blk = load_block(blocks, block_index)
+    if blk is None or blk.get("version", 1) < MERKLE_BLOCK_VERSION or "transactions" not in blk:
+        return None
+    txs = blk["transactions"]
+    for position, tx in enumerate(txs):
+        if _peek_tx_hash(tx) == tx_hash:
+            return {
+                "tx_hash": tx_hash,
+                "block_index": block_index,
+                "position": position,
+                "proof": merkle_proof(txs, position),
+                "header": block_header(blk),
+            }
+    return None
+
+# 트랜잭션 포함 증명 검증
+# header 지정 시 그 헤더 기준, 아니면 증명에 포함된 헤더 (증명 자체의 일관성만 확인하므로
+# 증명을 만든 쪽을 신뢰하지 않으려면 피어 등 다른 출처에서 얻은 헤더를 지정)
+def verify_tx_proof(tx_proof, header=None):
+    if not tx_proof:
+        return False
+    header = header if header is not None else tx_proof["header"]
+    if header.get("version", 1) < MERKLE_BLOCK_VERSION or header["index"] != tx_proof["block_index"]:
+        return False
+    if hash_block(header) != header["hash"]:
+        return False
+    return verify_merkle_proof(tx_proof["tx_hash"], tx_proof["proof"], header["merkle_root"])
+
+# 트랜잭션이 포함된 블록 번호 (색인된 transactions 컬렉션 조회, 본문이 가지치기된 블록도 찾음)
+def find_tx_block_index(transactions, tx_hash):
+    row = transactions.find_one({"tx_hash": tx_hash}, {"_id": 0, "block_index": 1})
+    return row["block_index"] if row else None
+
+# 피어에서 블록 헤더 조회 (내 DB와 독립된 출처, 포함 증명 검증용)
+# 헤더 해시가 맞는 응답만 사용, 피어 간 헤더가 다르면 None
+def fetch_peer_header(peers, index, peer_manager=None):
+    peer_manager = default_peer_manager if peer_manager is None else peer_manager
+    header = None
+    for peer in peers.find({}, {"_id": 0, "uri": 1}):
+        try:
+            candidate = peer_manager.get_blocks(peer["uri"]).find_one({"index": index}, header_projection)
+        except PyMongoError as e:
+            peer_manager.mark_failed(peer["uri"], e)
+            continue
+        peer_manager.mark_ok(peer["uri"])
+        if candidate is None or hash_block(candidate) != candidate["hash"]:
+            continue
+        if header is not None and candidate["hash"] != header["hash"]:
+            return None
+        header = candidate
+    return header
+
+# 블록 재생 검증기
+# - 잔고(LedgerState)와 처리한 tx_hash 집합을 유지하며 블록을 순서대로 한 번에 검증
+# - 이전 해시 연결, 블록 해시, 보상·수수료, 서명, 잔고, 중복 트랜잭션 확인
+# - 배치당 DB 조회는 잔고 로드 1회 + 중복 확인 1회 (트랜잭션 수와 무관)
+class BlockValidator:
+    def __init__(self, state, blocks=None, anchor=None, display=False, seen_index=None):
+        self.state = state
+        self.blocks = blocks                  # 중복 확인용 내 체인 (None이면 이번 재생에서 본 트랜잭션만 확인)
+        self.seen_index = seen_index          # 본 트랜잭션 색인 (있으면 blocks 조회 대신 사용)
+        self.accounts = get_accounts(blocks) if blocks is not None else None
+        self.base_index = anchor["index"] if anchor else 0
+        self.prev_index = self.base_index
+        self.prev_hash = anchor["hash"] if anchor else "0"
+        self.seen = set()                     # 이번 재생에서 처리한 tx_hash
+        self.display = display
+        self.error = None
+
+    def _fail(self, message, reason):
+        self.error = message
+        inc("xper_blocks_rejected_total", reason=reason)
+        if self.display:
+            st.warning(message)
+        return False
+
+    # 내 체인(anchor 이하)에 이미 포함된 tx_hash 조회 (1회)
+    def _known_tx_hashes(self, tx_hashes):
+        if self.blocks is None or not tx_hashes or self.base_index <= 0:
+            return set()
+        if self.seen_index is not None:
+            return self.seen_index.contains(tx_hashes, upto=self.base_index)
+        return find_included(self.blocks, tx_hashes, self.base_index)
+
+    # 블록 배치 검증 (headers 지정 시 본문이 헤더와 같은지도 확인)
+    def validate_batch(self, bodies, headers=None):
+        if headers is not None and len(bodies) != len(headers):
+            return self._fail(f"❌ 블록 #{headers[0]['index']}~#{headers[-1]['index']} 본문 누락", "missing_body")
+        if not bodies:
+            return True
+
+        for blk in bodies:
+            if "transactions" not in blk:
+                return self._fail(f"❌ 블록 #{blk['index']} 본문이 가지치기(pruning)되어 검증할 수 없습니다.", "pruned_body")
+
+        txs = [tx for blk in bodies for tx in blk["transactions"]]
+        if self.accounts is not None:
+            self.state.preload(self.accounts, {address for tx in txs for address in (tx["sender"], tx["recipient"])})
+        user_txs = [tx for tx in txs if tx["sender"] != "SYSTEM"]
+        signature_ok = dict(zip(map(id, user_txs), verify_signatures(user_txs)))
+        known = self._known_tx_hashes({_peek_tx_hash(tx) for tx in user_txs})
+
+        for i, blk in enumerate(bodies):
+            if headers is not None:
+                header = headers[i]
+                for field in ("index", "hash", "previous_hash", "timestamp"):
+                    if blk.get(field) != header[field]:
+                        return self._fail(f"❌ 블록 #{header['index']} 본문이 헤더와 다릅니다.", "header_mismatch")
+            if not self.validate_block(blk, signature_ok, known):
+                return False
+        return True
+
+    # 블록 1개 검증 후 상태에 반영 (실패 시 호출 측에서 state.rollback)
+    def validate_block(self, blk, signature_ok, known=()):
+        if blk["index"] != self.prev_index + 1 or blk["previous_hash"] != self.prev_hash:
+            return self._fail(f"❌ 블록 #{blk['index']} 이전 해시 연결 불일치", "linkage")
+        if not verify_block_hash(blk):
+            return self._fail(f"❌ 블록 #{blk['index']} 해시 불일치", "hash")
+
+        system_tx_count = 0
+        total_fees = 0
+        for tx in blk["transactions"]:
+            if tx["sender"] == "SYSTEM":
+                continue
+            fee = tx.get("fee", 0)
+            if tx["amount"] < 0 or fee < 0:
+                return self._fail(f"❌ 블록 #{blk['index']} 음수 금액/수수료", "negative_amount")
+            total_fees += fee
+
+        for tx in blk["transactions"]:
+            if tx["sender"] == "SYSTEM":
+                system_tx_count += 1
+                if system_tx_count > 1:
+                    return self._fail("🚫 SYSTEM 트랜잭션이 1개를 초과합니다.", "coinbase_count")
+                expected_reward = get_block_reward(blk["index"]) + total_fees
+                if tx["amount"] != expected_reward:
+                    return self._fail(f"❌ SYSTEM 보상 금액 불일치 (예상: {expected_reward}, 실제: {tx['amount']})", "coinbase_amount")
+                self.state.apply_tx(tx)
+                continue
+
+            if not is_canonical_hex(tx["sender"], 64) or is_noncanonical_hex(tx["recipient"], 64):
+                return self._fail(f"❌ 블록 #{blk['index']} 주소가 정규 hex 표기가 아닙니다.", "address")
+            tx_hash = _peek_tx_hash(tx)
+            if tx_hash in self.seen or tx_hash in known:
+                return self._fail(f"❌ 중복 트랜잭션: {tx_hash[:12]}...", "duplicate")
+            if not signature_ok[id(tx)]:
+                return self._fail("❌ 서명 검증 실패", "signature")
+            if not self.state.apply_tx(tx):
+                return self._fail("❌ 잔고 부족", "balance")
+            self.seen.add(tx_hash)
+
+        self.prev_index, self.prev_hash = blk["index"], blk["hash"]
+        self.state.height = blk["index"]
+        self.state.tip_hash = blk["hash"]
+        return True
+
+# 이터러블을 size개씩 묶어서 반환
+def _iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# 피어 블록 스트리밍 검증
+# 헤더를 header_batch_size개씩 받아 헤더 체인을 먼저 검증하고, 본문은 body_batch_size개씩 받아 검증한 뒤 on_batch(bodies) 호출
+# 메모리에는 헤더 한 창과 본문 한 배치만 유지
+# 반환: (유효 여부, 마지막으로 검증된 헤더)
+def stream_peer_blocks(peer_blocks, blocks, anchor, state, block_time_in_min, on_batch=None, display=False, seen_index=None):
+    validator = BlockValidator(state, blocks, anchor, display=display, seen_index=seen_index)
+    window_anchor = anchor
+    last_valid = None
+
+    while True:
+        start_index = window_anchor["index"] + 1 if window_anchor else 1
+        with span("header_fetch"):
+            headers = fetch_headers(peer_blocks, start_index, header_batch_size)
+        if not headers:
+            break
+        with span("validation", step="headers"):
+            headers_ok = validate_header_chain(headers, window_anchor, block_time_in_min, display=display)
+        if not headers_ok:
+            inc("xper_blocks_rejected_total", reason="header_chain")
+            return False, last_valid
+
+        for batch, bodies in iter_block_bodies(peer_blocks, headers):
+            with span("validation", step="bodies"):
+                batch_ok = validator.validate_batch(bodies, batch)
+            if not batch_ok:
+                return False, last_valid
+            if on_batch is not None:
+                on_batch(bodies)
+            last_valid = batch[-1]
+
+        window_anchor = headers[-1]
+        if len(headers) < header_batch_size:
+            break
+
+    return last_valid is not None, last_valid
+
+# 검증된 블록 배치 저장 (순서 보장 일괄 삽입) 및 트랜잭션 풀 정리
+def commit_synced_blocks(blocks, tx_pool, bodies, mempool=None, seen_index=None):
+    with span("commit"):
+        blocks.insert_many(bodies, ordered=True)
+    if seen_index is not None:
+        seen_index.add_blocks(bodies)
+    inc("xper_blocks_synced_total", len(bodies))
+    with span("pool_cleanup"):
+        synced_txs = [tx for blk in bodies for tx in blk["transactions"]]
+        remove_pool_txs(tx_pool, synced_txs)
+        if mempool is not None:
+            mempool.remove([get_tx_hash(tx) for tx in synced_txs])
+
+# 동기화 체크포인트 (중단된 동기화를 같은 피어에서 이어서 진행)
+def get_sync_state(blocks):
+    return blocks.database["sync_state"]
+
+def load_sync_checkpoint(blocks):
+    return get_sync_state(blocks).find_one({"_id": "sync"})
+
+def save_sync_checkpoint(blocks, peer_uri, mode, target_index, last_index, last_hash):
+    get_sync_state(blocks).update_one(
+        {"_id": "sync"},
+        {"$set": {
+            "peer_uri": peer_uri,
+            "mode": mode,                  # "extend" | "reorg"
+            "target_index": target_index,
+            "last_index": last_index,
+            "last_hash": last_hash,
+            "updated_at": time.time(),
+        }},
+        upsert=True,
+    )
+
+def clear_sync_checkpoint(blocks):
+    get_sync_state(blocks).delete_one({"_id": "sync"})
+
+# 블록 로케이터 높이 목록 (체인 끝에서 처음 dense개는 1씩, 이후 2배씩 간격을 늘려 제네시스까지)
+def block_locator_heights(tip_index, dense=10):
+    heights = []
+    step = 1
+    height = tip_index
+    while height > 1:
+        heights.append(height)
+        if len(heights) >= dense:
+            step *= 2
+        height -= step
+    heights.append(1)
+    return heights
+
+def _hash_at(collection, index):
+    blk = collection.find_one({"index": index}, {"_id": 0, "hash": 1})
+    return blk["hash"] if blk else None
+
+# 분기점 탐색: 두 체인의 마지막 공통 블록 번호 반환 (공통 블록이 없으면 0)
+# 로케이터 높이의 해시를 양쪽에서 한 번씩 조회한 뒤, 일치/불일치 구간을 이진 탐색 → O(log n) 조회
+def find_fork_point(blocks, peer_blocks, my_tip_index, peer_tip_index):
+    tip_index = min(my_tip_index, peer_tip_index)
+    if tip_index < 1:
+        return 0
+
+    heights = block_locator_heights(tip_index)
+    projection = {"_id": 0, "index": 1, "hash": 1}
+    my_hashes = {blk["index"]: blk["hash"] for blk in blocks.find({"index": {"$in": heights}}, projection)}
+    peer_hashes = {blk["index"]: blk["hash"] for blk in peer_blocks.find({"index": {"$in": heights}}, projection)}
+
+    matched = 0               # 해시가 일치하는 가장 높은 블록
+    mismatched = tip_index + 1  # 해시가 다른 가장 낮은 블록
+    for height in heights:
+        my_hash = my_hashes.get(height)
+        if my_hash is not None and my_hash == peer_hashes.get(height):
+            matched = height
+            break
+        mismatched = height
+
+    while mismatched - matched > 1:
+        mid = (matched + mismatched) // 2
+        my_hash = _hash_at(blocks, mid)
+        if my_hash is not None and my_hash == _hash_at(peer_blocks, mid):
+            matched = mid
+        else:
+            mismatched = mid
+    return matched
+
+# snapshot_interval 블록마다 스냅샷 생성
+# - 전체 잔고 상태(ledger.complete)가 있으면 그 상태로
+# - 없으면 색인기가 체인 끝까지 색인한 accounts를 로드해서 (스냅샷 주기에만 전체 조회)
+def maybe_snapshot(blocks, ledger, indexer=None):
+    snapshots = get_snapshots(blocks)
+    if ledger is not None and ledger.complete:
+        if not snapshot_due(snapshots, ledger.height):
+            return None
+        return create_snapshot(snapshots, ledger)
+    if indexer is None:
+        return None
+    cursor = indexer.get_cursor()
+    if cursor.get("new") or not snapshot_due(snapshots, cursor["height"]):
+        return None
+    tip = blocks.find_one({}, header_projection, sort=[("index", -1)])
+    if tip is None or tip["hash"] != cursor["hash"]:
+        return None    # 색인이 체인 끝보다 뒤처짐 → 다음 색인 후
+    state = LedgerState.load(get_accounts(blocks), height=cursor["height"], tip_hash=cursor["hash"])
+    return create_snapshot(snapshots, state)
+
+# 전체 잔고 상태 로드 (채굴 데몬 등 계속 실행되는 프로세스가 시작할 때, 이후 블록 단위로 증분 갱신)
+# - 색인기가 있으면 accounts를 체인 끝까지 색인한 뒤 한 번에 로드
+# - 없으면 로컬 최신 스냅샷(없으면 제네시스)부터 이후 블록만 재생
+# - 스냅샷 없이 중간 높이부터 시작하는 체인은 재생할 수 없으므로 필요한 주소만 로드하는 상태 반환
+def load_ledger(blocks, indexer=None, archive=None):
+    tip = blocks.find_one({}, header_projection, sort=[("index", -1)])
+    tip_hash = tip["hash"] if tip else "0"
+    if indexer is not None:
+        indexer.run()
+        cursor = indexer.get_cursor()
+        if cursor["hash"] == tip_hash:
+            return LedgerState.load(get_accounts(blocks), height=cursor["height"], tip_hash=tip_hash)
+
+    snapshots = get_snapshots(blocks)
+    header = latest_snapshot(snapshots)
+    state = None
+    if header is not None and _hash_at(blocks, header["height"]) == header["tip_hash"]:
+        state = load_snapshot(snapshots, header)
+    if state is None:
+        first = blocks.find_one({}, {"_id": 0, "index": 1}, sort=[("index", 1)])
+        if first is not None and first["index"] > 1:
+            return LedgerState(complete=False)
+        state = LedgerState()
+
+    with span("ledger_load"):
+        cursor = blocks.find({"index": {"$gt": state.height}}, {"_id": 0}).sort("index").batch_size(body_batch_size)
+        for blk in cursor:
+            if "transactions" not in blk:
+                blk = load_block(blocks, blk["index"], archive)
+            state.apply_block(blk)
+    return state
+
+# 잔고 상태가 내 체인 끝(tip_hash)에 맞춰져 있으면 그대로 사용
+# 아니면 (없음, 다른 프로세스가 블록 저장 등) 필요한 주소만 accounts에서 로드하는 임시 상태
+def _ledger_at(ledger, tip_hash):
+    if ledger is not None and ledger.tip_hash == tip_hash:
+        return ledger
+    return LedgerState(complete=False)
+
+# 분기 처리용 잔고 상태: 내 체인 끝 상태를 복사해 분기점 이후 내 블록을 역순으로 되돌림
+# - 반환: (분기점 상태, 분기점 블록 헤더) / 되돌릴 블록 본문이 없으면 (None, None)
+# - 분기점이 내 체인 시작보다 앞서면 (스냅샷으로 중간 높이부터 시작한 체인) 제네시스부터 재생하도록 빈 상태 반환
+def _rewind_ledger(blocks, ledger, my_last_block, fork_point, archive=None):
+    first = blocks.find_one({}, {"_id": 0, "index": 1}, sort=[("index", 1)])
+    if fork_point == 0 and first is not None and first["index"] > 1:
+        return LedgerState(), None
+    anchor = blocks.find_one({"index": fork_point}, header_projection) if fork_point else None
+
+    state = _ledger_at(ledger, my_last_block["hash"] if my_last_block else "0")
+    state = state.copy() if state is ledger else state
+    accounts = get_accounts(blocks)
+    with span("reorg_rewind"):
+        my_forked = blocks.find({"index": {"$gt": fork_point}}, {"_id": 0}).sort("index", -1).batch_size(body_batch_size)
+        for batch in _iter_batches(my_forked, body_batch_size):
+            batch = [blk if "transactions" in blk else load_block(blocks, blk["index"], archive) for blk in batch]
+            if any(blk is None or "transactions" not in blk for blk in batch):
+                return None, None
+            state.preload(accounts, {address for blk in batch for tx in blk["transactions"] for address in (tx["sender"], tx["recipient"])})
+            for blk in batch:
+                state.revert_block(blk)
+    state.height = fork_point
+    state.tip_hash = anchor["hash"] if anchor else "0"
+    return state, anchor
+
+# 스냅샷 빠른 동기화 (내 체인이 비어 있을 때)
+# - 피어들의 최신 스냅샷 헤더 중 정족수가 일치하는 것을 선택
+# - 잔고 묶음을 받아 다이제스트 확인, 스냅샷 높이의 블록 해시가 스냅샷의 tip_hash와 같은지 확인
+# - 스냅샷 높이의 블록 1개만 기준 블록으로 저장 (이후 블록은 일반 동기화로 검증)
+#   블록 번호가 1부터 연속되어야 하는 저장소(블록 파일)는 기준 블록을 저장할 수 없으므로 전체 동기화
+# 반환: 로드한 LedgerState 또는 None
+def fast_sync_from_snapshot(blocks, peer_tips, peer_manager, display=False):
+    peer_snapshots = []
+    for peer in peer_tips:
+        try:
+            header = latest_snapshot(peer_manager.get_database(peer["uri"])["account_snapshots"])
+        except Exception as e:
+            peer_manager.mark_failed(peer["uri"], e)
+            continue
+        if header is not None and header["height"] <= peer["index"]:
+            peer_snapshots.append((peer, header))
+
+    header, supporters = select_snapshot(peer_snapshots)
+    if header is None:
+        return None
+    if display:
+        st.info(f"📸 스냅샷 빠른 동기화: 블록 #{header['height']} (피어 {len(supporters)}개 일치)")
+
+    for peer in supporters:
+        try:
+            peer_db = peer_manager.get_database(peer["uri"])
+            state = load_snapshot(peer_db["account_snapshots"], header)
+            base = peer_db["blocks"].find_one({"index": header["height"]}, {"_id": 0})
+        except Exception as e:
+            peer_manager.mark_failed(peer["uri"], e)
+            continue
+        if state is None or base is None or base["hash"] != header["tip_hash"] or not verify_block_hash(base):
+            if display:
+                st.warning(f"❌ 스냅샷 검증 실패: {peer['uri']}")
+            continue
+
+        try:
+            blocks.insert_one(base)
+        except ValueError as e:
+            if display:
+                st.info(f"ℹ️ 스냅샷 기준 블록을 저장할 수 없어 전체 동기화로 진행합니다: {e}")
+            return None
+        create_snapshot(get_snapshots(blocks), state)
+        restore_accounts(get_accounts(blocks), state)
+        if display:
+            st.success(f"✅ 스냅샷 로드 완료: 계정 {len(state.balances)}개, 블록 #{state.height}")
+        return state
+    return None
 
 # 합의 알고리즘
 # [사용자 버튼 클릭]
@@ -206,131 +1085,95 @@ def create_block(blocks, tx_pool, block_time_in_min, miner_address=None, display
 #      ↓
 # [내 체인 시간 ≥ 1분 → 블록 생성 및 추가]
 
-def consensus_protocol(blocks, peers, tx_pool, block_time_in_min, miner_address, display=False):
-    if display:
-        st.subheader("🔍 [합의 시작]")
-        st.write("1️⃣ 사용자 요청에 따라 블록 생성 절차를 시작합니다.")
-
-    # 현재 내 체인 정보
-    my_last_block = blocks.find_one(sort=[("index", -1)])
+# 피어 체인 끝 정보(peer_tips)로 더 긴 체인을 이어받거나 분기 체인으로 교체
+# 반환: 내 체인 끝이 바뀌었는지 여부
+def sync_from_peers(blocks, peer_tips, tx_pool, block_time_in_min, display=False, ledger=None, mempool=None, peer_manager=None, pruner=None, seen_index=None):
+    peer_manager = default_peer_manager if peer_manager is None else peer_manager
+    my_last_block = blocks.find_one({}, header_projection, sort=[("index", -1)])
+    if seen_index is not None:
+        seen_index.sync(my_last_block)
     my_last_index = my_last_block["index"] if my_last_block else -1
-    my_last_hash = my_last_block["hash"] if my_last_block else "0"
-    my_len = blocks.count_documents({})
-    
-    if display:
-        st.write(f"📦 현재 내 체인 길이: {my_len}, 마지막 인덱스: {my_last_index}")
-
-    # 각 피어 체인 확인
+    start_hash = my_last_block["hash"] if my_last_block else "0"
     peer_longer = []
     peer_forked = []
-    for peer in peers.find():
+
+    # 빈 노드: 피어 스냅샷으로 잔고를 받고 스냅샷 이후 블록만 동기화
+    if my_last_block is None and peer_tips:
         try:
-            peer_uri = peer["uri"]
-            if display:
-                st.info(f"🌐 피어 연결 시도: {peer_uri}")
-
-            peer_client = MongoClient(peer_uri)
-            peer_db = peer_client["blockchain_db"]
-            peer_blocks = peer_db["blocks"]
-            peer_len = peer_blocks.count_documents({})
-
-            if peer_len > my_len:
-                peer_longer.append({
-                    "public_key": peer["public_key"],
-                    "uri": peer_uri,
-                    "timestamp": peer["timestamp"],
-                    "length": peer_len
-                })
-        except Exception as e:
+            snapshot_state = fast_sync_from_snapshot(blocks, peer_tips, peer_manager, display=display)
+        except (PyMongoError, ValueError) as e:
+            snapshot_state = None    # 빠른 동기화 실패 → 전체 동기화
             if display:
-                st.warning(f"❌ 피어 접근 실패: {e}")
+                st.warning(f"⚠️ 스냅샷 빠른 동기화 실패: {e}")
+        if snapshot_state is not None:
+            if ledger is not None:
+                ledger.adopt(snapshot_state)
+            my_last_index = snapshot_state.height
+
+    for tip in peer_tips:
+        if tip["index"] > my_last_index:
+            peer_longer.append(tip)
                 
-    peer_longer = sorted(peer_longer, key=lambda x: x["length"], reverse=True)    
+    peer_longer = sorted(peer_longer, key=lambda x: x["index"], reverse=True)    
+
+    # 중단된 동기화가 있으면 해당 피어부터 이어서 진행
+    checkpoint = load_sync_checkpoint(blocks)
+    if checkpoint:
+        peer_longer.sort(key=lambda x: x["uri"] != checkpoint["peer_uri"])
+        if display:
+            st.info(f"⏯️ 중단된 동기화 재개: 블록 #{checkpoint['last_index']} / #{checkpoint['target_index']}")
+
+    state = None
     for peer in peer_longer:
         try:
-            peer_len = peer["length"]
+            peer_index = peer["index"]
             peer_uri = peer["uri"]
 
             # 현재 내 체인 정보
-            my_last_block = blocks.find_one(sort=[("index", -1)])
+            my_last_block = blocks.find_one({}, header_projection, sort=[("index", -1)])
             my_last_index = my_last_block["index"] if my_last_block else -1
             my_last_hash = my_last_block["hash"] if my_last_block else "0"
-            my_len = blocks.count_documents({})
 
-            # Peer 정보
-            peer_client = MongoClient(peer_uri)
-            peer_db = peer_client["blockchain_db"]
-            peer_blocks = peer_db["blocks"]            
+            # Peer 정보 (연결 재사용)
+            peer_blocks = peer_manager.get_blocks(peer_uri)
 
-            if peer_len > my_len:  # 2. 더 긴 체인 존재            
+            if peer_index > my_last_index:  # 2. 더 긴 체인 존재            
                 if display:
-                    st.info("📏 피어 체인({peer_len})이 내 체인({my_len})보다 깁니다. 블록 일치 여부 확인 중...")
+                    st.info(f"📏 피어 체인(#{peer_index})이 내 체인(#{my_last_index})보다 깁니다. 블록 일치 여부 확인 중...")
                     
-                valid = True  
-                same_block = peer_blocks.find_one({"index": my_last_index})     
-                if my_len==0 or (same_block and same_block["hash"] == my_last_hash ):  # 3. 블록 일치 확인
+                same_block = peer_blocks.find_one({"index": my_last_index}, {"_id": 0, "hash": 1})     
+                if my_last_block is None or (same_block and same_block["hash"] == my_last_hash ):  # 3. 블록 일치 확인
                     if display:
                         st.success("✅ 마지막 블록이 일치하거나 내 블록이 초기화된 경우 입니다. 새로운 블록만 가져옵니다.")
 
-                    new_blocks = list(peer_blocks.find({"index": {"$gt": my_last_index}}).sort("index"))  # 4   
-
-                    for blk in new_blocks:                        
-                        prev_block = peer_blocks.find_one({"index": blk["index"] - 1})
-                        if prev_block or blk["index"]==1: # Genesis block
-                            prev_time = 0 if blk["index"] == 1 else prev_block["timestamp"]                                                    
-                            if verify_blocktime(timestamp_after = blk["timestamp"], timestamp_before = prev_time, block_time_in_min = block_time_in_min):
-                                system_tx_count = 0  
-                                total_fees = sum(tx.get("fee", 0) for tx in blk["transactions"] if tx["sender"] != "SYSTEM")
-                                for tx in blk["transactions"]:
-                                    if tx["sender"] == "SYSTEM":
-                                        system_tx_count += 1                                        
-                                        expected_reward = get_block_reward(blk["index"]) + total_fees
-                                        if tx["amount"] != expected_reward:
-                                            if display:
-                                                st.warning(f"❌ SYSTEM 보상 금액 불일치 (예상: {expected_reward}, 실제: {tx['amount']})")
-                                            valid = False
-                                            break
-                                    else:
-                                        if not verify_signature(tx):
-                                            if display:
-                                                st.warning("❌ 서명 검증 실패")
-                                            valid = False
-                                            break
-                                        if get_balance(tx["sender"], blocks) < tx["amount"] + tx.get("fee", 0):
-                                            if display:
-                                                st.warning("❌ 잔고 부족")
-                                            valid = False
-                                            break
-                                    # 블록 해시 검증 추가 필요
-
-                            if system_tx_count > 1:
-                                if display:
-                                    st.warning("🚫 SYSTEM 트랜잭션이 1개를 초과합니다.")
-                                valid = False
-                        else:
-                            valid = False
-                            if display:
-                                st.info(f"⏳ 블록 #{blk['index']}은 생성 시간 기준 조건({block_time_in_min}분 경과)을 만족하지 않음")           
+                    # 4. 헤더 검증 → 본문 배치 검증 → 배치 단위로 저장 (내 체인 끝 상태에서 차례로 적용)
+                    state = _ledger_at(ledger, my_last_hash)
+                    state.begin()
+
+                    def commit_batch(bodies):
+                        commit_synced_blocks(blocks, tx_pool, bodies, mempool, seen_index)
+                        state.commit()
+                        state.begin()
+                        save_sync_checkpoint(blocks, peer_uri, "extend", peer_index, bodies[-1]["index"], bodies[-1]["hash"])
+                        if display:
+                            st.success(f"📥 블록 #{bodies[0]['index']}~#{bodies[-1]['index']} 동기화 완료")
+
+                    valid, last_header = stream_peer_blocks(peer_blocks, blocks, my_last_block, state, block_time_in_min, on_batch=commit_batch, display=display, seen_index=seen_index)
+                    state.rollback()    # 저장되지 않은 마지막 배치만 되돌림
+                    state = None
+                    clear_sync_checkpoint(blocks)   # 완료 또는 검증 실패 (연결 오류로 중단된 경우만 체크포인트 유지)
+                    if valid:
+                        break
                 else:
                     if display:
                         st.warning("⚠️ 마지막 블록이 불일치합니다. 분기 체인으로 처리합니다.")
-                    
                     peer_forked.append(peer)
-                    valid = False
-
-                if valid:
-                    for blk in new_blocks:
-                        blocks.insert_one(blk)
-                        for tx in blk["transactions"]:
-                            tx_pool.delete_one({
-                                "sender": tx["sender"],
-                                "timestamp": tx["timestamp"]
-                            })
-                        if display:
-                            st.success(f"📥 블록 #{blk['index']} 동기화 완료")
-                    break
                             
         except Exception as e:
+            if state is not None:
+                state.rollback()
+                state = None
+            peer_manager.mark_failed(peer["uri"], e)
             if display:
                 st.warning(f"❌ 피어 접근 실패: {e}")
 
@@ -339,102 +1182,134 @@ def consensus_protocol(blocks, peers, tx_pool, block_time_in_min, miner_address,
         if display:
             st.subheader("🌿 [분기 체인 처리]")
             
+        archive = pruner.archive if pruner else None
         for peer in peer_forked:
-            peer_len = peer["length"]
             peer_uri = peer["uri"]
 
-            # 현재 내 체인 정보
-            my_last_block = blocks.find_one(sort=[("index", -1)])
-            my_last_index = my_last_block["index"] if my_last_block else -1
-            my_last_hash = my_last_block["hash"] if my_last_block else "0"
-            my_len = blocks.count_documents({})
+            # Peer 정보 (연결 재사용)
+            peer_blocks = peer_manager.get_blocks(peer_uri)
 
-            # Peer 정보
-            peer_client = MongoClient(peer_uri)
-            peer_db = peer_client["blockchain_db"]
-            peer_blocks = peer_db["blocks"]         
-            
-            valid = True
-            for blk in peer_blocks:                
-                prev_block = peer_blocks.find_one({"index": blk["index"] - 1})
-                if prev_block or blk["index"]==1: # Genesis block
-                    prev_time = 0 if blk["index"] == 1 else prev_block["timestamp"]                                                    
-                    if verify_blocktime(timestamp_after = blk["timestamp"], timestamp_before = prev_time, block_time_in_min = block_time_in_min):                            
-                        system_tx_count = 0  
-                        total_fees = sum(tx.get("fee", 0) for tx in blk["transactions"] if tx["sender"] != "SYSTEM")
-                        for tx in blk["transactions"]:
-                            if tx["sender"] == "SYSTEM":
-                                system_tx_count += 1                                
-                                expected_reward = get_block_reward(blk["index"]) + total_fees
-                                if tx["amount"] != expected_reward:
-                                    if display:
-                                        st.warning(f"❌ SYSTEM 보상 금액 불일치 (예상: {expected_reward}, 실제: {tx['amount']})")
-                                    valid = False
-                                    break
-                            else:
-                                if not verify_signature(tx):
-                                    if display:
-                                        st.warning("❌ 서명 검증 실패")
-                                    valid = False
-                                    break
-                                if get_balance(tx["sender"], blocks) < tx["amount"] + tx.get("fee", 0):
-                                    if display:
-                                        st.warning("❌ 잔고 부족")
-                                    valid = False
-                                    break
-
-                    if system_tx_count > 1:
-                        if display:
-                            st.warning("🚫 SYSTEM 트랜잭션이 1개를 초과합니다.")
-                        valid = False
-                else:
-                    valid = False
-                    if display:
-                        st.info(f"⏳ 블록 #{blk['index']}은 생성 시간 기준 조건({block_time_in_min}분 경과)을 만족하지 않음")  
-                        
-            if valid:
-                # 분기점 탐색
-                divergence_index = -1
-                for i in range(min(blocks.count_documents({}), peer_blocks.count_documents({}))):
-                    my_blk = blocks.find_one({"index": i})
-                    peer_blk = peer_blocks.find_one({"index": i})
-                    if not my_blk or not peer_blk:
-                        break
-                    if my_blk["hash"] != peer_blk["hash"]:
-                        divergence_index = i
+            # 분기점 탐색 (로케이터 + 이진 탐색)
+            my_last_block = blocks.find_one({}, header_projection, sort=[("index", -1)])
+            my_last_index = my_last_block["index"] if my_last_block else 0
+            fork_point = find_fork_point(blocks, peer_blocks, my_last_index, peer["index"])
+            divergence_index = fork_point + 1
+            if display:
+                st.info(f"🔀 분기점: 블록 #{fork_point} 이후")
+
+            # 잔고 상태를 분기점으로 되돌린 뒤 분기점 이후 피어 블록만 헤더 → 본문 순으로 검증 (본문은 보관하지 않음)
+            fork_state, anchor = _rewind_ledger(blocks, ledger, my_last_block, fork_point, archive)
+            if fork_state is None:
+                if display:
+                    st.warning("⚠️ 분기점 이후 내 블록 본문을 읽을 수 없어 분기 체인으로 교체할 수 없습니다.")
+                continue
+            valid, peer_tip = stream_peer_blocks(peer_blocks, blocks, anchor, fork_state, block_time_in_min, display=display,
+                                                 seen_index=seen_index)
+            if not valid or divergence_index > peer_tip["index"]:
+                continue
+            save_sync_checkpoint(blocks, peer_uri, "reorg", peer_tip["index"], fork_point, anchor["hash"] if anchor else "0")
+
+            # 내 블록에만 있던 트랜잭션 → tx_pool로 복원 (배치 단위, 피어 블록에 포함된 것은 아래에서 다시 삭제)
+            with span("reorg_rollback"):
+                my_forked = blocks.find({"index": {"$gte": divergence_index}}, {"_id": 0, "index": 1, "transactions": 1}).sort("index").batch_size(body_batch_size)
+                for batch in _iter_batches(my_forked, body_batch_size):
+                    batch = [blk if "transactions" in blk else load_block(blocks, blk["index"], archive) for blk in batch]
+                    restore_pool_txs(tx_pool, [tx for blk in batch for tx in blk.get("transactions", [])])
+
+                # 기존 블록 삭제
+                blocks.delete_many({"index": {"$gte": divergence_index}})
+                if seen_index is not None:
+                    seen_index.truncate(fork_point)
+
+            # peer의 블록을 배치 단위로 삽입 (검증한 체인과 같은지 해시 연결로 확인)
+            prev_hash = anchor["hash"] if anchor else "0"
+            peer_new = peer_blocks.find({"index": {"$gte": divergence_index, "$lte": peer_tip["index"]}}, {"_id": 0}).sort("index").batch_size(body_batch_size)
+            intact = True
+            for batch in _iter_batches(peer_new, body_batch_size):
+                for blk in batch:
+                    if blk["previous_hash"] != prev_hash or not verify_block_hash(blk):
+                        intact = False
                         break
-                        
-                # 내 블록 → 삭제 & peer 블록 → 덮어쓰기
-                if divergence_index >= 0:
-                    # 2-1. 내 체인에서 해당 지점 이후 블록 가져오기 (복원할 트랜잭션 확인용)
-                    my_forked_blocks = list(blocks.find({"index": {"$gte": divergence_index}}).sort("index"))
-
-                    # 2-2. 기존 블록 삭제
-                    blocks.delete_many({"index": {"$gte": divergence_index}})
-
-                    # 2-3. peer의 블록 삽입
-                    peer_new_blocks = list(peer_blocks.find({"index": {"$gte": divergence_index}}).sort("index"))
-                    for blk in peer_new_blocks:
-                        blocks.insert_one(blk)
-                
-                # 내 블록에만 있던 트랜잭션 → tx_pool로 복원
-                # peer의 모든 트랜잭션 해시 집합                
-                peer_tx_hashes = set()
-                for blk in peer_new_blocks:
-                    for tx in blk["transactions"]:
-                        peer_tx_hashes.add(generate_hash(tx))                
-                
-                for blk in my_forked_blocks:
-                    for tx in blk["transactions"]:
-                        tx_hash = generate_hash(tx)
-                        if tx_hash not in peer_tx_hashes:
-                            tx_pool.insert_one(tx)            
-            
-    # 8. 마지막 블록 1분 경과 시 블록 생성
+                    prev_hash = blk["hash"]
+                if not intact:
+                    break
+                commit_synced_blocks(blocks, tx_pool, batch, mempool, seen_index)
+                save_sync_checkpoint(blocks, peer_uri, "reorg", peer_tip["index"], batch[-1]["index"], batch[-1]["hash"])
+
+            if not intact or prev_hash != peer_tip["hash"]:
+                if display:
+                    st.warning("⚠️ 검증 이후 피어 체인이 변경되었습니다. 다음 합의에서 이어서 동기화합니다.")
+                continue
+
+            # 잔고 상태를 피어 체인 검증 결과로 교체 (내 잔고 상태에서 되돌린 경우만)
+            if ledger is not None and fork_state.complete == ledger.complete:
+                ledger.adopt(fork_state)
+            clear_sync_checkpoint(blocks)
+            inc("xper_reorgs_total")
+            if display:
+                st.success(f"📥 분기 체인으로 교체 완료: 블록 #{divergence_index}~#{peer_tip['index']}")
+            break
+
+    my_last_block = blocks.find_one({}, header_projection, sort=[("index", -1)])
+    return (my_last_block["hash"] if my_last_block else "0") != start_hash
+
+def consensus_protocol(blocks, peers, tx_pool, block_time_in_min, miner_address, display=False, ledger=None, mempool=None, peer_manager=None, pruner=None, indexer=None, seen_index=None):
+    peer_manager = default_peer_manager if peer_manager is None else peer_manager
     if display:
-        st.subheader("🏗️ [블록 생성 확인]")
+        st.subheader("🔍 [합의 시작]")
+        st.write("1️⃣ 사용자 요청에 따라 블록 생성 절차를 시작합니다.")
+
+    # 현재 내 체인 정보
+    my_last_block = blocks.find_one(sort=[("index", -1)])
+    my_last_index = my_last_block["index"] if my_last_block else -1
+    my_len = blocks.count_documents({})
+    
+    if display:
+        st.write(f"📦 현재 내 체인 길이: {my_len}, 마지막 인덱스: {my_last_index}")
+
+    # 각 피어 체인 끝 확인 (동시 조회, 제한 시간 적용)
+    peer_list = list(peers.find())
+    if display:
+        st.info(f"🌐 피어 {len(peer_list)}개 동시 조회 중...")
+
+    with span("peer_poll"):
+        peer_tips, peer_failures = poll_peer_tips(peer_list, peer_manager)
+    inc("xper_peer_poll_failures_total", len(peer_failures))
+    for peer, e in peer_failures:
+        if display:
+            st.warning(f"❌ 피어 접근 실패: {peer.get('uri')} ({e})")
+    # 동기화와 블록 생성은 같은 프로세스의 다른 작업(블록 전파 수신, 채굴 데몬)과 겹치지 않도록 잠금
+    with chain_lock:
+        sync_from_peers(blocks, peer_tips, tx_pool, block_time_in_min, display=display, ledger=ledger,
+                        mempool=mempool, peer_manager=peer_manager, pruner=pruner, seen_index=seen_index)
+
+        # 동기화로 받은 블록을 먼저 색인 (잔고 상태가 없으면 블록 생성이 accounts 잔고를 사용하므로)
+        if indexer is not None:
+            with span("index"):
+                indexed = indexer.run()
+            if display and indexed:
+                st.info(f"🗂️ 동기화된 블록 {indexed}개를 색인했습니다.")
+
+        maybe_snapshot(blocks, ledger, indexer)
+
+        # 8. 마지막 블록 1분 경과 시 블록 생성
+        if display:
+            st.subheader("🏗️ [블록 생성 확인]")
         
-    create_block(blocks, tx_pool, block_time_in_min, miner_address = miner_address)
+        create_block(blocks, tx_pool, block_time_in_min, miner_address = miner_address, ledger = ledger, mempool = mempool, seen_index = seen_index)
+
+        # transactions / accounts 색인 갱신 (색인기 사용 시, 가지치기 전에 실행)
+        if indexer is not None:
+            with span("index"):
+                indexed = indexer.run()
+            if display and indexed:
+                st.info(f"🗂️ 블록 {indexed}개를 색인했습니다.")
+
+        # 오래된 블록 본문 보관 (가지치기 사용 시)
+        if pruner is not None:
+            pruned = pruner.prune()
+            if display and pruned:
+                st.info(f"🗄️ 오래된 블록 {pruned}개의 본문을 보관소로 이동했습니다.")
 
     if display:
         st.success("🎉 합의 프로토콜 완료")
\ No newline at end of file
@@ -0,0 +1,475 @@
+import math, mmap, os, struct, threading
+
+from pymongo.errors import DuplicateKeyError
+from pymongo.results import DeleteResult, InsertManyResult, InsertOneResult
+
+from encoding import encode_block, decode_block, decode_block_hash
+from storage import match, project, _sort_key, _normalize_sort
+
+# 추가 전용(append-only) 블록 파일 저장소
+# - 블록은 정규 바이너리 인코딩(encode_block)으로 세그먼트 파일(blk00000.dat ...)에 이어쓰기
+#   레코드 = [매직 4바이트][길이 4바이트][블록 바이트]
+# - 높이 인덱스(index.dat): 블록 번호 h의 위치가 (h-1)*16 바이트에 고정 폭으로 기록 → (파일 번호, 오프셋, 길이)
+#   인덱스와 세그먼트는 mmap으로 읽어 O(1) 임의 접근 (블록 바이트는 잠금 안에서 복사 후 디코딩)
+# - 재구성(reorg)으로 끝부분이 잘리면 인덱스와 세그먼트 파일을 해당 위치까지 잘라냄 (truncate)
+# - 읽기 전용(readonly=True): 다른 프로세스(채굴 노드)가 기록 중인 저장소를 조회할 때 사용
+#   복구(잘라내기)를 하지 않고, 조회할 때마다 인덱스 파일 크기를 다시 읽어 새 블록을 반영
+#   기록 측이 파일을 잘라낼 수 있으므로 mmap 대신 pread로 읽음 (잘린 영역 접근 시 SIGBUS 방지)
+# - 해시 인덱스(메모리): 해시로 처음 조회할 때 블록 앞부분만 디코딩해 해시 → 높이 구성, 이후 기록·잘라내기 시 갱신
+#   ({"hash": ...} 조회가 블록 전체를 디코딩하지 않도록)
+
+segment_max_bytes = 128 * 1024 * 1024   # 세그먼트 파일 최대 크기
+block_magic = b"XPR1"
+
+_record_header = struct.Struct(">4sI")   # 매직, 길이
+_index_entry = struct.Struct(">IQI")     # 파일 번호, 오프셋(레코드 시작), 길이(블록 바이트)
+
+_BLOCK_FIELDS = {"_id", "version", "index", "timestamp", "previous_hash", "hash", "merkle_root", "transactions"}
+_TX_FIELDS = {"version", "sender", "recipient", "amount", "fee", "timestamp", "signature", "tx_hash"}
+
+class BlockFileStore:
+    def __init__(self, path, segment_size=None, readonly=False):
+        self.path = path
+        self.segment_size = segment_max_bytes if segment_size is None else segment_size
+        self.readonly = readonly
+        self._lock = threading.RLock()
+        self._segments = {}        # 파일 번호 -> (mmap, 크기)
+        self._index_map = None
+        self._count = 0
+        self._hashes = None        # 해시 -> 높이 (처음 해시 조회 시 구성)
+        self._hash_list = []       # 높이 순서의 해시 (잘라내기·재구성 반영용)
+        if readonly:
+            self._index_file = open(os.path.join(path, "index.dat"), "rb")
+            return
+        os.makedirs(path, exist_ok=True)
+        self._index_file = open(os.path.join(path, "index.dat"), "a+b")
+        self._recover()
+
+    def _segment_path(self, file_no):
+        return os.path.join(self.path, f"blk{file_no:05d}.dat")
+
+    # ---------- 시작 시 복구 ----------
+    # 세그먼트 끝을 넘는 인덱스 항목은 버리고, 마지막 인덱스 뒤에 남은 세그먼트 바이트는 잘라냄
+    def _recover(self):
+        size = os.path.getsize(self._index_file.name)
+        count = size // _index_entry.size
+        self._remap_index(count)
+        while count > 0:
+            file_no, offset, length = self._entry(count)
+            segment = self._segment_path(file_no)
+            if os.path.exists(segment) and offset + _record_header.size + length <= os.path.getsize(segment):
+                break
+            count -= 1
+        self._count = count
+        if count:
+            file_no, offset, length = self._entry(count)
+            self._truncate_segments(file_no, offset + _record_header.size + length)
+        else:
+            self._truncate_segments(0, 0)
+        self._truncate_index(count)
+
+    # ---------- 인덱스 ----------
+
+    def _remap_index(self, count):
+        if self._index_map is not None:
+            self._index_map.close()
+            self._index_map = None
+        self._index_file.flush()
+        if count:
+            self._index_map = mmap.mmap(self._index_file.fileno(), count * _index_entry.size, access=mmap.ACCESS_READ)
+
+    def _entry(self, height):
+        if self.readonly:
+            data = os.pread(self._index_file.fileno(), _index_entry.size, (height - 1) * _index_entry.size)
+            return _index_entry.unpack(data) if len(data) == _index_entry.size else None
+        return _index_entry.unpack_from(self._index_map, (height - 1) * _index_entry.size)
+
+    # 읽기 전용: 기록 측이 추가하거나 잘라낸 인덱스 크기 반영
+    def _refresh_count(self):
+        if self.readonly:
+            self._count = os.fstat(self._index_file.fileno()).st_size // _index_entry.size
+        return self._count
+
+    def _truncate_index(self, count):
+        if self._index_map is not None:
+            self._index_map.close()
+            self._index_map = None
+        self._index_file.truncate(count * _index_entry.size)
+        self._index_file.flush()
+        os.fsync(self._index_file.fileno())
+        self._count = count
+        self._remap_index(count)
+
+    # ---------- 세그먼트 ----------
+
+    def _segment_view(self, file_no, end):
+        cached = self._segments.get(file_no)
+        if cached is None or cached[1] < end:
+            if cached is not None:
+                cached[0].close()
+            with open(self._segment_path(file_no), "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                cached = (mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ), size)
+            self._segments[file_no] = cached
+        return cached[0]
+
+    def _close_segment(self, file_no):
+        cached = self._segments.pop(file_no, None)
+        if cached is not None:
+            cached[0].close()
+
+    # file_no 세그먼트를 size 바이트로 자르고 그 뒤 세그먼트 삭제
+    def _truncate_segments(self, file_no, size):
+        next_no = file_no
+        while True:
+            path = self._segment_path(next_no)
+            if not os.path.exists(path):
+                if next_no > file_no:
+                    break
+                next_no += 1
+                continue
+            self._close_segment(next_no)
+            if next_no == file_no:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+            else:
+                os.remove(path)
+            next_no += 1
+
+    def _tail_position(self):
+        if not self._count:
+            return 0, 0
+        file_no, offset, length = self._entry(self._count)
+        return file_no, offset + _record_header.size + length
+
+    # ---------- 조회 ----------
+
+    def __len__(self):
+        with self._lock:
+            return self._refresh_count()
+
+    @property
+    def tip_index(self):
+        return len(self)
+
+    def locate(self, height):
+        with self._lock:
+            if not 1 <= height <= self._refresh_count():
+                return None
+            return self._entry(height)
+
+    # 블록 원시 바이트 (잠금 안에서 복사 — 다른 스레드의 기록으로 세그먼트 mmap을 다시 매핑해도 안전)
+    def read_raw(self, height):
+        with self._lock:
+            location = self.locate(height)
+            if location is None:
+                return None
+            file_no, offset, length = location
+            start = offset + _record_header.size
+            if self.readonly:
+                try:
+                    with open(self._segment_path(file_no), "rb") as f:
+                        data = os.pread(f.fileno(), length, start)
+                except FileNotFoundError:
+                    return None    # 기록 측이 재구성으로 세그먼트를 지움
+                return data if len(data) == length else None
+            view = self._segment_view(file_no, start + length)
+            return view[start:start + length]
+
+    # ---------- 해시 인덱스 ----------
+
+    def _read_hash(self, height):
+        raw = self.read_raw(height)
+        return decode_block_hash(raw) if raw is not None else None
+
+    def _sync_hashes(self):
+        if self._hashes is None:
+            self._hashes, self._hash_list = {}, []
+        count = self._refresh_count()
+        if self.readonly:
+            # 기록 측이 재구성으로 끝부분을 잘라내거나 바꿨으면 해시가 같은 높이까지 되돌림
+            while self._hash_list and (len(self._hash_list) > count or self._read_hash(len(self._hash_list)) != self._hash_list[-1]):
+                self._hashes.pop(self._hash_list.pop(), None)
+        for height in range(len(self._hash_list) + 1, count + 1):
+            block_hash = self._read_hash(height)
+            if block_hash is None:
+                break
+            self._hash_list.append(block_hash)
+            self._hashes[block_hash] = height
+
+    # 해시 목록에 해당하는 블록 높이 (오름차순)
+    def find_hashes(self, hashes):
+        with self._lock:
+            self._sync_hashes()
+            return sorted({self._hashes[h] for h in hashes if isinstance(h, str) and h in self._hashes})
+
+    def get(self, height):
+        raw = self.read_raw(height)
+        if raw is None:
+            return None
+        blk = decode_block(raw)
+        blk["_id"] = blk["index"]
+        return blk
+
+    # ---------- 기록 ----------
+
+    # 블록 이어쓰기 (번호는 현재 끝 + 1 이어야 함)
+    def append_many(self, block_list):
+        if self.readonly:
+            raise PermissionError("읽기 전용 블록 파일 저장소에는 기록할 수 없습니다.")
+        with self._lock:
+            if not block_list:
+                return []
+            for i, blk in enumerate(block_list):
+                if blk["index"] <= self._count + i:
+                    raise DuplicateKeyError(f"E11000 duplicate key error: block index {blk['index']}", 11000)
+                if blk["index"] != self._count + i + 1:
+                    raise ValueError(f"블록 번호가 연속되지 않습니다: #{blk['index']} (다음 번호 #{self._count + i + 1})")
+                _check_fields(blk)
+
+            file_no, position = self._tail_position()
+            entries = []
+            segment = open(self._segment_path(file_no), "ab")
+            try:
+                for blk in block_list:
+                    data = encode_block({k: v for k, v in blk.items() if k != "_id"})
+                    record = _record_header.pack(block_magic, len(data)) + data
+                    if position and position + len(record) > self.segment_size:
+                        segment.flush()
+                        os.fsync(segment.fileno())
+                        segment.close()
+                        file_no, position = file_no + 1, 0
+                        segment = open(self._segment_path(file_no), "ab")
+                    segment.write(record)
+                    entries.append(_index_entry.pack(file_no, position, len(data)))
+                    position += len(record)
+                segment.flush()
+                os.fsync(segment.fileno())
+            finally:
+                segment.close()
+
+            # 세그먼트 기록이 끝난 뒤 인덱스 기록 (중단 시 인덱스 없는 세그먼트 꼬리는 복구 시 잘림)
+            self._index_file.seek(0, os.SEEK_END)
+            self._index_file.write(b"".join(entries))
+            self._index_file.flush()
+            os.fsync(self._index_file.fileno())
+            self._count += len(block_list)
+            self._remap_index(self._count)
+            for blk in block_list:
+                blk["_id"] = blk["index"]
+                if self._hashes is not None and len(self._hash_list) == blk["index"] - 1:
+                    self._hash_list.append(blk["hash"])
+                    self._hashes[blk["hash"]] = blk["index"]
+            return [blk["index"] for blk in block_list]
+
+    # height 이후 블록 제거 (재구성 시 끝부분 잘라내기)
+    def truncate(self, height):
+        if self.readonly:
+            raise PermissionError("읽기 전용 블록 파일 저장소에는 기록할 수 없습니다.")
+        with self._lock:
+            keep = max(0, min(self._count, height))
+            removed = self._count - keep
+            if not removed:
+                return 0
+            if keep:
+                file_no, end = _entry_end(self._entry(keep))
+            else:
+                file_no, end = 0, 0
+            self._truncate_index(keep)
+            self._truncate_segments(file_no, end)
+            while len(self._hash_list) > keep:
+                self._hashes.pop(self._hash_list.pop(), None)
+            return removed
+
+    def close(self):
+        with self._lock:
+            for file_no in list(self._segments):
+                self._close_segment(file_no)
+            if self._index_map is not None:
+                self._index_map.close()
+                self._index_map = None
+            self._index_file.close()
+
+def _entry_end(entry):
+    file_no, offset, length = entry
+    return file_no, offset + _record_header.size + length
+
+def _check_fields(blk):
+    extra = set(blk) - _BLOCK_FIELDS
+    for tx in blk.get("transactions", []):
+        extra |= set(tx) - _TX_FIELDS
+    if extra:
+        raise ValueError(f"블록 파일에 저장할 수 없는 필드: {sorted(extra)}")
+
+# ---------- blocks 컬렉션 호환 인터페이스 ----------
+
+_ALL = object()
+
+# index 조건에서 조회할 블록 번호 범위 계산 (없으면 전체)
+def _index_range(query, count):
+    condition = query.get("index", _ALL)
+    if condition is _ALL:
+        return range(1, count + 1)
+    if not isinstance(condition, dict):
+        return [condition] if isinstance(condition, int) and 1 <= condition <= count else []
+    if "$in" in condition:
+        return sorted(h for h in set(condition["$in"]) if isinstance(h, int) and 1 <= h <= count)
+    low, high = 1, count
+    if "$gte" in condition:
+        low = max(low, math.ceil(condition["$gte"]))
+    if "$gt" in condition:
+        low = max(low, math.floor(condition["$gt"]) + 1)
+    if "$lte" in condition:
+        high = min(high, math.floor(condition["$lte"]))
+    if "$lt" in condition:
+        high = min(high, math.ceil(condition["$lt"]) - 1)
+    return range(low, high + 1)
+
+# hash 조건의 해시 목록 (일치 또는 $in만, 그 외 조건은 None → 번호 범위 전체)
+def _hash_values(query):
+    condition = query.get("hash", _ALL)
+    if condition is _ALL or "index" in query:
+        return None
+    if isinstance(condition, str):
+        return [condition]
+    if isinstance(condition, dict) and set(condition) == {"$in"}:
+        return list(condition["$in"])
+    return None
+
+class BlockFileCursor:
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._iter = None
+
+    def sort(self, key, direction=1):
+        self._sort = _normalize_sort(key, direction)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def _generate(self):
+        store = self._collection.store
+        hashes = _hash_values(self._query)
+        heights = _index_range(self._query, len(store)) if hashes is None else store.find_hashes(hashes)
+        by_index = not self._sort or [path for path, _ in self._sort] == ["index"]
+        descending = bool(self._sort) and self._sort[0][1] == -1
+
+        if by_index:
+            # 번호 순서대로 필요한 만큼만 디코딩
+            heights = reversed(heights) if descending else heights
+            skipped = produced = 0
+            for height in heights:
+                blk = store.get(height)
+                if blk is None or not match(blk, self._query):
+                    continue
+                if skipped < self._skip:
+                    skipped += 1
+                    continue
+                yield project(blk, self._projection)
+                produced += 1
+                if self._limit and produced >= self._limit:
+                    return
+            return
+
+        docs = [blk for blk in map(store.get, heights) if blk is not None and match(blk, self._query)]
+        for path, direction in reversed(self._sort):
+            docs.sort(key=lambda d: _sort_key(d.get(path)), reverse=direction == -1)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        for blk in docs:
+            yield project(blk, self._projection)
+
+    def __iter__(self):
+        if self._iter is None:
+            self._iter = self._generate()
+        return self._iter
+
+    def __next__(self):
+        return next(iter(self))
+
+    def close(self):
+        self._iter = iter(())
+
+# 블록 파일 저장소를 blocks 컬렉션처럼 사용
+# - database: 나머지 컬렉션(accounts, sync_state 등)이 있는 저장소 DB (consensus에서 blocks.database[...]로 사용)
+# - 번호(index) 조건의 조회/정렬, 끝부분 삭제(delete_many {"index": {"$gte": n}})는 파일에서 직접 처리
+# - readonly=True: 기록 노드와 별도 프로세스에서 조회만 할 때 (RPC 서버, 탐색기)
+# - 기록한 블록은 바꿀 수 없으므로 문서 갱신(update/bulk_write)과 본문 가지치기(BlockPruner)는 지원하지 않음
+class BlockFileCollection:
+    supports_pruning = False
+
+    def __init__(self, store, database, name="blocks", readonly=False):
+        self.store = store if isinstance(store, BlockFileStore) else BlockFileStore(store, readonly=readonly)
+        self.database = database
+        self.name = name
+
+    def find(self, filter=None, projection=None, **kwargs):
+        cursor = BlockFileCursor(self, filter, projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    def find_one(self, filter=None, projection=None, sort=None, **kwargs):
+        cursor = self.find(filter, projection)
+        if sort:
+            cursor.sort(sort)
+        for blk in cursor.limit(1):
+            return blk
+        return None
+
+    def count_documents(self, filter=None, **kwargs):
+        if not filter:
+            return len(self.store)
+        return sum(1 for _ in self.find(filter, {"_id": 1}))
+
+    def estimated_document_count(self, **kwargs):
+        return len(self.store)
+
+    def insert_one(self, document, **kwargs):
+        self.store.append_many([document])
+        return InsertOneResult(document["_id"], True)
+
+    def insert_many(self, documents, ordered=True, **kwargs):
+        documents = list(documents)
+        return InsertManyResult(self.store.append_many(documents), True)
+
+    # 끝부분 삭제만 지원 (블록 파일은 중간 블록을 지울 수 없음)
+    def delete_many(self, filter, **kwargs):
+        condition = (filter or {}).get("index")
+        if set(filter or {}) != {"index"} or not isinstance(condition, dict) or set(condition) - {"$gte", "$gt"}:
+            raise NotImplementedError("블록 파일은 끝부분 삭제(index $gte/$gt)만 지원합니다.")
+        start = condition["$gte"] if "$gte" in condition else condition["$gt"] + 1
+        removed = self.store.truncate(math.ceil(start) - 1)
+        return DeleteResult({"n": removed, "ok": 1.0}, True)
+
+    def delete_one(self, filter, **kwargs):
+        if filter.get("index") == len(self.store) and set(filter) == {"index"}:
+            return DeleteResult({"n": self.store.truncate(len(self.store) - 1), "ok": 1.0}, True)
+        raise NotImplementedError("블록 파일은 마지막 블록만 삭제할 수 있습니다.")
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        raise NotImplementedError("블록 파일에 기록한 블록은 수정할 수 없습니다.")
+
+    # 번호 인덱스는 파일 구조 자체이므로 별도 인덱스 불필요
+    def create_index(self, keys, **kwargs):
+        return "_".join(f"{path}_{direction}" for path, direction in _normalize_sort(keys))
+
+    def close(self):
+        self.store.close()
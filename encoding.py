@@ -0,0 +1,329 @@
+import hashlib, json, struct, base64
+
+# 정규(canonical) 바이너리 인코딩
+# - 필드 순서 고정, 공개키/서명/해시는 원시 바이트로 저장
+# - "version" 필드가 없는 트랜잭션/블록은 기존 JSON 방식으로 서명·해시 (하위 호환)
+
+TX_VERSION = 2       # 바이너리 인코딩으로 서명·해시하는 트랜잭션 버전
+BLOCK_VERSION = 3    # 머클 루트를 헤더에 담는 블록 버전
+BINARY_BLOCK_VERSION = 2    # 바이너리 헤더로 해시하는 최소 블록 버전 (2: 트랜잭션 해시 연접, 3: 머클 루트)
+MERKLE_BLOCK_VERSION = 3
+
+# 트랜잭션 플래그
+_TX_HAS_VERSION = 0x01
+_TX_HAS_FEE = 0x02
+_TX_HAS_SIGNATURE = 0x04
+_TX_HAS_HASH = 0x08          # 딕셔너리에 tx_hash 필드 존재
+_TX_EXPLICIT_HASH = 0x10     # tx_hash가 계산값과 달라 직접 저장 (기존 JSON 해시 코인베이스)
+
+# 블록 플래그
+_BLOCK_HAS_VERSION = 0x01
+
+_DERIVED_TX_FIELDS = ("signature", "tx_hash", "_id")
+
+# ---------- 필드 인코딩 ----------
+
+def _pack_bytes(data):
+    if len(data) > 0xFFFF:
+        raise ValueError(f"필드가 너무 깁니다: {len(data)}바이트")
+    return struct.pack(">H", len(data)) + data
+
+def _unpack_bytes(buf, pos):
+    (length,) = struct.unpack_from(">H", buf, pos)
+    pos += 2
+    return bytes(buf[pos:pos + length]), pos + length
+
+# 정규 hex 문자열 (소문자, 정확히 nbytes 바이트)
+# 대문자가 섞인 hex를 원시 바이트로 바꾸면 다른 문자열이 같은 서명·해시를 갖게 되므로 UTF-8로 그대로 인코딩
+_HEX_DIGITS = frozenset("0123456789abcdef")
+
+def is_canonical_hex(value, nbytes):
+    return isinstance(value, str) and len(value) == nbytes * 2 and _HEX_DIGITS.issuperset(value)
+
+# 대소문자만 다른 hex (정규형이 아닌 공개키/해시 표기)
+def is_noncanonical_hex(value, nbytes):
+    return (isinstance(value, str) and len(value) == nbytes * 2
+            and _HEX_DIGITS.issuperset(value.lower()) and not _HEX_DIGITS.issuperset(value))
+
+def _pack_address(value):
+    # 64바이트 공개키(소문자 hex 128자) → 원시 바이트, 그 외("SYSTEM", 임의 문자열) → UTF-8
+    if is_canonical_hex(value, 64):
+        return b"\x01" + bytes.fromhex(value)
+    return b"\x00" + _pack_bytes(str(value).encode())
+
+def _unpack_address(buf, pos):
+    tag = buf[pos]
+    pos += 1
+    if tag == 1:
+        return bytes(buf[pos:pos + 64]).hex(), pos + 64
+    data, pos = _unpack_bytes(buf, pos)
+    return data.decode(), pos
+
+def _pack_hash(value):
+    # 32바이트 해시(소문자 hex 64자) → 원시 바이트, 그 외("0" 등) → UTF-8
+    if is_canonical_hex(value, 32):
+        return b"\x01" + bytes.fromhex(value)
+    return b"\x00" + _pack_bytes(str(value).encode())
+
+def _unpack_hash(buf, pos):
+    tag = buf[pos]
+    pos += 1
+    if tag == 1:
+        return bytes(buf[pos:pos + 32]).hex(), pos + 32
+    data, pos = _unpack_bytes(buf, pos)
+    return data.decode(), pos
+
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+def _pack_number(value):
+    # 정수/실수 구분 유지 (기존 JSON 해시 재현에 필요)
+    # 범위를 벗어나거나 숫자가 아니면 ValueError (서명 검증 등에서 잘못된 입력으로 처리)
+    if isinstance(value, int) and not isinstance(value, bool):
+        if not _INT64_MIN <= value <= _INT64_MAX:
+            raise ValueError(f"정수 범위 초과: {value}")
+        return b"i" + struct.pack(">q", value)
+    if not isinstance(value, (int, float)):
+        raise ValueError(f"숫자가 아닙니다: {value!r}")
+    return b"f" + struct.pack(">d", float(value))
+
+def _unpack_number(buf, pos):
+    tag = buf[pos:pos + 1]
+    if tag == b"i":
+        return struct.unpack_from(">q", buf, pos + 1)[0], pos + 9
+    if tag == b"f":
+        return struct.unpack_from(">d", buf, pos + 1)[0], pos + 9
+    raise ValueError(f"알 수 없는 숫자 태그: {bytes(tag)!r}")
+
+def _pack_signature(value):
+    # base64 서명 → 원시 바이트 (재인코딩 결과가 같을 때만), 그 외 → UTF-8
+    try:
+        raw = base64.b64decode(value, validate=True)
+        if base64.b64encode(raw).decode() == value:
+            return b"\x01" + _pack_bytes(raw)
+    except (ValueError, TypeError):
+        pass
+    return b"\x00" + _pack_bytes(str(value).encode())
+
+def _unpack_signature(buf, pos):
+    tag = buf[pos]
+    data, pos = _unpack_bytes(buf, pos + 1)
+    if tag == 1:
+        return base64.b64encode(data).decode(), pos
+    return data.decode(), pos
+
+# ---------- 트랜잭션 ----------
+
+# 트랜잭션 바이너리 인코딩 (include_signature=False → 서명 대상 바이트)
+def encode_tx(tx, include_signature=True):
+    flags = 0
+    if "version" in tx:
+        flags |= _TX_HAS_VERSION
+    if "fee" in tx:
+        flags |= _TX_HAS_FEE
+    if include_signature and tx.get("signature") is not None:
+        flags |= _TX_HAS_SIGNATURE
+
+    parts = [
+        bytes([tx.get("version", 1), flags]),
+        _pack_address(tx["sender"]),
+        _pack_address(tx["recipient"]),
+        _pack_number(tx["amount"]),
+    ]
+    if flags & _TX_HAS_FEE:
+        parts.append(_pack_number(tx["fee"]))
+    parts.append(_pack_number(tx["timestamp"]))
+    if flags & _TX_HAS_SIGNATURE:
+        parts.append(_pack_signature(tx["signature"]))
+    return b"".join(parts)
+
+# 저장용 인코딩 (tx_hash 필드 존재 여부까지 보존)
+def _encode_stored_tx(tx):
+    data = bytearray(encode_tx(tx))
+    if "tx_hash" in tx:
+        data[1] |= _TX_HAS_HASH
+        if tx["tx_hash"] != hashlib.sha256(encode_tx(tx)).hexdigest():
+            data[1] |= _TX_EXPLICIT_HASH
+            data += _pack_hash(tx["tx_hash"])
+    return bytes(data)
+
+def decode_tx(buf, pos=0):
+    version, flags = buf[pos], buf[pos + 1]
+    pos += 2
+    tx = {}
+    if flags & _TX_HAS_VERSION:
+        tx["version"] = version
+    tx["sender"], pos = _unpack_address(buf, pos)
+    tx["recipient"], pos = _unpack_address(buf, pos)
+    tx["amount"], pos = _unpack_number(buf, pos)
+    if flags & _TX_HAS_FEE:
+        tx["fee"], pos = _unpack_number(buf, pos)
+    tx["timestamp"], pos = _unpack_number(buf, pos)
+    if flags & _TX_HAS_SIGNATURE:
+        tx["signature"], pos = _unpack_signature(buf, pos)
+    if flags & _TX_EXPLICIT_HASH:
+        tx["tx_hash"], pos = _unpack_hash(buf, pos)
+    elif flags & _TX_HAS_HASH:
+        tx["tx_hash"] = compute_tx_hash(tx)
+    return tx, pos
+
+# 서명 대상 다이제스트 (sha256)
+def signing_digest(tx):
+    if tx.get("version", 1) >= TX_VERSION:
+        return hashlib.sha256(encode_tx(tx, include_signature=False)).digest()
+    # 기존 방식: 서명·파생 필드를 제외한 JSON
+    tx_copy = {k: v for k, v in tx.items() if k not in _DERIVED_TX_FIELDS}
+    return hashlib.sha256(json.dumps(tx_copy, sort_keys=True).encode()).digest()
+
+# 트랜잭션 해시 계산
+def compute_tx_hash(tx):
+    if tx.get("version", 1) < TX_VERSION and tx.get("sender") == "SYSTEM" and "tx_hash" in tx:
+        # 기존 코인베이스: tx_hash 추가 전의 JSON 해시
+        tx_copy = {k: v for k, v in tx.items() if k not in ("tx_hash", "_id")}
+        return hashlib.sha256(json.dumps(tx_copy, sort_keys=True).encode()).hexdigest()
+    return hashlib.sha256(encode_tx(tx)).hexdigest()
+
+# 트랜잭션 해시 (한 번 계산 후 tx에 저장)
+def get_tx_hash(tx):
+    tx_hash = tx.get("tx_hash")
+    if tx_hash is None:
+        tx_hash = compute_tx_hash(tx)
+        tx["tx_hash"] = tx_hash
+    return tx_hash
+
+# ---------- 머클 트리 ----------
+# 리프/노드 해시에 접두 바이트를 붙여 구분 (리프를 내부 노드로 위장하는 2차 원상 공격 방지)
+# 짝이 없는 마지막 노드는 복제하지 않고 그대로 다음 단계로 올림
+
+def _tx_hash_bytes(tx):
+    tx_hash = get_tx_hash(tx)
+    try:
+        return bytes.fromhex(tx_hash)
+    except ValueError:
+        return hashlib.sha256(tx_hash.encode()).digest()
+
+def _merkle_leaf(tx_hash_bytes):
+    return hashlib.sha256(b"\x00" + tx_hash_bytes).digest()
+
+def _merkle_node(left, right):
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def _merkle_levels(leaves):
+    levels = [leaves]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_merkle_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+# 머클 루트 (트랜잭션 없으면 빈 문자열의 sha256)
+def compute_merkle_root(txs):
+    leaves = [_merkle_leaf(_tx_hash_bytes(tx)) for tx in txs]
+    if not leaves:
+        return hashlib.sha256(b"").hexdigest()
+    return _merkle_levels(leaves)[-1][0].hex()
+
+# position 번째 트랜잭션의 포함 증명 (리프에서 루트 방향으로 형제 노드 목록)
+def merkle_proof(txs, position):
+    leaves = [_merkle_leaf(_tx_hash_bytes(tx)) for tx in txs]
+    if not 0 <= position < len(leaves):
+        raise IndexError(f"트랜잭션 위치 범위 초과: {position}")
+    proof = []
+    for level in _merkle_levels(leaves)[:-1]:
+        sibling = position ^ 1
+        if sibling < len(level):
+            proof.append({"hash": level[sibling].hex(), "side": "left" if sibling < position else "right"})
+        position //= 2
+    return proof
+
+# 포함 증명 검증 (tx_hash에서 시작해 루트를 다시 계산)
+def verify_merkle_proof(tx_hash, proof, merkle_root):
+    try:
+        node = _merkle_leaf(bytes.fromhex(tx_hash))
+    except ValueError:
+        node = _merkle_leaf(hashlib.sha256(tx_hash.encode()).digest())
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        node = _merkle_node(sibling, node) if step["side"] == "left" else _merkle_node(node, sibling)
+    return node.hex() == merkle_root
+
+# ---------- 블록 ----------
+
+# 블록 헤더 바이너리 인코딩 (해시 대상)
+# - 버전 3: 머클 루트 포함, 트랜잭션 없이 헤더만으로 해시 가능 (고정 크기)
+# - 버전 2: 트랜잭션 수 + 트랜잭션 해시 연접의 sha256
+def encode_block_header(block):
+    version = block.get("version", 1)
+    parts = [
+        bytes([version]),
+        struct.pack(">Q", block["index"]),
+        _pack_number(block["timestamp"]),
+        _pack_hash(block["previous_hash"]),
+    ]
+    if version >= MERKLE_BLOCK_VERSION:
+        parts.append(bytes.fromhex(block["merkle_root"]))
+    else:
+        txs = block.get("transactions", [])
+        parts.append(struct.pack(">I", len(txs)))
+        parts.append(hashlib.sha256(b"".join(_tx_hash_bytes(tx) for tx in txs)).digest())
+    return b"".join(parts)
+
+# 블록 해시 계산 (버전 없는 블록은 기존 JSON 해시)
+def hash_block(block):
+    if block.get("version", 1) >= BINARY_BLOCK_VERSION:
+        return hashlib.sha256(encode_block_header(block)).hexdigest()
+    block_copy = {k: v for k, v in block.items() if k not in ("hash", "_id")}
+    return hashlib.sha256(json.dumps(block_copy, sort_keys=True).encode()).hexdigest()
+
+# 블록 전체 바이너리 인코딩 (저장/전송용)
+def encode_block(block):
+    flags = _BLOCK_HAS_VERSION if "version" in block else 0
+    txs = block.get("transactions", [])
+    parts = [
+        bytes([block.get("version", 1), flags]),
+        struct.pack(">Q", block["index"]),
+        _pack_number(block["timestamp"]),
+        _pack_hash(block["previous_hash"]),
+        _pack_hash(block.get("hash", "")),
+        struct.pack(">I", len(txs)),
+    ]
+    for tx in txs:
+        data = _encode_stored_tx(tx)
+        parts.append(struct.pack(">I", len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+# 블록 앞부분(번호, 시각, 이전 해시, 해시)만 디코딩 → (블록, 트랜잭션 개수 위치)
+def _decode_block_prefix(buf, pos=0):
+    pos += 2
+    block = {}
+    (block["index"],) = struct.unpack_from(">Q", buf, pos)
+    pos += 8
+    block["timestamp"], pos = _unpack_number(buf, pos)
+    block["previous_hash"], pos = _unpack_hash(buf, pos)
+    block["hash"], pos = _unpack_hash(buf, pos)
+    return block, pos
+
+# 블록 해시만 디코딩 (트랜잭션 디코딩 없이, 블록 파일의 해시 인덱스 구성용)
+def decode_block_hash(buf, pos=0):
+    return _decode_block_prefix(buf, pos)[0]["hash"]
+
+def decode_block(buf, pos=0):
+    version, flags = buf[pos], buf[pos + 1]
+    block, pos = _decode_block_prefix(buf, pos)
+    (tx_count,) = struct.unpack_from(">I", buf, pos)
+    pos += 4
+    txs = []
+    for _ in range(tx_count):
+        (length,) = struct.unpack_from(">I", buf, pos)
+        pos += 4
+        tx, _ = decode_tx(buf, pos)
+        txs.append(tx)
+        pos += length
+    block["transactions"] = txs
+    if flags & _BLOCK_HAS_VERSION:
+        block["version"] = version
+    if version >= MERKLE_BLOCK_VERSION:
+        block["merkle_root"] = compute_merkle_root(txs)
+    return block
@@ -0,0 +1,216 @@
+from pymongo import ASCENDING, DESCENDING, UpdateOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from encoding import compute_tx_hash
+from pruner import load_block
+from snapshots import get_snapshots, latest_snapshot
+
+index_batch_size = 200      # 한 번에 색인할 블록 수
+rollback_page_size = 100    # 분기점 탐색 시 한 번에 비교할 블록 수
+
+# 체인 색인기
+# - blocks 컬렉션의 새 블록을 마지막 색인 높이(커서)부터 순서대로 읽어
+#   transactions(트랜잭션별 행, block_index 포함)와 accounts(잔고, 일괄 $inc)에 반영
+# - 블록당 비용은 블록 트랜잭션 수에 비례 (체인 전체를 다시 읽지 않음)
+# - 체인 재구성(분기) 시 분기점 이후 색인을 되돌린 뒤 새 블록을 다시 색인
+#
+# 중단 후 재실행해도 같은 결과가 되도록
+# - 트랜잭션 행은 (block_index, position) 고유 색인으로 중복 삽입 무시
+# - 계정은 마지막으로 반영한 높이(indexed_height)를 함께 기록하고, 그보다 높은 배치만 $inc 적용
+# - 커서는 배치 반영이 모두 끝난 뒤 저장
+class ChainIndexer:
+    def __init__(self, blocks, batch_size=None, archive=None):
+        db = blocks.database
+        self.blocks = blocks
+        self.transactions = db["transactions"]
+        self.accounts = db["accounts"]
+        self.indexed_blocks = db["indexed_blocks"]
+        self.state = db["sync_state"]
+        self.archive = archive
+        self.batch_size = index_batch_size if batch_size is None else batch_size
+        self._indexed = False
+
+    def ensure_indexes(self):
+        if self._indexed:
+            return
+        self.transactions.create_index([("block_index", ASCENDING), ("position", ASCENDING)], unique=True)
+        self.transactions.create_index([("sender", ASCENDING), ("timestamp", DESCENDING)])
+        self.transactions.create_index([("recipient", ASCENDING), ("timestamp", DESCENDING)])
+        self.transactions.create_index("tx_hash")
+        self.accounts.create_index("address", unique=True)
+        self.accounts.create_index("indexed_height")
+        self.indexed_blocks.create_index("index", unique=True)
+        self._indexed = True
+
+    # ---------- 커서 ----------
+
+    # 커서가 없으면 빈 색인에서 시작 ("new" 표시)
+    # (스냅샷 빠른 동기화로 체인이 중간 높이부터 시작하면 accounts가 스냅샷 높이 상태이므로 그 높이부터)
+    def get_cursor(self):
+        cursor = self.state.find_one({"_id": "indexer"}, {"_id": 0})
+        if cursor is not None:
+            return cursor
+        first = self.blocks.find_one({}, {"_id": 0, "index": 1}, sort=[("index", 1)])
+        snapshot = latest_snapshot(get_snapshots(self.blocks))
+        if first is not None and first["index"] > 1 and snapshot is not None and snapshot["height"] >= first["index"]:
+            return {"height": snapshot["height"], "hash": snapshot["tip_hash"], "base": snapshot["height"], "new": True}
+        return {"height": 0, "hash": "0", "base": 0, "new": True}
+
+    # 커서 없이 처음부터 색인하기 전에 기존 accounts/transactions 비우기
+    # (색인기 도입 전에 다른 방식으로 채워진 잔고에 $inc가 더해져 이중 반영되는 것을 방지, 체인 전체에서 다시 계산)
+    def reset(self):
+        if self.accounts.find_one({}, {"_id": 1}) is None and self.transactions.find_one({}, {"_id": 1}) is None:
+            return False
+        self.accounts.delete_many({})
+        self.transactions.delete_many({})
+        self.indexed_blocks.delete_many({})
+        return True
+
+    def _save_cursor(self, height, block_hash, base):
+        self.state.update_one(
+            {"_id": "indexer"}, {"$set": {"height": height, "hash": block_hash, "base": base}}, upsert=True
+        )
+
+    # ---------- 실행 ----------
+
+    # 체인 끝까지 색인, 색인한 블록 수 반환
+    def run(self, max_blocks=None):
+        cursor = self.get_cursor()
+        if cursor.get("new") and cursor["height"] == 0:
+            self.reset()
+        self.ensure_indexes()
+        height, tip_hash, base = cursor["height"], cursor["hash"], cursor.get("base", 0)
+
+        # 커서 위치 블록이 바뀌었으면 (재구성) 분기점까지 되돌림
+        if height > base and not self._matches(height, tip_hash):
+            height, tip_hash = self.rollback(height, base)
+
+        indexed = 0
+        while max_blocks is None or indexed < max_blocks:
+            limit = self.batch_size if max_blocks is None else min(self.batch_size, max_blocks - indexed)
+            batch = list(self.blocks.find({"index": {"$gt": height}}, {"_id": 0}).sort("index").limit(limit))
+            if not batch:
+                break
+
+            # 색인 중 재구성된 경우 (연결이 끊긴 블록) 되돌린 뒤 다시 읽음
+            if batch[0]["index"] != height + 1 or batch[0]["previous_hash"] != tip_hash:
+                if height <= base:
+                    break
+                height, tip_hash = self.rollback(height, base)
+                continue
+            batch = self._contiguous(batch)
+
+            self._index_batch(batch)
+            height, tip_hash = batch[-1]["index"], batch[-1]["hash"]
+            self._save_cursor(height, tip_hash, base)
+            indexed += len(batch)
+        return indexed
+
+    # 번호·이전 해시가 이어지는 앞부분만 사용
+    def _contiguous(self, batch):
+        for i in range(1, len(batch)):
+            if batch[i]["index"] != batch[i - 1]["index"] + 1 or batch[i]["previous_hash"] != batch[i - 1]["hash"]:
+                return batch[:i]
+        return batch
+
+    def _matches(self, height, block_hash):
+        blk = self.blocks.find_one({"index": height}, {"_id": 0, "hash": 1})
+        return blk is not None and blk["hash"] == block_hash
+
+    # 블록 배치 색인 (트랜잭션 행 삽입 → 잔고 $inc → 색인 블록 기록)
+    def _index_batch(self, batch):
+        rows = []
+        deltas = {}
+        for blk in batch:
+            if "transactions" not in blk:
+                blk = load_block(self.blocks, blk["index"], self.archive)
+            for position, tx in enumerate(blk.get("transactions", [])):
+                row = {k: v for k, v in tx.items() if k != "_id"}
+                row["tx_hash"] = tx.get("tx_hash") or compute_tx_hash(tx)
+                row["block_index"] = blk["index"]
+                row["block_hash"] = blk["hash"]
+                row["position"] = position
+                rows.append(row)
+                _add_tx_delta(deltas, tx, 1)
+
+        if rows:
+            _ignore_duplicates(self.transactions, lambda: self.transactions.insert_many(rows, ordered=False))
+
+        end = batch[-1]["index"]
+        ops = [
+            UpdateOne(
+                {"address": address, "indexed_height": {"$not": {"$gte": end}}},
+                {"$inc": {"balance": delta}, "$set": {"indexed_height": end}},
+                upsert=True,
+            )
+            for address, delta in deltas.items()
+        ]
+        if ops:
+            _ignore_duplicates(self.accounts, lambda: self.accounts.bulk_write(ops, ordered=False))
+
+        self.indexed_blocks.bulk_write(
+            [ReplaceOne({"index": blk["index"]}, {"index": blk["index"], "hash": blk["hash"]}, upsert=True) for blk in batch],
+            ordered=False,
+        )
+
+    # ---------- 재구성 ----------
+
+    # 색인한 블록 중 현재 체인과 해시가 같은 가장 높은 블록 (없으면 base)
+    def find_fork_point(self, height, base=0):
+        while height > base:
+            page = list(self.indexed_blocks.find(
+                {"index": {"$lte": height, "$gt": base}}, {"_id": 0, "index": 1, "hash": 1}
+            ).sort("index", -1).limit(rollback_page_size))
+            if not page:
+                break
+            current = {
+                blk["index"]: blk["hash"]
+                for blk in self.blocks.find({"index": {"$in": [b["index"] for b in page]}}, {"_id": 0, "index": 1, "hash": 1})
+            }
+            for blk in page:
+                if current.get(blk["index"]) == blk["hash"]:
+                    return blk["index"], blk["hash"]
+            height = page[-1]["index"] - 1
+        base_block = self.blocks.find_one({"index": base}, {"_id": 0, "hash": 1}) if base else None
+        return base, base_block["hash"] if base_block else "0"
+
+    # 분기점 이후 색인 되돌리기 (되돌릴 트랜잭션 행 수에 비례)
+    def rollback(self, height, base=0):
+        fork_index, fork_hash = self.find_fork_point(height, base)
+
+        deltas = {}
+        for row in self.transactions.find(
+            {"block_index": {"$gt": fork_index}}, {"_id": 0, "sender": 1, "recipient": 1, "amount": 1, "fee": 1}
+        ):
+            _add_tx_delta(deltas, row, -1)
+        ops = [
+            UpdateOne(
+                {"address": address, "indexed_height": {"$gt": fork_index}},
+                {"$inc": {"balance": delta}, "$set": {"indexed_height": fork_index}},
+            )
+            for address, delta in deltas.items()
+        ]
+        if ops:
+            self.accounts.bulk_write(ops, ordered=False)
+        # 분기점 이전 트랜잭션만 반영된 계정도 다음 배치가 적용되도록 반영 높이를 분기점으로 낮춤
+        self.accounts.update_many({"indexed_height": {"$gt": fork_index}}, {"$set": {"indexed_height": fork_index}})
+
+        self.transactions.delete_many({"block_index": {"$gt": fork_index}})
+        self.indexed_blocks.delete_many({"index": {"$gt": fork_index}})
+        self._save_cursor(fork_index, fork_hash, base)
+        return fork_index, fork_hash
+
+# 트랜잭션 1개의 주소별 잔고 변화 누적 (sign=-1이면 되돌리기)
+def _add_tx_delta(deltas, tx, sign):
+    amount = tx["amount"]
+    if tx["sender"] != "SYSTEM":
+        deltas[tx["sender"]] = deltas.get(tx["sender"], 0.0) - sign * (amount + tx.get("fee", 0))
+    deltas[tx["recipient"]] = deltas.get(tx["recipient"], 0.0) + sign * amount
+
+# 이미 반영된 문서의 중복 키 오류(11000)만 무시
+def _ignore_duplicates(collection, write):
+    try:
+        write()
+    except BulkWriteError as e:
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
@@ -0,0 +1,126 @@
+_MISSING = object()
+
+# 메모리 기반 계정 잔고 상태
+# - accounts 컬렉션에서 한 번에 로드한 뒤 블록 단위로 증분 갱신
+# - begin() / rollback() / commit() 으로 블록 생성·검증 중 임시 적용 및 되돌리기
+class LedgerState:
+    def __init__(self, balances=None, height=0, tip_hash="0", complete=True):
+        self.balances = dict(balances or {})
+        self.height = height          # 반영된 마지막 블록 번호
+        self.tip_hash = tip_hash      # 반영된 마지막 블록 해시
+        self.complete = complete      # 모든 계정이 로드되었는지 여부 (False면 preload로 필요한 주소만 추가 로드)
+        self._loaded = set(self.balances)
+        self._journal = []            # (address, 이전 잔고) 변경 기록
+        self._savepoints = []
+
+    # accounts 컬렉션에서 잔고 로드 (addresses 지정 시 해당 주소만, 조회 1회)
+    @classmethod
+    def load(cls, accounts, addresses=None, height=0, tip_hash="0"):
+        query = {}
+        if addresses is not None:
+            query = {"address": {"$in": list(set(addresses))}}
+        balances = {}
+        for account in accounts.find(query, {"address": 1, "balance": 1, "_id": 0}):
+            balances[account["address"]] = account.get("balance", 0.0)
+        state = cls(balances, height=height, tip_hash=tip_hash, complete=addresses is None)
+        if addresses is not None:
+            state._loaded.update(addresses)
+        return state
+
+    # 아직 로드하지 않은 주소만 한 번에 추가 로드
+    def preload(self, accounts, addresses):
+        if self.complete:
+            return
+        missing = [address for address in set(addresses) if address not in self._loaded]
+        if not missing:
+            return
+        for account in accounts.find({"address": {"$in": missing}}, {"address": 1, "balance": 1, "_id": 0}):
+            self.balances.setdefault(account["address"], account.get("balance", 0.0))
+        self._loaded.update(missing)
+
+    def copy(self):
+        state = LedgerState(self.balances, height=self.height, tip_hash=self.tip_hash, complete=self.complete)
+        state._loaded = set(self._loaded)
+        return state
+
+    # 다른 상태로 교체 (분기 체인 채택 시)
+    def adopt(self, other):
+        self.balances = dict(other.balances)
+        self.height = other.height
+        self.tip_hash = other.tip_hash
+        self.complete = other.complete
+        self._loaded = set(other._loaded)
+        self._journal.clear()
+        self._savepoints.clear()
+
+    def balance(self, address):
+        return self.balances.get(address, 0.0)
+
+    def _set(self, address, value):
+        if self._savepoints:
+            self._journal.append((address, self.balances.get(address, _MISSING)))
+        self.balances[address] = value
+
+    def credit(self, address, amount):
+        self._set(address, self.balance(address) + amount)
+
+    def debit(self, address, amount):
+        self._set(address, self.balance(address) - amount)
+
+    # 트랜잭션 적용 (잔고 부족 시 False, 상태 변경 없음)
+    def apply_tx(self, tx):
+        amount = tx["amount"]
+        if tx["sender"] == "SYSTEM":
+            self.credit(tx["recipient"], amount)
+            return True
+
+        fee = tx.get("fee", 0)
+        if self.balance(tx["sender"]) < amount + fee:
+            return False
+        self.debit(tx["sender"], amount + fee)
+        self.credit(tx["recipient"], amount)
+        return True
+
+    # 트랜잭션 되돌리기
+    def revert_tx(self, tx):
+        amount = tx["amount"]
+        self.debit(tx["recipient"], amount)
+        if tx["sender"] != "SYSTEM":
+            self.credit(tx["sender"], amount + tx.get("fee", 0))
+
+    # 검증이 끝난 블록 반영
+    def apply_block(self, block):
+        for tx in block["transactions"]:
+            if tx["sender"] == "SYSTEM":
+                self.credit(tx["recipient"], tx["amount"])
+            else:
+                self.debit(tx["sender"], tx["amount"] + tx.get("fee", 0))
+                self.credit(tx["recipient"], tx["amount"])
+        self.height = block["index"]
+        self.tip_hash = block["hash"]
+
+    # 블록 반영 취소 (재구성 시)
+    def revert_block(self, block, previous_hash=None):
+        for tx in reversed(block["transactions"]):
+            self.revert_tx(tx)
+        self.height = block["index"] - 1
+        self.tip_hash = previous_hash if previous_hash is not None else block["previous_hash"]
+
+    # ---------- 임시 적용 ----------
+
+    def begin(self):
+        self._savepoints.append((len(self._journal), self.height, self.tip_hash))
+
+    def rollback(self):
+        position, self.height, self.tip_hash = self._savepoints.pop()
+        while len(self._journal) > position:
+            address, previous = self._journal.pop()
+            if previous is _MISSING:
+                self.balances.pop(address, None)
+            else:
+                self.balances[address] = previous
+
+    def commit(self):
+        self._savepoints.pop()
+        if not self._savepoints:
+            self._journal.clear()
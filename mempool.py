@@ -0,0 +1,332 @@
+import heapq, hmac, itertools, os, secrets, threading, time
+from bisect import insort
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from encoding import encode_tx, get_tx_hash, compute_tx_hash
+
+_indexed_pools = set()    # 인덱스 생성을 마친 컬렉션 (프로세스당 1회)
+
+full_refresh_seconds = 30      # Mempool이 컬렉션 전체와 tx_hash 차이를 맞추는 주기
+
+# 풀 문서에만 있는 필드 (블록에 들어가는 트랜잭션에는 포함하지 않음)
+# - admitted: 풀 입장 검증(admit_transaction)을 통과한 표시 → 다른 프로세스의 블록 생성에서도 서명 검증 생략
+#   (내용 해시에 대한 노드 비밀키 HMAC, 내용을 다시 해시해 표시가 맞을 때만 인정하므로 입장 후 바뀐 문서나
+#    비밀키 없이 풀에 직접 넣은 문서는 다시 검증)
+POOL_FIELDS = ("_id", "fee_rate", "admitted")
+
+# admitted 표시용 노드 비밀키
+# - 같은 노드의 여러 프로세스(지갑·RPC, 채굴 데몬)가 표시를 공유하려면 XPER_POOL_SECRET을 같게 설정
+# - 설정하지 않으면 프로세스마다 임의 생성 (다른 프로세스가 입장시킨 트랜잭션은 블록 생성 시 다시 검증)
+# - 피어가 읽을 수 있는 DB에는 저장하지 않음
+pool_secret = (os.environ.get("XPER_POOL_SECRET") or secrets.token_hex(32)).encode()
+
+# 트랜잭션 크기 (정규 인코딩 바이트 수)
+def tx_size(tx):
+    return len(encode_tx(tx))
+
+# 수수료율 (바이트당 수수료)
+def fee_rate(tx, size=None):
+    size = size or tx_size(tx)
+    return tx.get("fee", 0) / size if size else 0.0
+
+# 풀 문서 → 트랜잭션 (풀 전용 필드 제거)
+def pool_tx(doc):
+    return {k: v for k, v in doc.items() if k not in POOL_FIELDS}
+
+# 트랜잭션 → 풀 문서 (tx_hash와 정렬용 수수료율 기록, admitted=True면 입장 검증 표시)
+def pool_document(tx, admitted=False):
+    doc = pool_tx(tx)
+    get_tx_hash(doc)
+    doc["fee_rate"] = fee_rate(doc)
+    if admitted:
+        doc["admitted"] = admitted_marker(compute_tx_hash(doc))
+    return doc
+
+# 내용 해시 → admitted 표시 (노드 비밀키 HMAC)
+def admitted_marker(content_hash):
+    return hmac.new(pool_secret, content_hash.encode(), "sha256").hexdigest()
+
+# 이 노드가 입장 검증을 통과시킨 뒤 내용이 바뀌지 않은 풀 문서면 내용 해시, 아니면 None
+def admitted_hash(doc):
+    marker = doc.get("admitted")
+    if not isinstance(marker, str):
+        return None
+    content_hash = compute_tx_hash(pool_tx(doc))
+    if not hmac.compare_digest(marker, admitted_marker(content_hash)):
+        return None
+    return content_hash
+
+# transaction_pool 인덱스 생성 (프로세스 시작 시 1회, tx_hash 없는 기존 문서는 먼저 채움)
+# 이후 이전 클라이언트가 직접 넣은 문서는 풀을 읽다가 만날 때 1개씩 채움 (_fill_pool_doc)
+def ensure_mempool_indexes(tx_pool):
+    key = (id(tx_pool.database), tx_pool.name)
+    if key in _indexed_pools:
+        return
+    backfill_pool_hashes(tx_pool)
+    tx_pool.create_index("tx_hash", unique=True, sparse=True)
+    tx_pool.create_index([("fee_rate", -1), ("timestamp", 1)])
+    tx_pool.create_index("sender")
+    _indexed_pools.add(key)
+
+# tx_hash/fee_rate 필드가 없는 풀 문서(기존 문서, 이전 클라이언트가 직접 넣은 문서)에 기록 (중복 문서는 삭제)
+# 풀 전체를 조회하므로 시작·이전(migration) 시에만 실행
+def backfill_pool_hashes(tx_pool):
+    legacy = []
+    for doc in tx_pool.find({"$or": [{"tx_hash": {"$exists": False}}, {"fee_rate": {"$exists": False}}]}):
+        legacy.append((doc["_id"], "tx_hash" in doc, pool_document(doc)))
+    if not legacy:
+        return 0
+    new_hashes = [doc["tx_hash"] for _, had_hash, doc in legacy if not had_hash]
+    seen = {tx["tx_hash"] for tx in tx_pool.find({"tx_hash": {"$in": new_hashes}}, {"tx_hash": 1})} if new_hashes else set()
+
+    updates = []
+    duplicates = []
+    for _id, had_hash, doc in legacy:
+        if had_hash:
+            updates.append(UpdateOne({"_id": _id}, {"$set": {"fee_rate": doc["fee_rate"]}}))
+        elif doc["tx_hash"] in seen:
+            duplicates.append(_id)
+        else:
+            seen.add(doc["tx_hash"])
+            updates.append(UpdateOne({"_id": _id}, {"$set": {"tx_hash": doc["tx_hash"], "fee_rate": doc["fee_rate"]}}))
+    if updates:
+        tx_pool.bulk_write(updates, ordered=False)
+    if duplicates:
+        tx_pool.delete_many({"_id": {"$in": duplicates}})
+    return len(updates)
+
+def _needs_fill(doc):
+    return "tx_hash" not in doc or "fee_rate" not in doc
+
+# 풀을 읽다가 만난 tx_hash/fee_rate 없는 문서 1개에 기록 (같은 tx_hash 문서가 이미 있으면 삭제하고 None)
+def _fill_pool_doc(tx_pool, doc):
+    filled = pool_document(doc)
+    try:
+        tx_pool.update_one({"_id": doc["_id"]}, {"$set": {"tx_hash": filled["tx_hash"], "fee_rate": filled["fee_rate"]}})
+    except DuplicateKeyError:
+        tx_pool.delete_one({"_id": doc["_id"]})
+        return None
+    return dict(doc, tx_hash=filled["tx_hash"], fee_rate=filled["fee_rate"])
+
+# 풀에서 트랜잭션 일괄 삭제 (tx_hash 기준)
+def remove_pool_txs(tx_pool, txs):
+    tx_hashes = list({get_tx_hash(tx) for tx in txs})
+    if not tx_hashes:
+        return 0
+    return tx_pool.delete_many({"tx_hash": {"$in": tx_hashes}}).deleted_count
+
+# 풀에 트랜잭션 일괄 복원 (재구성 시, 이미 있는 tx_hash는 무시)
+def restore_pool_txs(tx_pool, txs):
+    docs = []
+    for tx in txs:
+        if tx["sender"] == "SYSTEM":
+            continue    # 보상 트랜잭션은 복원하지 않음
+        docs.append(pool_document(tx))
+    if not docs:
+        return 0
+    try:
+        return len(tx_pool.insert_many(docs, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        # 중복 키(11000) 외의 오류만 다시 발생
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+        return e.details.get("nInserted", 0)
+
+# 메모리 인덱스 없이 풀을 수수료율 순으로 스트리밍 (필요한 만큼만 읽음, Mempool과 같은 바이트당 수수료 기준)
+# admitted 집합을 넘기면 입장 검증을 마친 트랜잭션의 내용 해시를 내보내기 전에 추가
+def iter_pool_by_fee(tx_pool, batch_size=256, admitted=None):
+    cursor = tx_pool.find({}).sort([("fee_rate", -1), ("timestamp", 1)]).batch_size(batch_size)
+    for doc in cursor:
+        if _needs_fill(doc):
+            doc = _fill_pool_doc(tx_pool, doc)
+            if doc is None:
+                continue
+        if admitted is not None:
+            content_hash = admitted_hash(doc)
+            if content_hash is not None:
+                admitted.add(content_hash)
+        yield pool_tx(doc)
+
+# 수수료 우선순위 멤풀
+# - 영구 저장: transaction_pool 컬렉션
+# - 메모리 인덱스: tx_hash별 트랜잭션, 송신자별 큐(타임스탬프 순), 수수료율
+class Mempool:
+    def __init__(self, tx_pool=None, max_size=None):
+        self.tx_pool = tx_pool
+        self.max_size = max_size    # 메모리에 유지할 최대 트랜잭션 수 (초과 시 수수료율 낮은 것부터 제거)
+        self.txs = {}               # tx_hash -> tx
+        self.rates = {}             # tx_hash -> 수수료율
+        self.sizes = {}             # tx_hash -> 바이트 수
+        self.by_sender = {}         # sender -> [(timestamp, tx_hash), ...] 정렬 유지
+        self._evict_heap = []       # (수수료율, tx_hash) 최소 힙 (지연 삭제)
+        self.admitted = set()       # 입장 검증을 마친 tx_hash (풀 문서의 admitted 표시)
+        self._last_id = None        # 마지막으로 읽은 컬렉션 _id
+        self._last_full = None      # 마지막 전체 비교 시각 (time.monotonic)
+        self._lock = threading.RLock()    # 갱신·조회 스레드 간 보호 (RPC 작업 스레드, 채굴 준비와 블록 전파 수신)
+
+    # 컬렉션에서 전체 로드
+    @classmethod
+    def load(cls, tx_pool, max_size=None):
+        mempool = cls(tx_pool, max_size=max_size)
+        ensure_mempool_indexes(tx_pool)
+        mempool.refresh()
+        return mempool
+
+    def __len__(self):
+        return len(self.txs)
+
+    def __contains__(self, tx_hash):
+        return tx_hash in self.txs
+
+    # 다른 프로세스(지갑, RPC 등)가 컬렉션에 넣거나 지운 트랜잭션 반영
+    # - 평소: _id 증가분만 조회
+    # - full=True 또는 full_refresh_seconds마다: 컬렉션의 tx_hash 전체와 비교
+    #   (ObjectId는 클라이언트 프로세스마다 생성되어 프로세스 간 순서가 보장되지 않으므로 증가분 조회만으로는 누락 가능)
+    def refresh(self, full=False):
+        if self.tx_pool is None:
+            return 0
+        with self._lock:
+            return self._refresh(full)
+
+    def _refresh(self, full):
+        now = time.monotonic()
+        if full or self._last_full is None or now - self._last_full >= full_refresh_seconds:
+            self._last_full = now
+            return self._full_refresh()
+        query = {"_id": {"$gt": self._last_id}} if self._last_id is not None else {}
+        count = 0
+        for doc in self.tx_pool.find(query).sort("_id", 1):
+            self._last_id = doc["_id"]
+            if _needs_fill(doc):
+                doc = _fill_pool_doc(self.tx_pool, doc)
+                if doc is None:
+                    continue
+            if self._index(doc):
+                count += 1
+        return count
+
+    def _full_refresh(self):
+        stored = set()
+        unfilled = []
+        for doc in self.tx_pool.find({}, {"_id": 1, "tx_hash": 1}):
+            if "tx_hash" in doc:
+                stored.add(doc["tx_hash"])
+            else:
+                unfilled.append(doc["_id"])
+            if self._last_id is None or doc["_id"] > self._last_id:
+                self._last_id = doc["_id"]
+        # 시작 이후 이전 클라이언트가 넣은 문서 (해당 문서만 채움)
+        for i in range(0, len(unfilled), 1000):
+            for doc in self.tx_pool.find({"_id": {"$in": unfilled[i:i + 1000]}}):
+                doc = _fill_pool_doc(self.tx_pool, doc)
+                if doc is not None:
+                    stored.add(doc["tx_hash"])
+        self.remove([tx_hash for tx_hash in self.txs if tx_hash not in stored])
+        missing = [tx_hash for tx_hash in stored if tx_hash not in self.txs]
+        count = 0
+        for i in range(0, len(missing), 1000):
+            for doc in self.tx_pool.find({"tx_hash": {"$in": missing[i:i + 1000]}}):
+                if self._index(doc):
+                    count += 1
+        return count
+
+    # 트랜잭션 추가 (persist=True면 컬렉션에도 저장, admitted=True면 입장 검증 표시)
+    def add(self, tx, persist=True, admitted=False):
+        doc = pool_document(tx, admitted=admitted)
+        with self._lock:
+            if doc["tx_hash"] in self.txs:
+                return False
+            if persist and self.tx_pool is not None:
+                try:
+                    self.tx_pool.insert_one(dict(doc))
+                except DuplicateKeyError:
+                    pass    # 이미 컬렉션에 있음 → 인덱스만 갱신
+            return self._index(doc)
+
+    def _index(self, doc):
+        tx = pool_tx(doc)
+        tx_hash = get_tx_hash(tx)
+        if tx_hash in self.txs:
+            return False
+        if admitted_hash(doc) == tx_hash:
+            self.admitted.add(tx_hash)
+
+        size = tx_size(tx)
+        rate = fee_rate(tx, size)
+        self.txs[tx_hash] = tx
+        self.sizes[tx_hash] = size
+        self.rates[tx_hash] = rate
+        insort(self.by_sender.setdefault(tx["sender"], []), (tx["timestamp"], tx_hash))
+        heapq.heappush(self._evict_heap, (rate, tx_hash))
+
+        if self.max_size is not None:
+            while len(self.txs) > self.max_size:
+                self._evict_lowest()
+        return True
+
+    def _evict_lowest(self):
+        while self._evict_heap:
+            rate, tx_hash = heapq.heappop(self._evict_heap)
+            if tx_hash in self.txs:
+                self.remove([tx_hash])
+                if self.tx_pool is not None:
+                    self.tx_pool.delete_one({"tx_hash": tx_hash})
+                return
+
+    # 메모리 인덱스에서 제거 (컬렉션 정리는 호출 측에서 일괄 처리)
+    def remove(self, tx_hashes):
+        with self._lock:
+            self._remove(tx_hashes)
+
+    def _remove(self, tx_hashes):
+        for tx_hash in tx_hashes:
+            tx = self.txs.pop(tx_hash, None)
+            if tx is None:
+                continue
+            self.admitted.discard(tx_hash)
+            self.sizes.pop(tx_hash, None)
+            self.rates.pop(tx_hash, None)
+            queue = self.by_sender.get(tx["sender"])
+            if queue:
+                try:
+                    queue.remove((tx["timestamp"], tx_hash))
+                except ValueError:
+                    pass
+                if not queue:
+                    del self.by_sender[tx["sender"]]
+        # 지연 삭제된 항목이 많이 쌓이면 힙 재구성
+        if len(self._evict_heap) > 2 * len(self.txs) + 64:
+            self._evict_heap = [(self.rates[h], h) for h in self.txs]
+            heapq.heapify(self._evict_heap)
+
+    # 송신자의 대기 중인 지출 합계 (금액 + 수수료)
+    def pending_spend(self, sender):
+        with self._lock:
+            return sum(self.txs[h]["amount"] + self.txs[h].get("fee", 0) for _, h in self.by_sender.get(sender, []))
+
+    # 수수료율 상위 limit개 목록 (다른 스레드가 갱신하는 중에도 사용할 수 있도록 복사)
+    def best(self, limit):
+        with self._lock:
+            return list(itertools.islice(self.iter_best(), limit))
+
+    # 수수료율 높은 순으로 트랜잭션 순회 (같은 송신자는 타임스탬프 순서 유지)
+    # 순회 중 다른 스레드가 갱신하지 않아야 함 (블록 생성·동기화는 chain_lock 안에서 사용, 그 밖에서는 best)
+    def iter_best(self):
+        heads = []
+        for sender, queue in self.by_sender.items():
+            timestamp, tx_hash = queue[0]
+            heads.append((-self.rates[tx_hash], timestamp, tx_hash, sender, 0))
+        heapq.heapify(heads)
+
+        while heads:
+            _, _, tx_hash, sender, position = heapq.heappop(heads)
+            tx = self.txs.get(tx_hash)
+            if tx is not None:
+                yield tx
+            queue = self.by_sender.get(sender, [])
+            position += 1
+            if position < len(queue):
+                timestamp, next_hash = queue[position]
+                heapq.heappush(heads, (-self.rates[next_hash], timestamp, next_hash, sender, position))
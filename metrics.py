@@ -0,0 +1,256 @@
+import os, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 단계별 시간 측정 및 지표 내보내기 (Prometheus 텍스트 형식)
+# - span(단계): 구간 시간을 xper_phase_seconds 히스토그램에 기록
+# - inc(이름, 라벨...): 카운터 증가 / observe(이름, 값, 라벨...): 히스토그램 기록 / set_gauge(이름, 값, 라벨...): 현재 값
+# - 비활성 상태에서는 전역 플래그 확인만 하고 바로 반환 (span은 공용 no-op 컨텍스트)
+# - 내보내기: 텍스트 파일(node_exporter textfile 수집기 등) 또는 로컬 HTTP /metrics
+#
+# 환경 변수로 시작 시 활성화
+#   XPER_METRICS_FILE=/var/lib/node_exporter/xper.prom  (XPER_METRICS_INTERVAL 초마다 기록, 기본 15)
+#   XPER_METRICS_PORT=9464                               (127.0.0.1:포트/metrics)
+
+default_buckets = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 이름 -> (종류, 설명, 버킷)
+metric_definitions = {
+    "xper_phase_seconds": ("histogram", "합의/블록 생성 단계별 소요 시간", default_buckets),
+    "xper_txs_verified_total": ("counter", "서명 검증한 트랜잭션 수", None),
+    "xper_txs_rejected_total": ("counter", "거부된 트랜잭션 수 (reason별)", None),
+    "xper_txs_admitted_total": ("counter", "검증 후 풀에 들어간 트랜잭션 수", None),
+    "xper_blocks_created_total": ("counter", "생성한 블록 수", None),
+    "xper_blocks_synced_total": ("counter", "피어에서 받아 저장한 블록 수", None),
+    "xper_blocks_rejected_total": ("counter", "검증 실패한 피어 블록 수 (reason별)", None),
+    "xper_block_txs": ("histogram", "블록당 트랜잭션 수", (1, 10, 50, 100, 500, 1000, 2500, 5000, 10000)),
+    "xper_peer_poll_failures_total": ("counter", "피어 조회 실패 수", None),
+    "xper_reorgs_total": ("counter", "분기 체인으로 교체한 횟수", None),
+    "xper_db_commands_total": ("counter", "MongoDB 명령(네트워크 왕복) 수", None),
+    "xper_block_announcements_total": ("counter", "피어에서 받은 새 블록 알림 수", None),
+    "xper_block_announcements_skipped_total": ("counter", "건너뛴 블록 알림 수 (reason별)", None),
+    "xper_propagation_seconds": ("histogram", "블록 생성/알림 수신부터 내 체인 반영까지 걸린 시간", default_buckets),
+    "xper_tip_height": ("gauge", "내 체인 끝 블록 번호", None),
+    "xper_pool_size": ("gauge", "트랜잭션 풀 크기", None),
+    "xper_last_build_seconds": ("gauge", "마지막 블록 생성 소요 시간", None),
+    "xper_seen_lookups_total": ("counter", "본 트랜잭션 색인 조회 수 (result별: miss/recent/confirmed/false_positive)", None),
+    "xper_seen_txs": ("gauge", "블룸 필터에 넣은 트랜잭션 수", None),
+}
+
+_enabled = False
+_lock = threading.Lock()
+_counters = {}      # (이름, 라벨 튜플) -> 값
+_histograms = {}    # (이름, 라벨 튜플) -> [버킷별 누적 수..., 합계, 개수]
+_gauges = {}        # (이름, 라벨 튜플) -> 값
+_exporters = []
+
+def enabled():
+    return _enabled
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+def inc(name, amount=1, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def set_gauge(name, value, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+def observe(name, value, **labels):
+    if not _enabled:
+        return
+    buckets = metric_definitions.get(name, (None, None, default_buckets))[2] or default_buckets
+    key = _key(name, labels)
+    with _lock:
+        state = _histograms.get(key)
+        if state is None:
+            state = _histograms[key] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                state[i] += 1
+        state[-2] += value
+        state[-1] += 1
+
+class _Span:
+    __slots__ = ("phase", "labels", "start")
+
+    def __init__(self, phase, labels):
+        self.phase = phase
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe("xper_phase_seconds", time.perf_counter() - self.start, phase=self.phase, **self.labels)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+def span(phase, **labels):
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(phase, labels)
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _gauges.clear()
+
+# ---------- Prometheus 텍스트 형식 ----------
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"' for k, v in items)
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+def render():
+    with _lock:
+        values = dict(_counters)
+        values.update(_gauges)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+
+    names = sorted({name for name, _ in values} | {name for name, _ in histograms})
+    lines = []
+    for name in names:
+        kind, help_text, buckets = metric_definitions.get(name, ("counter", name, None))
+        if name in {n for n, _ in histograms}:
+            kind = "histogram"
+        buckets = buckets or default_buckets
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            for (metric, labels), state in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for i, bound in enumerate(buckets):
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', _format_value(float(bound)))])} {state[i]}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {state[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(state[-2]))}")
+                lines.append(f"{name}_count{_format_labels(labels)} {state[-1]}")
+        else:
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+# 텍스트 파일로 기록 (임시 파일에 쓴 뒤 교체 → 수집기가 중간 상태를 읽지 않음)
+def write_textfile(path):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+# ---------- 내보내기 ----------
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_http_server(port, addr="127.0.0.1"):
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="xper-metrics-http", daemon=True)
+    thread.start()
+    _exporters.append(server)
+    return server
+
+def start_textfile_writer(path, interval=15.0):
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            write_textfile(path)
+        write_textfile(path)
+
+    thread = threading.Thread(target=run, name="xper-metrics-file", daemon=True)
+    thread.start()
+    stop.thread = thread
+    _exporters.append(stop)
+    return stop
+
+# ---------- MongoDB 명령 수 (pymongo 명령 모니터링) ----------
+# 등록 이후 생성된 MongoClient에만 적용되므로 활성화는 프로그램 시작 시 수행
+
+_command_listener = None
+
+def _register_command_listener():
+    global _command_listener
+    if _command_listener is not None:
+        return
+    from pymongo import monitoring
+
+    class _CommandCounter(monitoring.CommandListener):
+        def started(self, event):
+            inc("xper_db_commands_total", command=event.command_name)
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            inc("xper_db_commands_total", command=event.command_name, status="failed")
+
+    _command_listener = _CommandCounter()
+    monitoring.register(_command_listener)
+
+def enable(textfile=None, port=None, interval=15.0, count_db_commands=True):
+    global _enabled
+    _enabled = True
+    if count_db_commands:
+        _register_command_listener()
+    if textfile:
+        start_textfile_writer(textfile, interval)
+    if port:
+        start_http_server(int(port))
+
+def disable():
+    global _enabled
+    _enabled = False
+    for exporter in _exporters:
+        if isinstance(exporter, threading.Event):
+            exporter.set()
+        else:
+            exporter.shutdown()
+    _exporters.clear()
+
+if os.environ.get("XPER_METRICS_FILE") or os.environ.get("XPER_METRICS_PORT"):
+    enable(
+        textfile=os.environ.get("XPER_METRICS_FILE"),
+        port=os.environ.get("XPER_METRICS_PORT"),
+        interval=float(os.environ.get("XPER_METRICS_INTERVAL", 15)),
+    )
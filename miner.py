@@ -0,0 +1,282 @@
+import argparse, json, logging, os, signal, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from metrics import span, set_gauge
+from blockchain import (
+    chain_lock, header_projection, create_block, sync_from_peers, maybe_snapshot, verify_signatures,
+    compute_tx_hash, is_verified, max_block_txs, load_ledger,
+)
+from mempool import Mempool, iter_pool_by_fee, ensure_mempool_indexes
+from peers import peer_manager as default_peer_manager, poll_peer_tips
+from seen_index import SeenTxIndex
+from storage import NodeStorage
+
+# 채굴 데몬 (Streamlit 없이 실행)
+# - 마지막 블록 시각 + 블록 시간 경계에 맞춰 블록 생성 (경계까지 대기 후 바로 생성)
+# - 경계 lead_time초 전부터 피어 동기화와 후보 트랜잭션 서명 검증을 동시에 진행 → 경계에서는 잔고 확인과 저장만 수행
+# - 상태(체인 끝, 풀 크기, 마지막 생성 시간)를 status()/상태 파일/지표로 제공
+#
+# 사용 예)
+#   python miner.py --uri mongodb://localhost:27017 --miner-address <공개키> --block-time 0.1 --status-file miner.json
+#   XPER_METRICS_PORT=9464 python miner.py --uri sqlite:///var/lib/xper/node.db --miner-address <공개키> --propagate
+
+miner_lead_time = 2.0           # 블록 경계 몇 초 전부터 준비할지 (블록 시간의 절반을 넘지 않음)
+miner_verified_cache_size = 100_000
+
+log = logging.getLogger("xper.miner")
+
+class MiningDaemon:
+    def __init__(self, blocks, peers, tx_pool, block_time_in_min, miner_address, ledger=None, mempool=None,
+                 peer_manager=None, indexer=None, pruner=None, sync_peers=True, lead_time=None, status_path=None, seen_index=None):
+        self.blocks = blocks
+        self.peers = peers
+        self.tx_pool = tx_pool
+        self.block_time_in_min = block_time_in_min
+        self.miner_address = miner_address
+        self.ledger = ledger
+        self.mempool = mempool
+        self.peer_manager = default_peer_manager if peer_manager is None else peer_manager
+        self.indexer = indexer
+        self.pruner = pruner
+        self.seen_index = seen_index          # 본 트랜잭션 색인 (재전송 방지)
+        self.sync_peers = sync_peers          # False: 블록 전파 수신기(BlockPropagator)가 동기화를 맡는 경우
+        self.interval = block_time_in_min * 60
+        lead_time = miner_lead_time if lead_time is None else lead_time
+        self.lead_time = min(lead_time, self.interval / 2)
+        self.status_path = status_path
+        self.verified = set()                 # 서명 검증을 마친 트랜잭션 내용 해시
+        self._stop_event = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="xper-miner")
+        self._state = {
+            "state": "starting",
+            "tip_index": None,
+            "tip_hash": None,
+            "pool_size": 0,
+            "next_block_at": None,
+            "last_block_index": None,
+            "last_block_txs": None,
+            "last_build_seconds": None,
+            "last_prepare_seconds": None,
+            "blocks_mined": 0,
+            "last_error": None,
+            "started_at": time.time(),
+        }
+        self._lock = threading.Lock()
+
+    # ---------- 상태 ----------
+
+    def _update(self, **fields):
+        with self._lock:
+            self._state.update(fields)
+
+    def status(self):
+        with self._lock:
+            return dict(self._state)
+
+    def write_status(self):
+        if not self.status_path:
+            return
+        tmp = f"{self.status_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.status(), f, indent=2)
+        os.replace(tmp, self.status_path)
+
+    def _refresh_tip(self):
+        tip = self.blocks.find_one({}, header_projection, sort=[("index", -1)])
+        pool_size = self.tx_pool.estimated_document_count()
+        self._update(tip_index=tip["index"] if tip else 0, tip_hash=tip["hash"] if tip else "0", pool_size=pool_size)
+        set_gauge("xper_tip_height", tip["index"] if tip else 0)
+        set_gauge("xper_pool_size", pool_size)
+        return tip
+
+    # 다음 블록 생성 시각 (마지막 블록 시각 + 블록 시간)
+    def next_block_time(self, tip=None):
+        tip = self._refresh_tip() if tip is None else tip
+        return (tip["timestamp"] if tip else 0) + self.interval
+
+    # ---------- 준비 (동시 실행) ----------
+
+    def _sync(self):
+        peer_list = list(self.peers.find())
+        if not peer_list:
+            return False
+        with span("peer_poll"):
+            peer_tips, _ = poll_peer_tips(peer_list, self.peer_manager)
+        with chain_lock:
+            changed = sync_from_peers(self.blocks, peer_tips, self.tx_pool, self.block_time_in_min, ledger=self.ledger,
+                                      mempool=self.mempool, peer_manager=self.peer_manager, pruner=self.pruner,
+                                      seen_index=self.seen_index)
+            if changed:
+                maybe_snapshot(self.blocks, self.ledger, self.indexer)
+        return changed
+
+    # 수수료율 상위 후보의 서명을 미리 검증 (체인 상태와 무관하므로 동기화와 동시에 가능)
+    def _prevalidate(self):
+        ensure_mempool_indexes(self.tx_pool)
+        if self.mempool is not None:
+            self.mempool.refresh(full=True)
+            candidates = self.mempool.best(max_block_txs)    # 동기화 스레드가 멤풀을 갱신하는 중에도 안전한 복사본
+            admitted = self.mempool.admitted
+        else:
+            admitted = set()
+            candidates = iter_pool_by_fee(self.tx_pool, admitted=admitted)
+        current = set()
+        pending = []
+        for tx in candidates:
+            if len(current) >= max_block_txs:
+                break
+            if tx.get("sender") == "SYSTEM":
+                continue
+            tx_hash = compute_tx_hash(tx)
+            current.add(tx_hash)
+            # 풀 입장 시 검증을 마친 트랜잭션(풀 문서의 admitted 표시)은 create_block도 건너뛰므로 제외
+            if tx_hash not in self.verified and tx_hash not in admitted and not is_verified(tx_hash):
+                pending.append((tx_hash, tx))
+        ok = verify_signatures([tx for _, tx in pending])
+        # 풀에 남아 있는 후보만 유지 (크기 제한)
+        verified = {tx_hash for tx_hash in self.verified if tx_hash in current}
+        verified.update(tx_hash for (tx_hash, _), valid in zip(pending, ok) if valid)
+        if len(verified) > miner_verified_cache_size:
+            verified = set(list(verified)[:miner_verified_cache_size])
+        self.verified = verified
+        return len(pending)
+
+    def prepare(self):
+        self._update(state="preparing")
+        start = time.perf_counter()
+        futures = [self._executor.submit(self._prevalidate)]
+        if self.sync_peers:
+            futures.append(self._executor.submit(self._sync))
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                log.warning("준비 단계 오류: %s", e)
+                self._update(last_error=str(e))
+        self._update(last_prepare_seconds=round(time.perf_counter() - start, 6))
+
+    # ---------- 생성 ----------
+
+    # 잔고 상태가 내 체인 끝과 다르면 (다른 프로세스가 블록 저장 등) 다시 로드
+    def _refresh_ledger(self):
+        if self.ledger is None:
+            return
+        tip = self.blocks.find_one({}, header_projection, sort=[("index", -1)])
+        if self.ledger.tip_hash != (tip["hash"] if tip else "0"):
+            log.info("잔고 상태를 체인 끝(#%d)에 맞춰 다시 로드합니다.", tip["index"] if tip else 0)
+            self.ledger.adopt(load_ledger(self.blocks, self.indexer, self.pruner.archive if self.pruner else None))
+
+    def build(self):
+        self._update(state="building")
+        start = time.perf_counter()
+        with chain_lock:
+            self._refresh_ledger()
+            block = create_block(self.blocks, self.tx_pool, self.block_time_in_min, miner_address=self.miner_address,
+                                 ledger=self.ledger, mempool=self.mempool, verified=self.verified,
+                                 seen_index=self.seen_index)
+            if block is not None and self.indexer is not None:
+                with span("index"):
+                    self.indexer.run()
+                maybe_snapshot(self.blocks, self.ledger, self.indexer)
+        elapsed = time.perf_counter() - start
+        if block is not None:
+            with self._lock:
+                self._state["blocks_mined"] += 1
+            self._update(last_block_index=block["index"], last_block_txs=len(block["transactions"]),
+                         last_build_seconds=round(elapsed, 6))
+            set_gauge("xper_last_build_seconds", elapsed)
+            log.info("블록 #%d 생성 (트랜잭션 %d개, %.3f초)", block["index"], len(block["transactions"]), elapsed)
+        if self.pruner is not None:
+            self.pruner.prune()
+        return block
+
+    # ---------- 실행 ----------
+
+    # 블록 1개 주기 실행: 경계 lead_time초 전까지 대기 → 준비 → 경계까지 대기 → 생성
+    def run_once(self):
+        target = self.next_block_time()
+        self._update(state="waiting", next_block_at=target)
+        self.write_status()
+        if self._stop_event.wait(max(0.0, target - self.lead_time - time.time())):
+            return None
+
+        self.prepare()
+
+        # 동기화로 체인 끝이 바뀌었으면 경계 다시 계산
+        target = self.next_block_time()
+        self._update(state="waiting", next_block_at=target)
+        if target - time.time() > self.lead_time:
+            return None
+        if self._stop_event.wait(max(0.0, target - time.time())):
+            return None
+        return self.build()
+
+    def run(self):
+        log.info("채굴 시작: 블록 시간 %.1f초, 준비 %.1f초 전", self.interval, self.lead_time)
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                log.exception("채굴 주기 오류")
+                self._update(state="error", last_error=str(e))
+                self._stop_event.wait(1.0)
+        self._update(state="stopped")
+        self.write_status()
+        self._executor.shutdown(wait=False)
+
+    def stop(self):
+        self._stop_event.set()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="XperChain 채굴 데몬")
+    parser.add_argument("--uri", default=os.environ.get("XPER_STORAGE_URI", "mongodb://localhost:27017"),
+                        help="저장소 URI (mongodb://, sqlite://, memory://)")
+    parser.add_argument("--db", default="blockchain_db")
+    parser.add_argument("--blockfiles", help="블록 파일 저장 경로 (지정 시 blocks를 세그먼트 파일에 저장)")
+    parser.add_argument("--miner-address", default=os.environ.get("XPER_MINER_ADDRESS"), required="XPER_MINER_ADDRESS" not in os.environ)
+    parser.add_argument("--block-time", type=float, default=1.0, help="블록 시간 (분)")
+    parser.add_argument("--lead-time", type=float, default=None, help="블록 경계 몇 초 전부터 준비할지")
+    parser.add_argument("--propagate", action="store_true", help="피어 블록을 변경 스트림/조회로 계속 수신")
+    parser.add_argument("--index", action="store_true", help="transactions / accounts 색인 갱신")
+    parser.add_argument("--status-file", help="상태 JSON 파일 경로")
+    parser.add_argument("--metrics-port", type=int, help="Prometheus 지표 포트 (127.0.0.1)")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    if args.metrics_port:
+        metrics.enable(port=args.metrics_port)
+
+    node = NodeStorage(args.uri, db_name=args.db, blockfiles=args.blockfiles)
+    seen_index = SeenTxIndex(node.blocks)
+    indexer = None
+    if args.index:
+        from indexer import ChainIndexer
+        indexer = ChainIndexer(node.blocks)
+    # 전체 잔고 상태를 한 번 로드해 동기화·블록 생성에서 계속 갱신 (스냅샷 생성에도 사용)
+    ledger = load_ledger(node.blocks, indexer)
+    # 풀 메모리 인덱스 (RPC 등 다른 프로세스가 넣은 트랜잭션은 refresh로 반영)
+    mempool = Mempool.load(node.tx_pool)
+
+    propagator = None
+    if args.propagate:
+        from propagation import BlockPropagator
+        propagator = BlockPropagator(node.blocks, node.peers, node.tx_pool, args.block_time, ledger=ledger,
+                                     mempool=mempool, indexer=indexer, seen_index=seen_index).start()
+
+    daemon = MiningDaemon(node.blocks, node.peers, node.tx_pool, args.block_time, args.miner_address, ledger=ledger,
+                          mempool=mempool, indexer=indexer, sync_peers=propagator is None, lead_time=args.lead_time, status_path=args.status_file,
+                          seen_index=seen_index)
+    signal.signal(signal.SIGINT, lambda *_: daemon.stop())
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    try:
+        daemon.run()
+    finally:
+        if propagator is not None:
+            propagator.stop()
+        with chain_lock:
+            seen_index.save()
+
+if __name__ == "__main__":
+    main()
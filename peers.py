@@ -0,0 +1,175 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from storage import open_storage
+
+peer_db_name = "blockchain_db"
+peer_poll_workers = 16     # 동시에 조회할 피어 수
+peer_poll_deadline = 5.0   # 라운드당 피어 조회 제한 시간(초)
+
+tip_projection = {"_id": 0, "index": 1, "hash": 1, "timestamp": 1}
+
+# 피어로 등록할 수 있는 URI (peers 컬렉션은 다른 노드가 알려 준 값이므로 로컬 파일을 만드는 sqlite:// 등은 거부)
+peer_uri_schemes = ("mongodb://", "mongodb+srv://")
+
+# 피어 MongoClient 연결 관리자
+# - URI별 클라이언트 1개를 캐시하여 합의 단계마다 재사용 (연결 풀/모니터 스레드 재생성 방지)
+# - 연속 실패 시 클라이언트 폐기, 오래 사용하지 않은 클라이언트는 정리
+class PeerConnectionManager:
+    def __init__(self, max_pool_size=10, server_selection_timeout_ms=3000, connect_timeout_ms=3000,
+                 socket_timeout_ms=10000, idle_timeout=600, max_failures=3, allowed_schemes=None):
+        self.max_pool_size = max_pool_size
+        self.server_selection_timeout_ms = server_selection_timeout_ms
+        self.connect_timeout_ms = connect_timeout_ms
+        self.socket_timeout_ms = socket_timeout_ms
+        self.idle_timeout = idle_timeout      # 초 단위, 이 시간 동안 사용하지 않으면 연결 종료
+        self.max_failures = max_failures      # 연속 실패 허용 횟수 (초과 시 클라이언트 재생성)
+        self.allowed_schemes = tuple(peer_uri_schemes if allowed_schemes is None else allowed_schemes)
+        self._peers = {}                      # uri -> 연결 정보
+        self._lock = threading.Lock()
+
+    # 허용된 URI만 연결 (벤치마크·테스트는 allowed_schemes에 memory:// 를 추가해 프로세스 내 피어 사용)
+    def _connect(self, uri):
+        if not isinstance(uri, str) or not uri.startswith(self.allowed_schemes):
+            raise ValueError(f"허용되지 않는 피어 URI: {uri!r} (허용: {', '.join(self.allowed_schemes)})")
+        return open_storage(
+            uri,
+            maxPoolSize=self.max_pool_size,
+            serverSelectionTimeoutMS=self.server_selection_timeout_ms,
+            connectTimeoutMS=self.connect_timeout_ms,
+            socketTimeoutMS=self.socket_timeout_ms,
+        )
+
+    def get_client(self, uri):
+        self.evict_idle()
+        with self._lock:
+            peer = self._peers.get(uri)
+            if peer is None:
+                peer = {"client": None, "healthy": None, "failures": 0, "last_error": None, "last_used": 0.0, "last_ok": None}
+                self._peers[uri] = peer
+            if peer["client"] is None:
+                peer["client"] = self._connect(uri)
+            peer["last_used"] = time.time()
+            return peer["client"]
+
+    def get_database(self, uri):
+        return self.get_client(uri)[peer_db_name]
+
+    def get_blocks(self, uri):
+        return self.get_database(uri)["blocks"]
+
+    def mark_ok(self, uri):
+        with self._lock:
+            peer = self._peers.get(uri)
+            if peer is not None:
+                peer["healthy"] = True
+                peer["failures"] = 0
+                peer["last_error"] = None
+                peer["last_ok"] = time.time()
+
+    def mark_failed(self, uri, error=None):
+        client = None
+        with self._lock:
+            peer = self._peers.get(uri)
+            if peer is None:
+                return
+            peer["healthy"] = False
+            peer["failures"] += 1
+            peer["last_error"] = str(error) if error is not None else None
+            if peer["failures"] >= self.max_failures:
+                client, peer["client"] = peer["client"], None
+        if client is not None:
+            client.close()
+
+    def is_healthy(self, uri):
+        with self._lock:
+            peer = self._peers.get(uri)
+            return peer is None or peer["healthy"] is not False
+
+    # 피어별 연결 상태
+    def status(self):
+        with self._lock:
+            return [
+                {
+                    "uri": uri,
+                    "connected": peer["client"] is not None,
+                    "healthy": peer["healthy"],
+                    "failures": peer["failures"],
+                    "last_error": peer["last_error"],
+                    "last_used": peer["last_used"],
+                    "last_ok": peer["last_ok"],
+                }
+                for uri, peer in self._peers.items()
+            ]
+
+    # 유휴 연결 정리
+    def evict_idle(self, now=None):
+        now = time.time() if now is None else now
+        idle = []
+        with self._lock:
+            for peer in self._peers.values():
+                if peer["client"] is not None and now - peer["last_used"] > self.idle_timeout:
+                    idle.append(peer["client"])
+                    peer["client"] = None
+        for client in idle:
+            client.close()
+        return len(idle)
+
+    def close(self, uri=None):
+        with self._lock:
+            targets = [uri] if uri is not None else list(self._peers)
+            clients = [self._peers.pop(u)["client"] for u in targets if u in self._peers]
+        for client in clients:
+            if client is not None:
+                client.close()
+
+# 프로세스 공용 연결 관리자
+peer_manager = PeerConnectionManager()
+
+# 피어 체인 끝 블록 조회 (index 내림차순 1건)
+def get_peer_tip(peer_blocks):
+    return peer_blocks.find_one({}, tip_projection, sort=[("index", -1)])
+
+def _poll_peer(manager, peer):
+    return get_peer_tip(manager.get_blocks(peer["uri"]))
+
+# 모든 피어의 체인 끝을 동시에 조회 (deadline 초과 피어는 실패 처리)
+# 반환: (응답한 피어 목록, 실패 목록[(peer, 오류)])
+def poll_peer_tips(peer_docs, manager=None, deadline=None, max_workers=None):
+    manager = peer_manager if manager is None else manager
+    deadline = peer_poll_deadline if deadline is None else deadline
+    peer_docs = list(peer_docs)
+    if not peer_docs:
+        return [], []
+
+    executor = ThreadPoolExecutor(max_workers=min(len(peer_docs), max_workers or peer_poll_workers))
+    futures = {executor.submit(_poll_peer, manager, peer): peer for peer in peer_docs}
+    done, not_done = wait(futures, timeout=deadline)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    tips = []
+    failures = []
+    for future in done:
+        peer = futures[future]
+        try:
+            tip = future.result()
+        except Exception as e:
+            manager.mark_failed(peer["uri"], e)
+            failures.append((peer, e))
+            continue
+        manager.mark_ok(peer["uri"])
+        tips.append({
+            "public_key": peer.get("public_key"),
+            "uri": peer["uri"],
+            "timestamp": peer.get("timestamp"),
+            "index": tip["index"] if tip else 0,
+            "hash": tip["hash"] if tip else "0",
+            "tip_timestamp": tip["timestamp"] if tip else 0,
+        })
+    for future in not_done:
+        peer = futures[future]
+        error = TimeoutError(f"피어 응답 시간 초과 ({deadline}초)")
+        manager.mark_failed(peer["uri"], error)
+        failures.append((peer, error))
+    return tips, failures
@@ -0,0 +1,279 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from blockchain import chain_lock, header_projection, sync_from_peers, maybe_snapshot
+from metrics import span, inc, observe
+from peers import peer_manager as default_peer_manager, get_peer_tip
+
+propagation_poll_interval = 0.25    # 변경 스트림을 쓸 수 없는 피어의 체인 끝 조회 주기(초)
+propagation_max_await_ms = 500      # 변경 스트림 대기 시간 (중지 요청 확인 주기)
+propagation_retry_interval = 2.0    # 피어 연결 실패 후 재시도 대기(초)
+propagation_seen_size = 10000       # 처리한 블록 해시 기억 개수
+peer_refresh_interval = 30.0        # peers 컬렉션 다시 읽는 주기(초)
+
+log = logging.getLogger("xper.propagation")
+
+# 변경 스트림: 새 블록 삽입만, 체인 끝 필드만 전달
+_watch_pipeline = [
+    {"$match": {"operationType": "insert"}},
+    {"$project": {"fullDocument.index": 1, "fullDocument.hash": 1, "fullDocument.timestamp": 1}},
+]
+
+# 피어 1개 구독 스레드
+# - MongoDB 복제셋: blocks 변경 스트림으로 새 블록 알림 수신 (재연결 시 resume token으로 이어서)
+# - 변경 스트림 미지원(단일 서버, memory://, sqlite://): 체인 끝을 주기적으로 조회하여 바뀐 경우만 알림
+class PeerWatcher(threading.Thread):
+    def __init__(self, propagator, peer):
+        super().__init__(name=f"xper-watch-{peer['uri']}", daemon=True)
+        self.propagator = propagator
+        self.peer = peer
+        self.uri = peer["uri"]
+        self.mode = "stream"
+        self._stop_event = threading.Event()
+        self._resume_token = None
+        self._last_hash = None
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        manager = self.propagator.peer_manager
+        while not self._stop_event.is_set():
+            try:
+                peer_blocks = manager.get_blocks(self.uri)
+                # 구독 시작 시점의 체인 끝 먼저 알림 (놓친 블록 따라잡기)
+                self._announce(get_peer_tip(peer_blocks))
+                if self.mode == "stream":
+                    self._watch(peer_blocks)
+                else:
+                    self._poll(peer_blocks)
+                manager.mark_ok(self.uri)
+            except (AttributeError, NotImplementedError) as e:
+                # 변경 스트림이 없는 저장소 (memory://, sqlite://)
+                if self.mode != "stream":
+                    self._failed(e)
+                self.mode = "poll"
+            except OperationFailure as e:
+                # 40573: 복제셋이 아니어서 변경 스트림 사용 불가
+                if self.mode == "stream" and (e.code == 40573 or "replica set" in str(e)):
+                    self.mode = "poll"
+                else:
+                    self._failed(e)
+            except Exception as e:
+                self._failed(e)
+
+    def _failed(self, error):
+        self.propagator.peer_manager.mark_failed(self.uri, error)
+        self._stop_event.wait(propagation_retry_interval)
+
+    def _watch(self, peer_blocks):
+        with peer_blocks.watch(_watch_pipeline, max_await_time_ms=propagation_max_await_ms,
+                               resume_after=self._resume_token) as stream:
+            while not self._stop_event.is_set() and stream.alive:
+                change = stream.try_next()
+                self._resume_token = stream.resume_token
+                if change is not None:
+                    self._announce(change.get("fullDocument"))
+
+    def _poll(self, peer_blocks):
+        while not self._stop_event.is_set():
+            self._announce(get_peer_tip(peer_blocks))
+            self._stop_event.wait(propagation_poll_interval)
+
+    def _announce(self, tip):
+        if not tip or tip.get("hash") == self._last_hash:
+            return
+        self._last_hash = tip["hash"]
+        self.propagator.announce({
+            "public_key": self.peer.get("public_key"),
+            "uri": self.uri,
+            "timestamp": self.peer.get("timestamp"),
+            "index": tip["index"],
+            "hash": tip["hash"],
+            "tip_timestamp": tip.get("timestamp", 0),
+            "received_at": time.time(),
+        })
+
+# 블록 전파 수신기
+# - 피어마다 PeerWatcher 스레드가 새 체인 끝을 알리고, 수신 스레드 1개가 순서대로 반영
+# - 대기열은 피어당 최신 알림 1개만 유지 (반영이 밀리면 같은 피어의 이전 알림은 새 알림으로 교체 → 크기 = 피어 수)
+# - 이미 처리한 해시와 내 체인 끝 이하의 알림은 건너뜀
+# - 반영은 sync_from_peers (헤더 → 본문 검증 → 배치 저장, 분기 처리) 를 chain_lock 안에서 실행
+class BlockPropagator:
+    def __init__(self, blocks, peers, tx_pool, block_time_in_min, peer_manager=None, ledger=None,
+                 mempool=None, indexer=None, pruner=None, on_synced=None, seen_index=None):
+        self.blocks = blocks
+        self.peers = peers
+        self.tx_pool = tx_pool
+        self.block_time_in_min = block_time_in_min
+        self.peer_manager = default_peer_manager if peer_manager is None else peer_manager
+        self.ledger = ledger
+        self.mempool = mempool
+        self.indexer = indexer
+        self.pruner = pruner
+        self.seen_index = seen_index
+        self.on_synced = on_synced            # 체인이 바뀐 뒤 호출 (tip 알림)
+        self.watchers = {}                    # uri -> PeerWatcher
+        self._pending = OrderedDict()         # uri -> 최신 알림
+        self._seen = OrderedDict()            # 처리한 블록 해시 (LRU)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.stats = {"announced": 0, "coalesced": 0, "duplicates": 0, "stale": 0, "synced": 0, "failed": 0}
+
+    # ---------- 알림 수신 (PeerWatcher 스레드에서 호출, 막히지 않음) ----------
+
+    def announce(self, tip):
+        inc("xper_block_announcements_total")
+        with self._lock:
+            self.stats["announced"] += 1
+            if tip["hash"] in self._seen:
+                self.stats["duplicates"] += 1
+                inc("xper_block_announcements_skipped_total", reason="duplicate")
+                return
+            if tip["uri"] in self._pending:
+                self.stats["coalesced"] += 1
+                inc("xper_block_announcements_skipped_total", reason="coalesced")
+            self._pending.pop(tip["uri"], None)
+            self._pending[tip["uri"]] = tip
+        self._wakeup.set()
+
+    def _mark_seen(self, block_hash):
+        with self._lock:
+            self._seen[block_hash] = True
+            self._seen.move_to_end(block_hash)
+            while len(self._seen) > propagation_seen_size:
+                self._seen.popitem(last=False)
+
+    def _take_pending(self):
+        with self._lock:
+            tips = list(self._pending.values())
+            self._pending.clear()
+            self._wakeup.clear()
+        return tips
+
+    # ---------- 반영 ----------
+
+    # 대기 중인 알림 반영, 내 체인이 바뀌었는지 반환
+    def process_pending(self):
+        tips = [tip for tip in self._take_pending() if tip["hash"] not in self._seen]
+        if not tips:
+            return False
+
+        my_tip = self.blocks.find_one({}, header_projection, sort=[("index", -1)])
+        my_index = my_tip["index"] if my_tip else -1
+        candidates = []
+        for tip in tips:
+            if tip["index"] <= my_index:
+                with self._lock:
+                    self.stats["stale"] += 1
+                inc("xper_block_announcements_skipped_total", reason="stale")
+                self._mark_seen(tip["hash"])
+            else:
+                candidates.append(tip)
+        if not candidates:
+            return False
+
+        try:
+            with chain_lock, span("propagation_sync"):
+                changed = sync_from_peers(self.blocks, candidates, self.tx_pool, self.block_time_in_min,
+                                          ledger=self.ledger, mempool=self.mempool, peer_manager=self.peer_manager,
+                                          pruner=self.pruner, seen_index=self.seen_index)
+                if changed:
+                    if self.indexer is not None:
+                        self.indexer.run()
+                    maybe_snapshot(self.blocks, self.ledger, self.indexer)
+        except PyMongoError as e:
+            with self._lock:
+                self.stats["failed"] += 1
+            for tip in candidates:
+                self.peer_manager.mark_failed(tip["uri"], e)
+            return False
+        except Exception as e:
+            # 잘못된 블록 등 (인코딩 오류, 필드 누락) → 같은 체인 끝은 다시 시도하지 않음
+            log.warning("블록 전파 반영 실패: %s", e)
+            with self._lock:
+                self.stats["failed"] += 1
+            for tip in candidates:
+                self.peer_manager.mark_failed(tip["uri"], e)
+                self._mark_seen(tip["hash"])
+            return False
+
+        # 검증 실패한 체인 끝도 다시 시도하지 않음 (피어가 새 블록을 만들면 새 해시로 다시 알림)
+        for tip in candidates:
+            self._mark_seen(tip["hash"])
+        if changed:
+            now = time.time()
+            with self._lock:
+                self.stats["synced"] += 1
+            for tip in candidates:
+                observe("xper_propagation_seconds", now - tip["tip_timestamp"], source="block")
+                observe("xper_propagation_seconds", now - tip["received_at"], source="announcement")
+            if self.on_synced is not None:
+                self.on_synced(self.blocks.find_one({}, header_projection, sort=[("index", -1)]))
+        return changed
+
+    # ---------- 구독 관리 ----------
+
+    # peers 컬렉션 기준으로 구독 스레드 추가/정리
+    def refresh_peers(self):
+        peer_docs = {peer["uri"]: peer for peer in self.peers.find({}, {"_id": 0}) if peer.get("uri")}
+        for uri in list(self.watchers):
+            if uri not in peer_docs or not self.watchers[uri].is_alive():
+                self.watchers.pop(uri).stop()
+        for uri, peer in peer_docs.items():
+            if uri not in self.watchers:
+                watcher = PeerWatcher(self, peer)
+                self.watchers[uri] = watcher
+                watcher.start()
+
+    # 수신 스레드 (예외가 나도 종료하지 않고 다음 알림 처리)
+    def _run(self):
+        next_refresh = 0.0
+        while not self._stop_event.is_set():
+            try:
+                if time.time() >= next_refresh:
+                    next_refresh = time.time() + peer_refresh_interval
+                    self.refresh_peers()
+                if self._wakeup.wait(timeout=1.0):
+                    self.process_pending()
+            except Exception:
+                log.exception("블록 전파 수신 오류")
+                with self._lock:
+                    self.stats["failed"] += 1
+                self._stop_event.wait(propagation_retry_interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="xper-propagation", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop_event.set()
+        self._wakeup.set()
+        for watcher in self.watchers.values():
+            watcher.stop()
+        for watcher in self.watchers.values():
+            watcher.join(timeout)
+        self.watchers.clear()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def status(self):
+        with self._lock:
+            stats = dict(self.stats)
+            pending = len(self._pending)
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "pending": pending,
+            "peers": {uri: watcher.mode for uri, watcher in self.watchers.items()},
+            **stats,
+        }
@@ -0,0 +1,163 @@
+import os, struct, zlib
+
+from pymongo import UpdateOne
+
+from encoding import encode_block, decode_block
+
+prune_keep_last = 10000     # 본문을 유지할 최근 블록 수
+prune_batch_size = 500      # 한 번에 보관(archive)할 블록 수
+archive_bucket_size = 1000  # 파일 보관소: 파일 1개에 담을 블록 번호 범위
+archive_level = 6           # zlib 압축 수준
+
+# 블록 1개를 압축 바이트로 변환 (정규 바이너리 인코딩 + zlib)
+def pack_archived_block(block):
+    block = {k: v for k, v in block.items() if k != "_id"}
+    return zlib.compress(encode_block(block), archive_level)
+
+def unpack_archived_block(data):
+    return decode_block(zlib.decompress(bytes(data)))
+
+# 콜드 컬렉션 보관소 (기본: blocks_archive)
+class CollectionArchive:
+    def __init__(self, collection):
+        self.collection = collection
+        self._indexed = False
+
+    def ensure_indexes(self):
+        if not self._indexed:
+            self.collection.create_index("index", unique=True)
+            self._indexed = True
+
+    def put_many(self, block_list):
+        if not block_list:
+            return 0
+        self.ensure_indexes()
+        ops = [
+            UpdateOne({"index": blk["index"]}, {"$set": {"hash": blk["hash"], "data": pack_archived_block(blk)}}, upsert=True)
+            for blk in block_list
+        ]
+        self.collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    def get(self, index):
+        doc = self.collection.find_one({"index": index}, {"_id": 0, "data": 1})
+        return unpack_archived_block(doc["data"]) if doc else None
+
+# 로컬 파일 보관소
+# - archive_bucket_size 블록 번호 범위마다 파일 1개, 레코드 = [번호 8바이트][길이 4바이트][압축 블록]
+# - 이어쓰기만 하며, 같은 번호가 여러 번 기록되면 (재구성 후 다시 보관) 마지막 레코드를 사용
+class FileArchive:
+    _record = struct.Struct(">QI")
+
+    def __init__(self, path, bucket_size=None):
+        self.path = path
+        self.bucket_size = archive_bucket_size if bucket_size is None else bucket_size
+        os.makedirs(path, exist_ok=True)
+
+    def _bucket_path(self, index):
+        return os.path.join(self.path, f"blocks_{index // self.bucket_size:08d}.zar")
+
+    def put_many(self, block_list):
+        buckets = {}
+        for blk in block_list:
+            buckets.setdefault(self._bucket_path(blk["index"]), []).append(blk)
+        for path, bucket in buckets.items():
+            with open(path, "ab") as f:
+                for blk in bucket:
+                    data = pack_archived_block(blk)
+                    f.write(self._record.pack(blk["index"], len(data)) + data)
+                f.flush()
+                os.fsync(f.fileno())
+        return len(block_list)
+
+    def get(self, index):
+        path = self._bucket_path(index)
+        if not os.path.exists(path):
+            return None
+        found = None
+        with open(path, "rb") as f:
+            while True:
+                head = f.read(self._record.size)
+                if len(head) < self._record.size:
+                    break
+                block_index, length = self._record.unpack(head)
+                if block_index == index:
+                    found = f.read(length)
+                else:
+                    f.seek(length, os.SEEK_CUR)
+        return unpack_archived_block(found) if found is not None else None
+
+def get_archive(blocks):
+    return CollectionArchive(blocks.database["blocks_archive"])
+
+# 블록 가지치기(pruning)
+# - 최근 keep_last개 블록의 본문은 blocks 컬렉션에 유지
+# - 그보다 오래된 블록은 본문을 압축 보관소로 옮기고 헤더만 남김 (pruned=True, tx_count 기록)
+# - 보관소 기록이 끝난 배치만 본문을 삭제하므로 중간에 중단되어도 다시 실행하면 이어서 처리
+# - 기록한 블록을 바꿀 수 없는 저장소(블록 파일, supports_pruning=False)는 지원하지 않음
+class BlockPruner:
+    def __init__(self, blocks, keep_last=None, archive=None, batch_size=None):
+        if not getattr(blocks, "supports_pruning", True):
+            raise ValueError("블록 파일 저장소(blockfiles)는 가지치기를 지원하지 않습니다.")
+        self.blocks = blocks
+        self.keep_last = prune_keep_last if keep_last is None else keep_last
+        self.archive = get_archive(blocks) if archive is None else archive
+        self.batch_size = prune_batch_size if batch_size is None else batch_size
+        self._indexed = False
+
+    def ensure_indexes(self):
+        if not self._indexed:
+            self.blocks.create_index("index", unique=True)
+            self.blocks.create_index([("pruned", 1), ("index", 1)])
+            self._indexed = True
+
+    # 가지치기 실행, 처리한 블록 수 반환
+    def prune(self):
+        tip = self.blocks.find_one({}, {"_id": 0, "index": 1}, sort=[("index", -1)])
+        if tip is None:
+            return 0
+        cutoff = tip["index"] - self.keep_last
+        if cutoff < 1:
+            return 0
+        self.ensure_indexes()
+
+        cursor = self.blocks.find(
+            {"index": {"$lte": cutoff}, "pruned": {"$ne": True}}, {"_id": 0}
+        ).sort("index").batch_size(self.batch_size)
+
+        pruned = 0
+        batch = []
+        for blk in cursor:
+            batch.append(blk)
+            if len(batch) >= self.batch_size:
+                pruned += self._prune_batch(batch)
+                batch = []
+        if batch:
+            pruned += self._prune_batch(batch)
+        return pruned
+
+    def _prune_batch(self, batch):
+        self.archive.put_many(batch)
+        ops = [
+            UpdateOne(
+                {"index": blk["index"]},
+                {"$unset": {"transactions": ""}, "$set": {"pruned": True, "tx_count": len(blk.get("transactions", []))}},
+            )
+            for blk in batch
+        ]
+        self.blocks.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    def get_block(self, index):
+        return load_block(self.blocks, index, self.archive)
+
+# 블록 조회 (가지치기된 블록은 보관소에서 본문 복원, 보관소에 없으면 헤더만 반환)
+def load_block(blocks, index, archive=None):
+    blk = blocks.find_one({"index": index}, {"_id": 0})
+    if blk is not None and not blk.get("pruned"):
+        return blk
+    archive = get_archive(blocks) if archive is None else archive
+    archived = archive.get(index)
+    if archived is not None and (blk is None or archived["hash"] == blk["hash"]):
+        return archived
+    return blk
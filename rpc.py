@@ -0,0 +1,444 @@
+import argparse, asyncio, http.client, json, logging, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
+
+from blockchain import header_projection, admit_transaction, TransactionRejected
+from mempool import Mempool
+from pruner import load_block
+from snapshots import get_snapshots, latest_snapshot
+from storage import NodeStorage
+
+rpc_host = "127.0.0.1"
+rpc_port = 8765
+rpc_workers = 8                 # DB 조회를 처리할 스레드 수
+rpc_max_body = 1_000_000        # 요청 본문 최대 크기(바이트)
+rpc_max_batch = 100             # 일괄 요청 최대 개수
+rpc_tip_refresh = 0.5           # 체인 끝 확인 주기(초), 이 주기 안의 요청은 캐시된 체인 끝 사용
+rpc_block_cache_size = 1024
+rpc_history_limit = 100
+
+log = logging.getLogger("xper.rpc")
+
+class RPCError(Exception):
+    def __init__(self, code, message, data=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+PARSE_ERROR = -32700
+TX_REJECTED = -32000
+NOT_FOUND = -32001
+
+# 노드 조회 서비스 (메모리 캐시)
+# - 체인 끝(과 색인기 커서)은 rpc_tip_refresh초마다 1번만 조회, 바뀌면 잔고/내역/통계 캐시 비움
+# - 블록은 LRU 캐시 (체인 재구성 시 비움)
+# → 같은 블록 높이에서 반복되는 화면 갱신은 DB를 다시 조회하지 않음
+class NodeService:
+    def __init__(self, blocks, tx_pool, accounts, transactions, mempool=None, block_cache_size=None, tip_refresh=None):
+        self.blocks = blocks
+        self.tx_pool = tx_pool
+        self.accounts = accounts
+        self.transactions = transactions
+        self.mempool = mempool
+        self.block_cache_size = rpc_block_cache_size if block_cache_size is None else block_cache_size
+        self.tip_refresh = rpc_tip_refresh if tip_refresh is None else tip_refresh
+        self._lock = threading.Lock()
+        self._tip = None
+        self._indexed = None                # 색인기 커서 높이 (accounts/transactions 반영 시점)
+        self._tip_checked = 0.0
+        self.sync_state = blocks.database["sync_state"]
+        self._blocks = OrderedDict()        # index -> 블록
+        self._block_hashes = {}             # hash -> index
+        self._balances = {}
+        self._history = {}
+        self._stats = None
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self.methods = {
+            "get_tip": self.get_tip,
+            "get_balance": self.get_balance,
+            "get_block": self.get_block,
+            "get_history": self.get_history,
+            "get_stats": self.get_stats,
+            "submit_tx": self.submit_tx,
+        }
+
+    @classmethod
+    def from_storage(cls, node, mempool=None):
+        return cls(node.blocks, node.tx_pool, node.accounts, node.transactions, mempool=mempool)
+
+    # ---------- 캐시 ----------
+
+    def _cached(self, cache, key, load):
+        with self._lock:
+            if key in cache:
+                self.cache_stats["hits"] += 1
+                return cache[key]
+            self.cache_stats["misses"] += 1
+        value = load()
+        with self._lock:
+            cache[key] = value
+        return value
+
+    def _cache_block(self, blk):
+        with self._lock:
+            self._blocks[blk["index"]] = blk
+            self._blocks.move_to_end(blk["index"])
+            self._block_hashes[blk["hash"]] = blk["index"]
+            while len(self._blocks) > self.block_cache_size:
+                _, old = self._blocks.popitem(last=False)
+                self._block_hashes.pop(old["hash"], None)
+
+    def tip(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._tip is not None and now - self._tip_checked < self.tip_refresh:
+                return self._tip
+        tip = self.blocks.find_one({}, header_projection, sort=[("index", -1)])
+        cursor = self.sync_state.find_one({"_id": "indexer"}, {"_id": 0, "height": 1})
+        indexed = cursor["height"] if cursor else None
+        with self._lock:
+            previous = self._tip
+            self._tip_checked = now
+            if tip != previous or indexed != self._indexed:
+                self._tip = tip
+                self._indexed = indexed
+                self._balances.clear()
+                self._history.clear()
+                self._stats = None
+                # 단순히 이어진 블록이 아니면 (재구성) 블록 캐시도 비움
+                if previous is not None and (tip is None or tip.get("previous_hash") != previous["hash"]):
+                    self._blocks.clear()
+                    self._block_hashes.clear()
+        return tip
+
+    def pool_size(self):
+        if self.mempool is not None:
+            return len(self.mempool)
+        return self.tx_pool.estimated_document_count()
+
+    # ---------- 조회 ----------
+
+    def get_tip(self):
+        tip = self.tip()
+        return {"index": tip["index"], "hash": tip["hash"], "timestamp": tip["timestamp"]} if tip else None
+
+    def get_balance(self, address):
+        if not isinstance(address, str) or not address:
+            raise RPCError(INVALID_PARAMS, "address가 필요합니다.")
+        self.tip()
+
+        def load():
+            account = self.accounts.find_one({"address": address}, {"_id": 0, "balance": 1})
+            return account.get("balance", 0.0) if account else 0.0
+        return {"address": address, "balance": self._cached(self._balances, address, load)}
+
+    def get_block(self, index=None, hash=None):
+        if index is None and hash is None:
+            raise RPCError(INVALID_PARAMS, "index 또는 hash가 필요합니다.")
+        self.tip()
+        with self._lock:
+            if index is None:
+                index = self._block_hashes.get(hash)
+            blk = self._blocks.get(index) if index is not None else None
+            if blk is not None and (hash is None or blk["hash"] == hash):
+                self._blocks.move_to_end(index)
+                self.cache_stats["hits"] += 1
+                return blk
+            self.cache_stats["misses"] += 1
+        if index is None:
+            header = self.blocks.find_one({"hash": hash}, {"_id": 0, "index": 1})
+            if header is None:
+                raise RPCError(NOT_FOUND, "블록을 찾을 수 없습니다.")
+            index = header["index"]
+        blk = load_block(self.blocks, int(index))
+        if blk is None or (hash is not None and blk["hash"] != hash):
+            raise RPCError(NOT_FOUND, "블록을 찾을 수 없습니다.")
+        blk.pop("_id", None)
+        self._cache_block(blk)
+        return blk
+
+    def get_history(self, address, limit=50, skip=0):
+        if not isinstance(address, str) or not address:
+            raise RPCError(INVALID_PARAMS, "address가 필요합니다.")
+        limit = max(1, min(int(limit), rpc_history_limit))
+        skip = max(0, int(skip))
+        self.tip()
+
+        def load():
+            query = {"$or": [{"sender": address}, {"recipient": address}]}
+            return list(self.transactions.find(query, {"_id": 0}).sort("timestamp", -1).skip(skip).limit(limit))
+        return self._cached(self._history, (address, limit, skip), load)
+
+    def get_stats(self):
+        tip = self.tip()
+        with self._lock:
+            stats = self._stats
+        if stats is None:
+            supply = list(self.accounts.aggregate([{"$group": {"_id": None, "total_supply": {"$sum": "$balance"}}}]))
+            snapshot = latest_snapshot(get_snapshots(self.blocks))
+            stats = {
+                "height": tip["index"] if tip else 0,
+                "tip_hash": tip["hash"] if tip else "0",
+                "total_supply": supply[0]["total_supply"] if supply else 0.0,
+                "wallet_count": self.accounts.count_documents({}),
+                "top_accounts": list(self.accounts.find({}, {"_id": 0, "address": 1, "balance": 1}).sort("balance", -1).limit(10)),
+                "latest_snapshot": snapshot["height"] if snapshot else None,
+            }
+            with self._lock:
+                self._stats = stats
+        with self._lock:
+            cache = dict(self.cache_stats, blocks=len(self._blocks))
+        return dict(stats, pool_size=self.pool_size(), cache=cache)
+
+    # ---------- 제출 ----------
+
+    def submit_tx(self, tx):
+        if not isinstance(tx, dict):
+            raise RPCError(INVALID_PARAMS, "tx 객체가 필요합니다.")
+        try:
+            tx_hash = admit_transaction(self.tx_pool, tx, accounts=self.accounts, mempool=self.mempool, blocks=self.blocks)
+        except TransactionRejected as e:
+            raise RPCError(TX_REJECTED, str(e), {"reason": e.reason})
+        return {"tx_hash": tx_hash}
+
+    def call(self, method, params=None):
+        handler = self.methods.get(method)
+        if handler is None:
+            raise RPCError(METHOD_NOT_FOUND, f"알 수 없는 메서드: {method}")
+        try:
+            if params is None:
+                return handler()
+            if isinstance(params, list):
+                return handler(*params)
+            if isinstance(params, dict):
+                return handler(**params)
+        except TypeError as e:
+            raise RPCError(INVALID_PARAMS, str(e))
+        raise RPCError(INVALID_PARAMS, "params는 배열 또는 객체여야 합니다.")
+
+# ---------- JSON-RPC 2.0 / HTTP 서버 (asyncio) ----------
+
+def _error(request_id, code, message, data=None):
+    error = {"code": code, "message": message}
+    if data is not None:
+        error["data"] = data
+    return {"jsonrpc": "2.0", "id": request_id, "error": error}
+
+class RPCServer:
+    def __init__(self, service, host=None, port=None, workers=None):
+        self.service = service
+        self.host = rpc_host if host is None else host
+        self.port = rpc_port if port is None else port
+        self.executor = ThreadPoolExecutor(max_workers=workers or rpc_workers, thread_name_prefix="xper-rpc")
+        self._server = None
+
+    async def _dispatch(self, request):
+        if not isinstance(request, dict) or request.get("jsonrpc") != "2.0" or not isinstance(request.get("method"), str):
+            return _error(request.get("id") if isinstance(request, dict) else None, INVALID_REQUEST, "잘못된 요청")
+        request_id = request.get("id")
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, partial(self.service.call, request["method"], request.get("params")))
+        except RPCError as e:
+            response = _error(request_id, e.code, e.message, e.data)
+        except Exception:
+            # 자세한 오류는 로그에만 남기고 클라이언트에는 일반 메시지만 전달
+            log.exception("RPC 처리 오류: %s", request["method"])
+            response = _error(request_id, INTERNAL_ERROR, "내부 오류")
+        else:
+            response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+        return response if "id" in request else None    # 알림(id 없음)은 응답하지 않음
+
+    # 본문 처리: 단일 요청 또는 일괄 요청(배열, 동시 처리 후 순서대로 응답)
+    async def handle_payload(self, body):
+        try:
+            payload = json.loads(body)
+        except (ValueError, UnicodeDecodeError):
+            return _error(None, PARSE_ERROR, "JSON 파싱 실패")
+        if isinstance(payload, list):
+            if not payload or len(payload) > rpc_max_batch:
+                return _error(None, INVALID_REQUEST, f"일괄 요청은 1~{rpc_max_batch}개")
+            responses = await asyncio.gather(*(self._dispatch(request) for request in payload))
+            return [response for response in responses if response is not None] or None
+        return await self._dispatch(payload)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "bad request"}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                if method == "GET" and path in ("/", "/health"):
+                    await self._respond(writer, 200, {"ok": True, "tip": await asyncio.get_running_loop().run_in_executor(
+                        self.executor, self.service.get_tip)}, keep_alive)
+                elif method == "POST" and path in ("/", "/rpc"):
+                    try:
+                        length = int(headers.get("content-length", 0) or 0)
+                    except ValueError:
+                        length = -1
+                    if length < 0:
+                        await self._respond(writer, 400, _error(None, PARSE_ERROR, "잘못된 Content-Length"), keep_alive=False)
+                        break
+                    if length > rpc_max_body:
+                        await self._respond(writer, 413, _error(None, INVALID_REQUEST, "요청 본문이 너무 큽니다."), keep_alive=False)
+                        break
+                    body = await reader.readexactly(length)
+                    response = await self.handle_payload(body)
+                    await self._respond(writer, 200 if response is not None else 204, response, keep_alive)
+                else:
+                    await self._respond(writer, 404, {"error": "not found"}, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode() if payload is not None else b""
+        reason = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large"}[status]
+        head = (
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        log.info("RPC 서버 시작: http://%s:%d", self.host, self.port)
+        return self._server
+
+    async def serve_forever(self):
+        server = await self.start()
+        async with server:
+            await server.serve_forever()
+
+    # 별도 스레드에서 실행 (다른 프로그램에 내장할 때)
+    def start_in_thread(self):
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+
+        thread = threading.Thread(target=run, name="xper-rpc", daemon=True)
+        thread.start()
+        started.wait()
+        self._loop = loop
+        return thread
+
+    def stop(self):
+        loop = getattr(self, "_loop", None)
+        if loop is not None and self._server is not None:
+            loop.call_soon_threadsafe(self._server.close)
+            loop.call_soon_threadsafe(loop.stop)
+        self.executor.shutdown(wait=False)
+
+# ---------- 클라이언트 (지갑/탐색기용) ----------
+
+# 연결을 유지하는 JSON-RPC 클라이언트
+# client.call("get_balance", address=...) / client.batch([("get_tip", {}), ("get_stats", {})])
+class RPCClient:
+    def __init__(self, url, timeout=5.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or rpc_host
+        self.port = parts.port or rpc_port
+        self.path = parts.path or "/"
+        self.timeout = timeout
+        self._conn = None
+        self._next_id = 0
+
+    def _post(self, payload):
+        body = json.dumps(payload).encode()
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request("POST", self.path, body, {"Content-Type": "application/json"})
+                response = self._conn.getresponse()
+                data = response.read()
+                return json.loads(data) if data else None
+            except (http.client.HTTPException, ConnectionError):
+                self.close()    # 서버가 끊은 유휴 연결 → 한 번 다시 연결
+                if attempt:
+                    raise
+
+    def _request(self, method, params):
+        self._next_id += 1
+        return {"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params}
+
+    @staticmethod
+    def _result(response):
+        if "error" in response:
+            error = response["error"]
+            raise RPCError(error["code"], error["message"], error.get("data"))
+        return response["result"]
+
+    def call(self, method, **params):
+        return self._result(self._post(self._request(method, params)))
+
+    # 여러 요청을 한 번에 보내고 요청 순서대로 결과 반환 (오류는 RPCError 객체로)
+    def batch(self, calls):
+        requests = [self._request(method, params or {}) for method, params in calls]
+        by_id = {response.get("id"): response for response in self._post(requests)}
+        results = []
+        for request in requests:
+            try:
+                results.append(self._result(by_id[request["id"]]))
+            except RPCError as e:
+                results.append(e)
+        return results
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="XperChain 노드 RPC 서버")
+    parser.add_argument("--uri", default="mongodb://localhost:27017", help="저장소 URI (mongodb://, sqlite://, memory://)")
+    parser.add_argument("--db", default="blockchain_db")
+    parser.add_argument("--blockfiles", help="블록 파일 저장 경로 (채굴 노드가 기록하는 저장소를 읽기 전용으로 조회)")
+    parser.add_argument("--host", default=rpc_host)
+    parser.add_argument("--port", type=int, default=rpc_port)
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    node = NodeStorage(args.uri, db_name=args.db, blockfiles=args.blockfiles, blockfiles_readonly=True)
+    server = RPCServer(NodeService.from_storage(node, mempool=Mempool.load(node.tx_pool)), host=args.host, port=args.port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import hashlib, math
+from collections import deque
+
+from encoding import compute_tx_hash
+from metrics import inc, set_gauge
+from pruner import load_block
+
+seen_recent_blocks = 1000           # 정확한 tx_hash 집합을 유지할 최근 블록 수
+seen_bloom_capacity = 1_000_000     # 블룸 필터 예상 트랜잭션 수 (초과하면 오탐률 증가)
+seen_bloom_error_rate = 0.001       # 예상 수만큼 넣었을 때의 오탐률
+seen_save_interval = 100            # 블록 몇 개마다 블룸 필터를 저장할지
+seen_chunk_bytes = 1 << 20          # 저장 문서 1개에 담을 비트 배열 크기 (BSON 16MB 제한)
+seen_batch_size = 500               # 재구성 시 한 번에 읽을 블록 수
+
+_indexed_blocks = set()             # transactions.tx_hash 인덱스 생성을 마친 blocks 컬렉션 (프로세스당 1회)
+
+# 내 체인(upto 이하)에 포함된 tx_hash 조회 (블룸 필터 양성 확인, 재생 검증의 중복 확인)
+# - 색인기가 반영한 높이까지: 색인된 transactions 컬렉션 (가지치기된 블록 포함)
+# - 그 이후 (색인되지 않은 최근 블록): blocks의 transactions.tx_hash 인덱스, 번호 범위로 제한
+def find_included(blocks, tx_hashes, upto):
+    wanted = set(tx_hashes)
+    if not wanted or upto <= 0:
+        return set()
+    db = blocks.database
+    query = {"tx_hash": {"$in": list(wanted)}, "block_index": {"$lte": upto}}
+    rows = list(db["transactions"].find(query, {"_id": 0, "tx_hash": 1, "block_index": 1, "block_hash": 1}))
+    found = set()
+    if rows:
+        # 재구성 후 색인기가 아직 되돌리지 않은 행은 제외 (현재 체인의 블록 해시와 비교)
+        current = {
+            blk["index"]: blk["hash"]
+            for blk in blocks.find({"index": {"$in": list({row["block_index"] for row in rows})}}, {"_id": 0, "index": 1, "hash": 1})
+        }
+        found = {row["tx_hash"] for row in rows if current.get(row["block_index"]) == row.get("block_hash")}
+
+    # 색인기 커서가 현재 체인 위에 있을 때만 그 높이까지 색인된 것으로 봄
+    cursor = db["sync_state"].find_one({"_id": "indexer"}, {"_id": 0, "height": 1, "hash": 1})
+    indexed = 0
+    if cursor and cursor["height"] > 0:
+        tip = blocks.find_one({"index": cursor["height"]}, {"_id": 0, "hash": 1})
+        if tip is not None and tip["hash"] == cursor["hash"]:
+            indexed = min(cursor["height"], upto)
+    rest = wanted - found
+    if rest and upto > indexed:
+        key = (id(db), blocks.name)
+        if key not in _indexed_blocks:
+            blocks.create_index("transactions.tx_hash")
+            _indexed_blocks.add(key)
+        query = {"index": {"$gt": indexed, "$lte": upto}, "transactions.tx_hash": {"$in": list(rest)}}
+        for blk in blocks.find(query, {"_id": 0, "transactions.tx_hash": 1}):
+            found.update(tx.get("tx_hash") for tx in blk.get("transactions", []))
+    return found & wanted
+
+# 블룸 필터 (비트 배열 + 이중 해싱)
+# 메모리: capacity * -ln(error_rate) / ln(2)^2 비트 (기본 100만 개, 0.1% → 약 1.8MB)
+class BloomFilter:
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8) if bits is None else bits
+        self.count = count
+        self.dirty = set()          # 마지막 저장 이후 바뀐 청크 번호
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+            self.dirty.add((pos >> 3) // seen_chunk_bytes)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    # 현재 채워진 개수 기준 예상 오탐률
+    def estimated_error_rate(self):
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+# 본 트랜잭션 색인 (재전송 방지)
+# - 최근 seen_recent_blocks개 블록의 tx_hash는 정확한 집합(dict)으로 확인
+# - 그 이전 전체 이력은 블룸 필터로 확인: 음성이면 포함된 적 없음(O(1)), 양성이면 인덱스 조회 1회로 확인 (find_included)
+#   → 오탐은 조회 1회로 끝나고 유효한 트랜잭션을 거부하지 않음
+# - 블룸 필터는 seen_index 컬렉션에 청크로 저장 (저장한 높이/해시 포함), 시작 시 저장 이후 블록만 추가
+#   체인이 저장 시점과 다르게 재구성되었거나 설정이 바뀌었으면 blocks에서 다시 만듦 (rebuild)
+# - 재구성(분기)으로 빠진 블록의 비트는 남지만 확인 조회에서 걸러짐
+# - 스냅샷 빠른 동기화로 시작한 노드는 스냅샷 이전 본문이 없으므로 그 이후 이력만 포함
+# 블록 저장과 같은 잠금(chain_lock) 안에서 사용
+class SeenTxIndex:
+    def __init__(self, blocks, recent_blocks=None, capacity=None, error_rate=None, archive=None):
+        db = blocks.database
+        self.blocks = blocks
+        self.store = db["seen_index"]
+        self.archive = archive
+        self.recent_size = seen_recent_blocks if recent_blocks is None else recent_blocks
+        self.capacity = seen_bloom_capacity if capacity is None else capacity
+        self.error_rate = seen_bloom_error_rate if error_rate is None else error_rate
+        self.bloom = None
+        self.recent = {}                # tx_hash -> 블록 번호
+        self.recent_blocks = deque()    # (블록 번호, 블록 해시, tx_hash 목록)
+        self.height = 0
+        self.tip_hash = "0"
+        self.saved_height = 0
+
+    # ---------- 저장/불러오기 ----------
+
+    def _ensure_loaded(self):
+        if self.bloom is None:
+            self.load()
+
+    def load(self):
+        meta = self.store.find_one({"_id": "meta"})
+        if (
+            meta is None
+            or meta["capacity"] != self.capacity
+            or meta["error_rate"] != self.error_rate
+            or not self._hash_matches(meta["height"], meta["tip_hash"])
+        ):
+            self.rebuild()
+            return
+        bloom = BloomFilter(self.capacity, self.error_rate, count=meta["count"])
+        for doc in self.store.find({"chunk": {"$exists": True}}):
+            start = doc["chunk"] * seen_chunk_bytes
+            data = bytes(doc["data"])
+            bloom.bits[start:start + len(data)] = data
+        self.bloom = bloom
+        self.height = self.saved_height = meta["height"]
+        self.tip_hash = meta["tip_hash"]
+        # 최근 블록 집합은 저장하지 않으므로 다시 읽음 → 이후 저장 시점 이후 블록 추가
+        start = max(0, self.height - self.recent_size)
+        self.height, self.tip_hash = start, self._hash_at(start)
+        self._catch_up(add_to_bloom=False, until=meta["height"])
+        self._catch_up()
+
+    # 바뀐 청크 먼저 기록한 뒤 높이 기록 (중간에 멈춰도 블룸 필터는 저장된 높이의 상위 집합)
+    def save(self):
+        if self.bloom is None:
+            return
+        for chunk in sorted(self.bloom.dirty):
+            start = chunk * seen_chunk_bytes
+            self.store.update_one(
+                {"_id": f"bloom:{chunk}"}, {"$set": {"chunk": chunk, "data": bytes(self.bloom.bits[start:start + seen_chunk_bytes])}}, upsert=True
+            )
+        self.bloom.dirty.clear()
+        self.store.update_one({"_id": "meta"}, {"$set": {
+            "height": self.height,
+            "tip_hash": self.tip_hash,
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "count": self.bloom.count,
+        }}, upsert=True)
+        self.saved_height = self.height
+
+    def _maybe_save(self):
+        if self.height - self.saved_height >= seen_save_interval or self.height < self.saved_height:
+            self.save()
+
+    # 체인 전체에서 다시 만들기
+    def rebuild(self):
+        self.bloom = BloomFilter(self.capacity, self.error_rate)
+        self.bloom.dirty = set(range((len(self.bloom.bits) + seen_chunk_bytes - 1) // seen_chunk_bytes))
+        self.recent.clear()
+        self.recent_blocks.clear()
+        self.height, self.tip_hash = 0, "0"
+        self.store.delete_many({"chunk": {"$exists": True}})
+        self._catch_up()
+        self.save()
+        return self.bloom.count
+
+    # ---------- 체인 반영 ----------
+
+    def _hash_at(self, index):
+        if index <= 0:
+            return "0"
+        blk = self.blocks.find_one({"index": index}, {"_id": 0, "hash": 1})
+        return blk["hash"] if blk else None
+
+    def _hash_matches(self, height, block_hash):
+        return height <= 0 or self._hash_at(height) == block_hash
+
+    # 현재 높이 이후 블록을 순서대로 추가 (until까지)
+    def _catch_up(self, add_to_bloom=True, until=None):
+        while until is None or self.height < until:
+            query = {"index": {"$gt": self.height}} if until is None else {"index": {"$gt": self.height, "$lte": until}}
+            batch = list(self.blocks.find(query, {"_id": 0}).sort("index").limit(seen_batch_size))
+            if not batch:
+                break
+            for blk in batch:
+                if "transactions" not in blk:
+                    blk = load_block(self.blocks, blk["index"], self.archive) or blk
+                self._add(blk, add_to_bloom)
+
+    def _add(self, blk, add_to_bloom=True):
+        tx_hashes = [tx.get("tx_hash") or compute_tx_hash(tx) for tx in blk.get("transactions", []) if tx["sender"] != "SYSTEM"]
+        for tx_hash in tx_hashes:
+            if add_to_bloom:
+                self.bloom.add(tx_hash)
+            self.recent[tx_hash] = blk["index"]
+        self.recent_blocks.append((blk["index"], blk["hash"], tx_hashes))
+        while len(self.recent_blocks) > self.recent_size:
+            index, _, old = self.recent_blocks.popleft()
+            for tx_hash in old:
+                if self.recent.get(tx_hash) == index:
+                    del self.recent[tx_hash]
+        self.height, self.tip_hash = blk["index"], blk["hash"]
+
+    # 새로 저장한 블록 반영 (내 체인 끝에 이어지지 않으면 sync)
+    def add_blocks(self, block_list):
+        self._ensure_loaded()
+        for blk in block_list:
+            if blk["index"] != self.height + 1 or blk["previous_hash"] != self.tip_hash:
+                self.sync()
+                break
+            self._add(blk)
+        set_gauge("xper_seen_txs", self.bloom.count)
+        self._maybe_save()
+
+    # 재구성: fork_index 이후 블록을 최근 집합에서 제거 (블룸 필터 비트는 유지)
+    def truncate(self, fork_index):
+        self._ensure_loaded()
+        while self.recent_blocks and self.recent_blocks[-1][0] > fork_index:
+            index, _, tx_hashes = self.recent_blocks.pop()
+            for tx_hash in tx_hashes:
+                if self.recent.get(tx_hash) == index:
+                    del self.recent[tx_hash]
+        if self.recent_blocks and self.recent_blocks[-1][0] == fork_index:
+            self.height, self.tip_hash = fork_index, self.recent_blocks[-1][1]
+        elif fork_index < self.height:
+            self.height, self.tip_hash = fork_index, self._hash_at(fork_index)
+            if self.tip_hash is None:
+                self.rebuild()
+
+    # 내 체인 끝(tip)에 맞춤: 이어지는 블록만 추가, 재구성되었으면 분기점부터 (최근 범위 밖이면 rebuild)
+    def sync(self, tip=None):
+        self._ensure_loaded()
+        if tip is None:
+            tip = self.blocks.find_one({}, {"_id": 0, "index": 1, "hash": 1}, sort=[("index", -1)])
+        if tip is None:
+            if self.height:
+                self.rebuild()
+            return
+        if tip["hash"] == self.tip_hash:
+            return
+        if not self._hash_matches(self.height, self.tip_hash):
+            while self.recent_blocks and not self._hash_matches(self.recent_blocks[-1][0], self.recent_blocks[-1][1]):
+                self.truncate(self.recent_blocks[-1][0] - 1)
+            if not self.recent_blocks or not self._hash_matches(self.height, self.tip_hash):
+                self.rebuild()
+                return
+        self._catch_up()
+        set_gauge("xper_seen_txs", self.bloom.count)
+        self._maybe_save()
+
+    # ---------- 조회 ----------
+
+    # tx_hash 중 내 체인(upto 이하)에 이미 포함된 것
+    def contains(self, tx_hashes, upto=None):
+        self._ensure_loaded()
+        upto = self.height if upto is None else upto
+        found = set()
+        maybe = []
+        for tx_hash in tx_hashes:
+            index = self.recent.get(tx_hash)
+            if index is not None:
+                if index <= upto:
+                    found.add(tx_hash)
+                    inc("xper_seen_lookups_total", result="recent")
+                continue
+            if tx_hash in self.bloom:
+                maybe.append(tx_hash)
+            else:
+                inc("xper_seen_lookups_total", result="miss")
+        if maybe:
+            confirmed = self._confirm(maybe, upto)
+            found |= confirmed
+            inc("xper_seen_lookups_total", len(confirmed), result="confirmed")
+            inc("xper_seen_lookups_total", len(maybe) - len(confirmed), result="false_positive")
+        return found
+
+    # 블룸 필터 양성 확인
+    def _confirm(self, tx_hashes, upto):
+        return find_included(self.blocks, tx_hashes, upto)
+
+    def status(self):
+        self._ensure_loaded()
+        return {
+            "height": self.height,
+            "saved_height": self.saved_height,
+            "recent_blocks": len(self.recent_blocks),
+            "recent_txs": len(self.recent),
+            "bloom_txs": self.bloom.count,
+            "bloom_bytes": len(self.bloom.bits),
+            "bloom_hashes": self.bloom.num_hashes,
+            "estimated_error_rate": self.bloom.estimated_error_rate(),
+        }
@@ -0,0 +1,113 @@
+import hashlib, struct, time
+
+from pymongo import UpdateOne
+
+from ledger import LedgerState
+
+snapshot_interval = 1000      # 이 블록 수마다 잔고 스냅샷 생성
+snapshot_chunk_size = 5000    # 스냅샷 문서 1개에 담을 계정 수
+snapshot_keep = 2             # 보관할 스냅샷 개수 (오래된 것부터 삭제)
+snapshot_quorum = 2           # 빠른 동기화 시 같은 스냅샷을 제공해야 하는 피어 수 (미달 시 전체 동기화)
+
+# 잔고 상태 다이제스트 (주소 정렬 후 주소·잔고를 고정 형식으로 연결해 sha256)
+def state_digest(balances, height, tip_hash):
+    digest = hashlib.sha256()
+    digest.update(struct.pack(">Q", height))
+    digest.update(tip_hash.encode())
+    for address in sorted(balances):
+        data = address.encode()
+        digest.update(struct.pack(">H", len(data)) + data + struct.pack(">d", float(balances[address])))
+    return digest.hexdigest()
+
+def get_snapshots(blocks):
+    return blocks.database["account_snapshots"]
+
+# 가장 최근 스냅샷 헤더 (완료된 것만)
+def latest_snapshot(snapshots):
+    return snapshots.find_one({"type": "header"}, {"_id": 0}, sort=[("height", -1)])
+
+# 마지막 스냅샷 이후 snapshot_interval 블록 이상 지났는지
+def snapshot_due(snapshots, height, interval=None):
+    interval = snapshot_interval if interval is None else interval
+    if height < interval:
+        return False
+    last = latest_snapshot(snapshots)
+    return last is None or height - last["height"] >= interval
+
+# 잔고 스냅샷 생성
+# - 계정 묶음(chunk) 문서를 먼저 저장하고 헤더 문서를 마지막에 저장 (헤더가 있으면 완료된 스냅샷)
+# - 전체 잔고가 로드된 상태(complete)에서만 생성
+def create_snapshot(snapshots, state, keep=None):
+    if not state.complete:
+        raise ValueError("전체 잔고가 로드되지 않은 상태는 스냅샷으로 저장할 수 없습니다.")
+    keep = snapshot_keep if keep is None else keep
+    height, tip_hash = state.height, state.tip_hash
+    items = sorted(state.balances.items())
+
+    snapshots.delete_many({"height": height})    # 같은 높이의 미완료 스냅샷 정리
+    chunks = [
+        {"_id": f"{height}:{i}", "type": "chunk", "height": height, "chunk": i,
+         "balances": [[address, balance] for address, balance in items[start:start + snapshot_chunk_size]]}
+        for i, start in enumerate(range(0, len(items), snapshot_chunk_size))
+    ]
+    if chunks:
+        snapshots.insert_many(chunks, ordered=False)
+
+    header = {
+        "_id": f"{height}",
+        "type": "header",
+        "height": height,
+        "tip_hash": tip_hash,
+        "state_digest": state_digest(state.balances, height, tip_hash),
+        "accounts": len(items),
+        "chunks": len(chunks),
+        "created_at": time.time(),
+    }
+    snapshots.insert_one(header)
+
+    # 오래된 스냅샷 삭제
+    old = [doc["height"] for doc in snapshots.find({"type": "header"}, {"_id": 0, "height": 1}).sort("height", -1)][keep:]
+    if old:
+        snapshots.delete_many({"height": {"$in": old}})
+    header.pop("_id")
+    return header
+
+# 스냅샷을 잔고 상태로 로드 (다이제스트 불일치 또는 누락 시 None)
+def load_snapshot(snapshots, header=None):
+    header = latest_snapshot(snapshots) if header is None else header
+    if header is None:
+        return None
+    balances = {}
+    chunk_count = 0
+    for chunk in snapshots.find({"type": "chunk", "height": header["height"]}, {"_id": 0, "balances": 1}):
+        balances.update((address, balance) for address, balance in chunk["balances"])
+        chunk_count += 1
+    if chunk_count != header["chunks"] or len(balances) != header["accounts"]:
+        return None
+    if state_digest(balances, header["height"], header["tip_hash"]) != header["state_digest"]:
+        return None
+    return LedgerState(balances, height=header["height"], tip_hash=header["tip_hash"])
+
+# 빈 accounts 컬렉션에 스냅샷 잔고 기록 (새 노드 초기화)
+def restore_accounts(accounts, state):
+    if accounts.find_one({}, {"_id": 1}) is not None:
+        return 0
+    ops = [UpdateOne({"address": address}, {"$set": {"balance": balance}}, upsert=True) for address, balance in state.balances.items()]
+    for i in range(0, len(ops), snapshot_chunk_size):
+        accounts.bulk_write(ops[i:i + snapshot_chunk_size], ordered=False)
+    return len(ops)
+
+# 피어 스냅샷 헤더 중 정족수 이상이 같은 것 선택 (높이가 높은 것 우선)
+# peer_snapshots: [(peer, header), ...] → (header, 해당 피어 목록) 또는 (None, [])
+def select_snapshot(peer_snapshots, quorum=None):
+    quorum = snapshot_quorum if quorum is None else quorum
+    quorum = max(1, quorum)    # 응답한 피어 수가 적어도 낮추지 않음 (미달 시 전체 동기화)
+    groups = {}
+    for peer, header in peer_snapshots:
+        key = (header["height"], header["tip_hash"], header["state_digest"])
+        groups.setdefault(key, (header, []))[1].append(peer)
+    for key in sorted(groups, key=lambda k: k[0], reverse=True):
+        header, supporters = groups[key]
+        if len(supporters) >= quorum:
+            return header, supporters
+    return None, []
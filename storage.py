@@ -0,0 +1,832 @@
+import heapq, os, pickle, sqlite3, threading
+
+try:
+    import fcntl
+except ImportError:    # Windows: 잠금 파일 없이 사용 (단일 프로세스 사용은 운영자가 보장)
+    fcntl = None
+
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+# 저장소 백엔드
+# - mongodb://...  : pymongo MongoClient (기존 방식)
+# - memory://이름  : 프로세스 내 메모리 저장소 (같은 이름이면 같은 저장소, 벤치마크·테스트·단일 노드용)
+# - sqlite:///경로 : 메모리 저장소 + SQLite 파일에 즉시 기록 (단일 프로세스 노드용, 시작 시 전체 로드)
+#   메모리 내용이 기준이고 파일은 재시작용 기록이므로 한 파일을 한 프로세스만 열 수 있음 (잠금 파일로 강제)
+#   채굴 데몬과 RPC 서버처럼 여러 프로세스가 같은 데이터를 쓰려면 mongodb:// 사용
+# 메모리/SQLite 컬렉션은 이 코드가 사용하는 pymongo Collection 메서드와 같은 형태로 동작
+# (find/find_one(sort=...)/insert/update/delete/bulk_write/count_documents/create_index, 조건 연산자 $in $gt ... $or)
+
+_MISSING = object()
+
+# ---------- 문서 조회/비교 ----------
+
+def _clone(value):
+    if isinstance(value, dict):
+        return {k: _clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clone(v) for v in value]
+    return value
+
+# 점(.) 경로의 값 목록 (중간 배열은 펼침, 없으면 빈 목록)
+def _resolve(doc, path):
+    values = [doc]
+    for part in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit() and int(part) < len(value):
+                    found.append(value[int(part)])
+                else:
+                    found.extend(item[part] for item in value if isinstance(item, dict) and part in item)
+        values = found
+    return values
+
+def _candidates(values):
+    for value in values:
+        yield value
+        if isinstance(value, list):
+            yield from value
+
+def _compare(values, operand, op):
+    for value in _candidates(values):
+        try:
+            if value is not None and op(value, operand):
+                return True
+        except TypeError:
+            continue
+    return False
+
+_COMPARATORS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+def _equals(values, operand):
+    if not values:
+        return operand is None
+    return any(value == operand for value in _candidates(values))
+
+def _match_condition(values, condition):
+    if not (isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition)):
+        return _equals(values, condition)
+    for op, operand in condition.items():
+        if op == "$eq":
+            ok = _equals(values, operand)
+        elif op == "$ne":
+            ok = not _equals(values, operand)
+        elif op == "$in":
+            ok = any(_equals(values, item) for item in operand)
+        elif op == "$nin":
+            ok = not any(_equals(values, item) for item in operand)
+        elif op == "$exists":
+            ok = bool(values) == bool(operand)
+        elif op in _COMPARATORS:
+            ok = _compare(values, operand, _COMPARATORS[op])
+        elif op == "$not":
+            ok = not _match_condition(values, operand)
+        else:
+            raise ValueError(f"지원하지 않는 조건 연산자: {op}")
+        if not ok:
+            return False
+    return True
+
+def match(doc, query):
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(match(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(match(doc, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(match(doc, sub) for sub in condition):
+                return False
+        elif not _match_condition(_resolve(doc, key), condition):
+            return False
+    return True
+
+def _sort_key(value):
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (3, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (4, repr(value))
+
+def _first(doc, path):
+    values = _resolve(doc, path)
+    return values[0] if values else None
+
+def _normalize_sort(key, direction=1):
+    if isinstance(key, str):
+        return [(key, direction)]
+    return [(k, d) for k, d in key]
+
+# ---------- 프로젝션 ----------
+
+def _path_tree(paths):
+    tree = {}
+    for path in paths:
+        node = tree
+        parts = path.split(".")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+            if node is True:
+                break
+        else:
+            node[parts[-1]] = True
+    return tree
+
+def _include(value, tree):
+    if isinstance(value, list):
+        return [_include(item, tree) for item in value if isinstance(item, dict)]
+    result = {}
+    for key, sub in tree.items():
+        if key in value:
+            result[key] = _clone(value[key]) if sub is True else _include(value[key], sub)
+    return result
+
+def _exclude(value, tree):
+    if isinstance(value, list):
+        for item in value:
+            if isinstance(item, dict):
+                _exclude(item, tree)
+        return
+    for key, sub in tree.items():
+        if key not in value:
+            continue
+        if sub is True:
+            del value[key]
+        else:
+            _exclude(value[key], sub)
+
+def project(doc, projection):
+    if not projection:
+        return _clone(doc)
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if any(fields.values()):
+        result = _include(doc, _path_tree(k for k, v in fields.items() if v))
+    else:
+        result = _clone(doc)
+        _exclude(result, _path_tree(fields))
+        result.pop("_id", None)
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    elif not include_id:
+        result.pop("_id", None)
+    return result
+
+# ---------- 갱신 ----------
+
+def _set_path(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+def _unset_path(doc, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+def _apply_update(doc, update, inserting=False):
+    if not any(k.startswith("$") for k in update):
+        replaced = {"_id": doc["_id"]} if "_id" in doc else {}
+        replaced.update(_clone(update))
+        doc.clear()
+        doc.update(replaced)
+        return
+    for op, fields in update.items():
+        if op == "$set" or (op == "$setOnInsert" and inserting):
+            for path, value in fields.items():
+                _set_path(doc, path, _clone(value))
+        elif op == "$unset":
+            for path in fields:
+                _unset_path(doc, path)
+        elif op == "$inc":
+            for path, amount in fields.items():
+                current = _first(doc, path)
+                _set_path(doc, path, (current or 0) + amount)
+        elif op != "$setOnInsert":
+            raise ValueError(f"지원하지 않는 갱신 연산자: {op}")
+
+def _upsert_base(query):
+    doc = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+            if "$eq" in condition:
+                _set_path(doc, key, _clone(condition["$eq"]))
+            continue
+        _set_path(doc, key, _clone(condition))
+    return doc
+
+# 집계 식 값 ("$필드" 경로 또는 상수)
+def _expr(doc, expr):
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _first(doc, expr[1:])
+    if isinstance(expr, dict):
+        return {k: _expr(doc, v) for k, v in expr.items()}
+    return expr
+
+def _group(docs, spec):
+    groups = {}
+    for doc in docs:
+        key = _expr(doc, spec["_id"])
+        group_key = repr(key)
+        if group_key not in groups:
+            groups[group_key] = ({"_id": key}, {})
+        out, state = groups[group_key]
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, expr), = accumulator.items()
+            value = _expr(doc, expr)
+            if op == "$sum":
+                out[field] = out.get(field, 0) + (value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0)
+            elif op == "$avg":
+                if isinstance(value, (int, float)):
+                    total, count = state.get(field, (0, 0))
+                    state[field] = (total + value, count + 1)
+                    out[field] = state[field][0] / state[field][1]
+                else:
+                    out.setdefault(field, None)
+            elif op in ("$min", "$max"):
+                if value is not None and (field not in out or out[field] is None or
+                                          (value < out[field] if op == "$min" else value > out[field])):
+                    out[field] = value
+                out.setdefault(field, None)
+            elif op == "$first":
+                out.setdefault(field, value)
+            elif op == "$last":
+                out[field] = value
+            else:
+                raise ValueError(f"지원하지 않는 집계 연산자: {op}")
+    return [out for out, _ in groups.values()]
+
+# ---------- 커서 ----------
+
+class MemoryCursor:
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._iter = None
+
+    def sort(self, key, direction=1):
+        self._sort = _normalize_sort(key, direction)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def _execute(self):
+        docs = self._collection._select(self._query)
+        if self._sort:
+            if len(self._sort) == 1 and self._limit and not self._skip:
+                path, direction = self._sort[0]
+                pick = heapq.nsmallest if direction == 1 else heapq.nlargest
+                docs = pick(self._limit, docs, key=lambda d: _sort_key(_first(d, path)))
+            else:
+                for path, direction in reversed(self._sort):
+                    docs.sort(key=lambda d: _sort_key(_first(d, path)), reverse=direction == -1)
+        if self._skip:
+            docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [project(doc, self._projection) for doc in docs]
+
+    def __iter__(self):
+        if self._iter is None:
+            self._iter = iter(self._execute())
+        return self._iter
+
+    def __next__(self):
+        return next(iter(self))
+
+    def close(self):
+        self._iter = iter(())
+
+# ---------- 컬렉션 ----------
+
+class MemoryCollection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self._docs = {}                # _id -> 문서 (삽입 순서 유지)
+        self._indexes = {}             # 인덱스 이름 -> {"fields", "unique", "sparse", "map": 키 -> {_id}}
+        self._next_id = 1             # 자동 _id (명시된 정수 _id보다 항상 큼)
+        self._lock = threading.RLock()
+
+    @property
+    def full_name(self):
+        return f"{self.database.name}.{self.name}"
+
+    # 저장 훅 (SQLite 백엔드에서 변경 문서 기록)
+    def _persist(self, changed=(), removed=()):
+        pass
+
+    # ----- 인덱스 -----
+
+    def create_index(self, keys, unique=False, sparse=False, name=None, **kwargs):
+        fields = tuple(_normalize_sort(keys))
+        name = name or "_".join(f"{path}_{direction}" for path, direction in fields)
+        with self._lock:
+            if name in self._indexes:
+                return name
+            index = {"fields": [path for path, _ in fields], "unique": unique, "sparse": sparse, "map": {}}
+            for _id, doc in self._docs.items():
+                for key in self._index_keys(index, doc):
+                    bucket = index["map"].setdefault(key, set())
+                    if unique and bucket:
+                        raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.full_name} index: {name}", 11000)
+                    bucket.add(_id)
+            self._indexes[name] = index
+        return name
+
+    def _index_keys(self, index, doc):
+        fields = index["fields"]
+        if len(fields) == 1:
+            values = _resolve(doc, fields[0])
+            if not values:
+                return [] if index["sparse"] else [(None,)]
+            keys = set()
+            for value in _candidates(values):
+                if not isinstance(value, list):
+                    keys.add((value if _hashable(value) else repr(value),))
+            return keys
+        values = [_resolve(doc, path) for path in fields]
+        if index["sparse"] and not any(values):
+            return []
+        key = tuple((v[0] if _hashable(v[0]) else repr(v[0])) if v else None for v in values)
+        return [key]
+
+    def _check_unique(self, doc, ignore_id=_MISSING):
+        for name, index in self._indexes.items():
+            if not index["unique"]:
+                continue
+            for key in self._index_keys(index, doc):
+                if any(_id != ignore_id for _id in index["map"].get(key, ())):
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.full_name} index: {name} dup key: {key}", 11000
+                    )
+
+    def _index_add(self, _id, doc):
+        for index in self._indexes.values():
+            for key in self._index_keys(index, doc):
+                index["map"].setdefault(key, set()).add(_id)
+
+    def _index_remove(self, _id, doc):
+        for index in self._indexes.values():
+            for key in self._index_keys(index, doc):
+                bucket = index["map"].get(key)
+                if bucket is not None:
+                    bucket.discard(_id)
+                    if not bucket:
+                        del index["map"][key]
+
+    # 단일 필드 인덱스로 후보 문서 축소 (동등 조건 / $in)
+    def _select(self, query):
+        with self._lock:
+            ids = None
+            if "_id" in query and not isinstance(query["_id"], dict):
+                ids = [query["_id"]] if query["_id"] in self._docs else []
+            else:
+                for index in self._indexes.values():
+                    if len(index["fields"]) != 1 or index["sparse"] or index["fields"][0] not in query:
+                        continue
+                    condition = query[index["fields"][0]]
+                    if isinstance(condition, dict):
+                        if set(condition) != {"$in"}:
+                            continue
+                        operands = condition["$in"]
+                    else:
+                        operands = [condition]
+                    if not all(_hashable(v) and not isinstance(v, (list, dict)) for v in operands):
+                        continue
+                    found = set()
+                    for value in operands:
+                        found |= index["map"].get((value,), set())
+                    ids = sorted(found, key=_sort_key)
+                    break
+            docs = self._docs.values() if ids is None else (self._docs[_id] for _id in ids)
+            return [doc for doc in docs if match(doc, query)]
+
+    # ----- 조회 -----
+
+    def find(self, filter=None, projection=None, **kwargs):
+        cursor = MemoryCursor(self, filter, projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    def find_one(self, filter=None, projection=None, sort=None, **kwargs):
+        cursor = self.find(filter, projection)
+        if sort:
+            cursor.sort(sort)
+        for doc in cursor.limit(1):
+            return doc
+        return None
+
+    def count_documents(self, filter=None, **kwargs):
+        if not filter:
+            return len(self._docs)
+        return len(self._select(filter))
+
+    def estimated_document_count(self, **kwargs):
+        return len(self._docs)
+
+    def distinct(self, key, filter=None):
+        values = []
+        for doc in self._select(filter or {}):
+            for value in _candidates(_resolve(doc, key)):
+                if not isinstance(value, list) and value not in values:
+                    values.append(value)
+        return values
+
+    # ----- 집계 ($match, $group[$sum/$min/$max/$avg/$first/$last], $sort, $skip, $limit, $project) -----
+
+    def aggregate(self, pipeline, **kwargs):
+        with self._lock:
+            docs = [_clone(doc) for doc in self._docs.values()]
+        for stage in pipeline:
+            (op, spec), = stage.items()
+            if op == "$match":
+                docs = [doc for doc in docs if match(doc, spec)]
+            elif op == "$group":
+                docs = _group(docs, spec)
+            elif op == "$sort":
+                for path, direction in reversed(list(spec.items())):
+                    docs.sort(key=lambda d: _sort_key(_first(d, path)), reverse=direction == -1)
+            elif op == "$skip":
+                docs = docs[spec:]
+            elif op == "$limit":
+                docs = docs[:spec]
+            elif op == "$project":
+                docs = [project(doc, spec) for doc in docs]
+            else:
+                raise ValueError(f"지원하지 않는 집계 단계: {op}")
+        return iter(docs)
+
+    # ----- 삽입 -----
+
+    def _insert(self, doc):
+        if "_id" not in doc:
+            doc["_id"] = self._next_id
+        stored = _clone(doc)
+        if stored["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.full_name} index: _id_", 11000)
+        self._check_unique(stored)
+        self._docs[stored["_id"]] = stored
+        self._index_add(stored["_id"], stored)
+        self._advance_id(stored["_id"])
+        return stored["_id"]
+
+    def _advance_id(self, _id):
+        if isinstance(_id, int) and not isinstance(_id, bool) and _id >= self._next_id:
+            self._next_id = _id + 1
+
+    def insert_one(self, document, **kwargs):
+        with self._lock:
+            _id = self._insert(document)
+            self._persist(changed=[_id])
+        return InsertOneResult(_id, True)
+
+    def insert_many(self, documents, ordered=True, **kwargs):
+        inserted = []
+        errors = []
+        with self._lock:
+            try:
+                for i, doc in enumerate(documents):
+                    try:
+                        inserted.append(self._insert(doc))
+                    except DuplicateKeyError as e:
+                        errors.append({"index": i, "code": 11000, "errmsg": str(e), "op": doc})
+                        if ordered:
+                            break
+            finally:
+                self._persist(changed=inserted)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted), "nUpserted": 0,
+                                  "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [], "writeConcernErrors": []})
+        return InsertManyResult(inserted, True)
+
+    # ----- 갱신 -----
+
+    def _update(self, filter, update, upsert=False, multi=False):
+        matched = modified = 0
+        upserted_id = None
+        changed = []
+        targets = self._select(filter)
+        if not multi:
+            targets = targets[:1]
+        for doc in targets:
+            new_doc = _clone(doc)
+            _apply_update(new_doc, update)
+            matched += 1
+            if new_doc != doc:
+                self._check_unique(new_doc, ignore_id=doc["_id"])
+                self._index_remove(doc["_id"], doc)
+                self._docs[doc["_id"]] = new_doc
+                self._index_add(doc["_id"], new_doc)
+                modified += 1
+                changed.append(doc["_id"])
+        if not targets and upsert:
+            new_doc = _upsert_base(filter)
+            _apply_update(new_doc, update, inserting=True)
+            upserted_id = self._insert(new_doc)
+            changed.append(upserted_id)
+        return matched, modified, upserted_id, changed
+
+    def _update_result(self, matched, modified, upserted_id):
+        raw = {"n": matched + (1 if upserted_id is not None else 0), "nModified": modified, "ok": 1.0,
+               "updatedExisting": matched > 0}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    def update_one(self, filter, update, upsert=False, **kwargs):
+        with self._lock:
+            matched, modified, upserted_id, changed = self._update(filter, update, upsert=upsert)
+            self._persist(changed=changed)
+        return self._update_result(matched, modified, upserted_id)
+
+    def update_many(self, filter, update, upsert=False, **kwargs):
+        with self._lock:
+            matched, modified, upserted_id, changed = self._update(filter, update, upsert=upsert, multi=True)
+            self._persist(changed=changed)
+        return self._update_result(matched, modified, upserted_id)
+
+    def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        return self.update_one(filter, {k: v for k, v in replacement.items() if k != "_id"}, upsert=upsert)
+
+    # ----- 삭제 -----
+
+    def _delete(self, filter, multi):
+        targets = self._select(filter)
+        if not multi:
+            targets = targets[:1]
+        removed = []
+        for doc in targets:
+            self._index_remove(doc["_id"], doc)
+            del self._docs[doc["_id"]]
+            removed.append(doc["_id"])
+        return removed
+
+    def delete_one(self, filter, **kwargs):
+        with self._lock:
+            removed = self._delete(filter, multi=False)
+            self._persist(removed=removed)
+        return DeleteResult({"n": len(removed), "ok": 1.0}, True)
+
+    def delete_many(self, filter, **kwargs):
+        with self._lock:
+            removed = self._delete(filter, multi=True)
+            self._persist(removed=removed)
+        return DeleteResult({"n": len(removed), "ok": 1.0}, True)
+
+    # ----- 일괄 처리 (pymongo InsertOne/UpdateOne/UpdateMany/ReplaceOne/DeleteOne/DeleteMany) -----
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                  "upserted": [], "writeErrors": [], "writeConcernErrors": []}
+        changed = []
+        removed = []
+        with self._lock:
+            try:
+                for i, request in enumerate(requests):
+                    kind = type(request).__name__
+                    try:
+                        if kind == "InsertOne":
+                            changed.append(self._insert(request._doc))
+                            result["nInserted"] += 1
+                        elif kind in ("UpdateOne", "UpdateMany", "ReplaceOne"):
+                            matched, modified, upserted_id, ids = self._update(
+                                request._filter, request._doc, upsert=bool(request._upsert), multi=kind == "UpdateMany"
+                            )
+                            result["nMatched"] += matched
+                            result["nModified"] += modified
+                            if upserted_id is not None:
+                                result["nUpserted"] += 1
+                                result["upserted"].append({"index": i, "_id": upserted_id})
+                            changed.extend(ids)
+                        elif kind in ("DeleteOne", "DeleteMany"):
+                            ids = self._delete(request._filter, multi=kind == "DeleteMany")
+                            result["nRemoved"] += len(ids)
+                            removed.extend(ids)
+                        else:
+                            raise TypeError(f"지원하지 않는 요청: {kind}")
+                    except DuplicateKeyError as e:
+                        result["writeErrors"].append({"index": i, "code": 11000, "errmsg": str(e)})
+                        if ordered:
+                            break
+            finally:
+                removed_set = set(removed)
+                self._persist(changed=[_id for _id in changed if _id not in removed_set and _id in self._docs], removed=removed)
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    def drop(self):
+        with self._lock:
+            removed = list(self._docs)
+            self._docs.clear()
+            for index in self._indexes.values():
+                index["map"].clear()
+            self._persist(removed=removed)
+
+def _hashable(value):
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
+
+# ---------- 데이터베이스 / 클라이언트 ----------
+
+class MemoryDatabase:
+    collection_class = MemoryCollection
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self.collection_class(self, name)
+                self._collections[name] = collection
+            return collection
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name):
+        return self[name]
+
+    def list_collection_names(self):
+        return [name for name, collection in self._collections.items() if collection.estimated_document_count()]
+
+class MemoryClient:
+    database_class = MemoryDatabase
+
+    def __init__(self, name="default"):
+        self.name = name
+        self._databases = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            database = self._databases.get(name)
+            if database is None:
+                database = self.database_class(self, name)
+                self._databases[name] = database
+            return database
+
+    def get_database(self, name):
+        return self[name]
+
+    # 공유 저장소이므로 연결 종료 시에도 데이터 유지
+    def close(self):
+        pass
+
+# ---------- SQLite (메모리 저장소 + 파일 즉시 기록) ----------
+
+class SQLiteCollection(MemoryCollection):
+    def __init__(self, database, name):
+        super().__init__(database, name)
+        self._table = f'"{database.name}.{name}"'.replace("\x00", "")
+        client = database.client
+        with client._lock:
+            client._conn.execute(f"CREATE TABLE IF NOT EXISTS {self._table} (key BLOB PRIMARY KEY, doc BLOB NOT NULL)")
+            client._conn.commit()
+            rows = client._conn.execute(f"SELECT doc FROM {self._table} ORDER BY rowid").fetchall()
+        for (data,) in rows:
+            doc = pickle.loads(data)
+            self._docs[doc["_id"]] = doc
+            self._advance_id(doc["_id"])
+
+    def _persist(self, changed=(), removed=()):
+        if not changed and not removed:
+            return
+        client = self.database.client
+        with client._lock:
+            conn = client._conn
+            if removed:
+                conn.executemany(f"DELETE FROM {self._table} WHERE key = ?", [(pickle.dumps(_id),) for _id in removed])
+            if changed:
+                conn.executemany(
+                    f"INSERT INTO {self._table} (key, doc) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET doc = excluded.doc",
+                    [(pickle.dumps(_id), pickle.dumps(self._docs[_id], pickle.HIGHEST_PROTOCOL)) for _id in changed if _id in self._docs],
+                )
+            conn.commit()
+
+class SQLiteDatabase(MemoryDatabase):
+    collection_class = SQLiteCollection
+
+class SQLiteClient(MemoryClient):
+    database_class = SQLiteDatabase
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = _lock_exclusive(path + ".lock")
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.RLock()
+
+    # 프로세스 내 공유 연결이므로 기록만 확정
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+
+# 다른 프로세스가 같은 SQLite 파일을 열지 못하도록 잠금 (프로세스 종료 시 자동 해제)
+# 각 프로세스가 파일 전체를 메모리에 올리고 자체 _id를 매기므로 동시에 열면 서로의 기록을 덮어씀
+def _lock_exclusive(lock_path):
+    if fcntl is None:
+        return None
+    lock_file = open(lock_path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise RuntimeError(f"다른 프로세스가 사용 중인 SQLite 저장소입니다: {lock_path[:-len('.lock')]} "
+                           "(sqlite://는 단일 프로세스 전용, 여러 프로세스는 mongodb:// 사용)") from None
+    return lock_file
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# URI에 맞는 저장소 클라이언트 (memory/sqlite는 같은 URI면 같은 인스턴스)
+def open_storage(uri, **client_options):
+    if uri.startswith("memory://"):
+        key = uri
+        factory = lambda: MemoryClient(uri[len("memory://"):] or "default")
+    elif uri.startswith("sqlite://"):
+        path = uri[len("sqlite://"):]
+        key = "sqlite://" + os.path.abspath(path)
+        factory = lambda: SQLiteClient(path)
+    else:
+        return MongoClient(uri, **client_options)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+        return client
+
+def is_embedded_uri(uri):
+    return uri.startswith(("memory://", "sqlite://"))
+
+# 노드가 사용하는 컬렉션 묶음 (blockfiles 지정 시 블록은 추가 전용 블록 파일에 저장)
+# blockfiles_readonly=True: 블록 파일을 기록하는 노드와 별도 프로세스에서 조회만 할 때 (RPC 서버 등)
+class NodeStorage:
+    def __init__(self, uri, db_name="blockchain_db", blockfiles=None, blockfiles_readonly=False, **client_options):
+        self.uri = uri
+        self.client = open_storage(uri, **client_options)
+        self.db = self.client[db_name]
+        if blockfiles:
+            from blockfiles import BlockFileCollection
+            self.blocks = BlockFileCollection(blockfiles, self.db, readonly=blockfiles_readonly)
+        else:
+            self.blocks = self.db["blocks"]
+        self.tx_pool = self.db["transaction_pool"]
+        self.accounts = self.db["accounts"]
+        self.transactions = self.db["transactions"]
+        self.peers = self.db["peers"]
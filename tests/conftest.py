@@ -0,0 +1,34 @@
+import os, sys, time, uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import blockchain
+from storage import NodeStorage
+
+
+# 테스트마다 서로 다른 memory:// 저장소를 여는 팩토리
+@pytest.fixture
+def node():
+    def open_node():
+        return NodeStorage(f"memory://test-{uuid.uuid4().hex}")
+    return open_node
+
+
+# 서명된 송금 트랜잭션 생성
+@pytest.fixture
+def transfer():
+    def make(private_key, sender, recipient, amount, fee=blockchain.transaction_fee, timestamp=None):
+        tx = {
+            "version": blockchain.TX_VERSION,
+            "sender": sender,
+            "recipient": recipient,
+            "amount": amount,
+            "fee": fee,
+            "timestamp": timestamp or time.time(),
+        }
+        tx["signature"] = blockchain.sign_transaction(private_key, tx)
+        tx["tx_hash"] = blockchain.compute_tx_hash(tx)
+        return tx
+    return make
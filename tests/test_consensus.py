@@ -0,0 +1,43 @@
+import time
+
+import blockchain
+from indexer import ChainIndexer
+from mempool import pool_document
+from peers import PeerConnectionManager
+
+
+# 동기화로 받은 블록에서 이미 쓴 잔고를 풀의 다른 트랜잭션이 다시 쓰지 못해야 함
+def test_sync_then_mine_uses_synced_balances(node, transfer):
+    peer, me = node(), node()
+    alice, alice_key = blockchain.generate_wallet()
+    bob, _ = blockchain.generate_wallet()
+    carol, _ = blockchain.generate_wallet()
+
+    peer_ledger = blockchain.load_ledger(peer.blocks)
+    blockchain.create_block(peer.blocks, peer.tx_pool, 0, miner_address=alice, ledger=peer_ledger)
+    for block in peer.blocks.find({}, {"_id": 0}):
+        me.blocks.insert_one(block)
+    indexer = ChainIndexer(me.blocks)
+    indexer.run()
+    balance = blockchain.get_balance(alice, me.accounts)
+    assert balance > 0
+
+    # 피어 체인에서 alice 잔고를 거의 모두 사용
+    peer.tx_pool.insert_one(pool_document(transfer(alice_key, alice, bob, balance - 1)))
+    time.sleep(0.01)
+    spent = blockchain.create_block(peer.blocks, peer.tx_pool, 0, miner_address=bob, ledger=peer_ledger)
+    assert len(spent["transactions"]) == 2
+
+    # 내 풀에는 같은 잔고를 쓰는 다른 트랜잭션
+    double_spend = transfer(alice_key, alice, carol, balance - 1)
+    me.tx_pool.insert_one(pool_document(double_spend))
+    me.peers.insert_one({"uri": peer.uri})
+
+    time.sleep(0.01)
+    blockchain.consensus_protocol(me.blocks, me.peers, me.tx_pool, 0, carol, indexer=indexer,
+                                  peer_manager=PeerConnectionManager(allowed_schemes=("memory://",)))
+
+    assert me.blocks.count_documents({}) == 3
+    mined = me.blocks.find_one(sort=[("index", -1)])
+    assert double_spend["tx_hash"] not in {tx["tx_hash"] for tx in mined["transactions"]}
+    assert blockchain.get_balance(alice, me.accounts) >= 0
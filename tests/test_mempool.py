@@ -0,0 +1,39 @@
+import blockchain
+from indexer import ChainIndexer
+from encoding import compute_tx_hash
+from mempool import admitted_hash, pool_document
+
+
+def _funded(node):
+    store = node()
+    ledger = blockchain.load_ledger(store.blocks)
+    sender, sender_key = blockchain.generate_wallet()
+    blockchain.create_block(store.blocks, store.tx_pool, 0, miner_address=sender, ledger=ledger)
+    ChainIndexer(store.blocks).run()
+    return store, ledger, sender, sender_key
+
+
+# 입장 검증을 거친 풀 문서는 표시가 인정됨
+def test_admitted_marker_round_trip(node, transfer):
+    store, ledger, sender, sender_key = _funded(node)
+    recipient, _ = blockchain.generate_wallet()
+    tx = transfer(sender_key, sender, recipient, 10)
+    blockchain.admit_transaction(store.tx_pool, tx, store.accounts)
+    doc = store.tx_pool.find_one({"tx_hash": tx["tx_hash"]})
+    assert admitted_hash(doc) == tx["tx_hash"]
+
+
+# 풀에 직접 넣으면서 내용 해시를 admitted 표시로 위조한 트랜잭션은 블록에 들어가지 않아야 함
+def test_forged_admitted_marker_is_verified(node, transfer):
+    store, ledger, sender, sender_key = _funded(node)
+    recipient, _ = blockchain.generate_wallet()
+    forged = transfer(sender_key, sender, recipient, 10)
+    forged["signature"] = "AAAA"
+    forged["tx_hash"] = compute_tx_hash(forged)
+    doc = pool_document(forged)
+    doc["admitted"] = forged["tx_hash"]
+    store.tx_pool.insert_one(doc)
+    assert admitted_hash(doc) is None
+
+    block = blockchain.create_block(store.blocks, store.tx_pool, 0, miner_address=recipient, ledger=ledger)
+    assert forged["tx_hash"] not in {tx["tx_hash"] for tx in block["transactions"]}
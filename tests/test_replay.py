@@ -0,0 +1,50 @@
+import base64, time
+
+import pytest
+from ecdsa import SECP256k1
+
+import blockchain
+from indexer import ChainIndexer
+from mempool import pool_document
+
+
+def _mined_transfer(node, transfer):
+    store = node()
+    ledger = blockchain.load_ledger(store.blocks)
+    sender, sender_key = blockchain.generate_wallet()
+    recipient, _ = blockchain.generate_wallet()
+    blockchain.create_block(store.blocks, store.tx_pool, 0, miner_address=sender, ledger=ledger)
+    tx = transfer(sender_key, sender, recipient, 10)
+    store.tx_pool.insert_one(pool_document(tx))
+    time.sleep(0.01)
+    block = blockchain.create_block(store.blocks, store.tx_pool, 0, miner_address=recipient, ledger=ledger)
+    assert tx["tx_hash"] in {t["tx_hash"] for t in block["transactions"]}
+    return store, ledger, tx
+
+
+# s → n - s로 바꾼 서명(새 tx_hash)은 유효하지 않음
+def test_high_s_signature_is_rejected(node, transfer):
+    _, _, tx = _mined_transfer(node, transfer)
+    assert blockchain.verify_signature(tx)
+    signature = base64.b64decode(tx["signature"])
+    s = int.from_bytes(signature[32:], "big")
+    malleated = dict(tx, signature=base64.b64encode(signature[:32] + (SECP256k1.order - s).to_bytes(32, "big")).decode())
+    assert not blockchain.verify_signature(malleated)
+
+
+# 본 트랜잭션 색인 없이도 이미 포함된 트랜잭션은 다시 블록에 넣지 않음
+def test_replay_without_seen_index(node, transfer):
+    store, ledger, tx = _mined_transfer(node, transfer)
+    store.tx_pool.insert_one(pool_document(tx))
+    time.sleep(0.01)
+    block = blockchain.create_block(store.blocks, store.tx_pool, 0, miner_address=tx["recipient"], ledger=ledger)
+    assert tx["tx_hash"] not in {t["tx_hash"] for t in block["transactions"]}
+
+
+# 이미 블록에 포함된 트랜잭션은 풀 입장 거부
+def test_admission_rejects_included_transaction(node, transfer):
+    store, _, tx = _mined_transfer(node, transfer)
+    ChainIndexer(store.blocks).run()
+    with pytest.raises(blockchain.TransactionRejected) as rejected:
+        blockchain.admit_transaction(store.tx_pool, tx, store.accounts)
+    assert rejected.value.reason == "duplicate"
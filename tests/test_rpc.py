@@ -0,0 +1,44 @@
+import json, socket
+
+import pytest
+
+from rpc import NodeService, RPCServer, INTERNAL_ERROR, PARSE_ERROR
+
+
+@pytest.fixture
+def server(node):
+    server = RPCServer(NodeService.from_storage(node()), port=0, workers=1)
+    server.start_in_thread()
+    yield server
+    server.stop()
+
+
+def _raw_request(server, data):
+    with socket.create_connection((server.host, server.port), timeout=5) as sock:
+        sock.sendall(data)
+        response = b""
+        while chunk := sock.recv(65536):
+            response += chunk
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+# 잘못된 Content-Length는 연결 처리 오류가 아니라 400 응답
+@pytest.mark.parametrize("length", [b"abc", b"-5"])
+def test_malformed_content_length_is_rejected(server, length):
+    status, body = _raw_request(server, b"POST /rpc HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n{}")
+    assert status == 400
+    assert body["error"]["code"] == PARSE_ERROR
+
+
+# 내부 오류 내용은 클라이언트에 전달하지 않음
+def test_internal_error_message_is_generic(server, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("mongodb://user:secret@db")
+    monkeypatch.setattr(server.service, "call", fail)
+    payload = json.dumps({"jsonrpc": "2.0", "id": 1, "method": "get_tip"}).encode()
+    status, body = _raw_request(server, b"POST /rpc HTTP/1.1\r\nConnection: close\r\nContent-Length: "
+                                + str(len(payload)).encode() + b"\r\n\r\n" + payload)
+    assert status == 200
+    assert body["error"]["code"] == INTERNAL_ERROR
+    assert "secret" not in body["error"]["message"]
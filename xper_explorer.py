@@ -4,6 +4,10 @@ from datetime import datetime, timedelta, timezone
 import pandas as pd
 import time
 
+from blockchain import get_tx_proof, verify_tx_proof, fetch_peer_header
+from pruner import load_block
+from rpc import RPCClient, RPCError
+
 KST = timezone(timedelta(hours=9))  # KST timezone
 
 MONGO_URL = st.secrets["mongodb_read"]["uri"] # DB 설정
@@ -11,36 +15,61 @@ MONGO_URL = st.secrets["mongodb_read"]["uri"] # DB 설정
 client = MongoClient(MONGO_URL)
 db = client["blockchain_db"]
 blocks = db["blocks"]
+if "blockfiles" in st.secrets:   # 블록 파일 저장소를 쓰는 노드: 블록 조회를 파일 인덱스에서 처리
+    from blockfiles import BlockFileStore, BlockFileCollection
+
+    # 재실행마다 파일을 다시 열지 않도록 세션 간 공유 (읽기 전용: 채굴 노드의 기록을 건드리지 않음)
+    @st.cache_resource
+    def open_block_files(path):
+        return BlockFileStore(path, readonly=True)
+
+    blocks = BlockFileCollection(open_block_files(st.secrets["blockfiles"]["path"]), db)
 transactions = db["transactions"]
 transaction_pool = db["transaction_pool"]
 accounts = db["accounts"]
 account_snapshots = db["account_snapshots"]
+peers = db["peers"]
+
+# 노드 RPC 서버가 설정된 경우: 요약 통계를 한 번의 호출로 조회 (노드 메모리 캐시 사용)
+rpc = RPCClient(st.secrets["rpc"]["url"]) if "rpc" in st.secrets else None
+if rpc is not None:
+    stats = rpc.call("get_stats")
+    total_supply = stats["total_supply"]
+    last_block_index = stats["height"]
+    wallet_count = stats["wallet_count"]
+else:
+    # 총 발행량 계산
+    supply_pipeline = [
+        {"$group": {"_id": None, "total_supply": {"$sum": "$balance"}}}
+    ]
+    supply_result = list(accounts.aggregate(supply_pipeline))
+    total_supply = supply_result[0]["total_supply"] if supply_result else 0.0
 
-# 총 발행량 계산
-supply_pipeline = [
-    {"$group": {"_id": None, "total_supply": {"$sum": "$balance"}}}
-]
-supply_result = list(accounts.aggregate(supply_pipeline))
-total_supply = supply_result[0]["total_supply"] if supply_result else 0.0
-
-# 마지막 블록 인덱스
-latest_block = blocks.find_one(sort=[("index", -1)])
-last_block_index = latest_block["index"] if latest_block else 0
+    # 마지막 블록 인덱스
+    latest_block = blocks.find_one(sort=[("index", -1)])
+    last_block_index = latest_block["index"] if latest_block else 0
 
-# 총 지갑 수
-wallet_count = accounts.count_documents({})
+    # 총 지갑 수
+    wallet_count = accounts.count_documents({})
 
 col1, col2 = st.columns(2)
 col1.metric("📦 총 블록 수", f"{last_block_index:,}")
 col2.metric("🔢 총 발행량", f"{total_supply:,.2f} XPER")
 
 # 화면 출력
+# 최근 잔고 스냅샷
+if rpc is not None:
+    latest_snapshot = {"height": stats["latest_snapshot"]} if stats["latest_snapshot"] is not None else None
+else:
+    latest_snapshot = account_snapshots.find_one({"type": "header"}, sort=[("height", -1)])
+
 col1, col2 = st.columns(2)
 col1.metric("👛 총 지갑 수", f"{wallet_count:,}")
+col2.metric("📸 최근 스냅샷", f"#{latest_snapshot['height']:,}" if latest_snapshot else "없음")
 
 
 st.markdown("🏆 상위 10개 지갑")
-account_list = list(accounts.find().sort("balance", -1))
+account_list = stats["top_accounts"] if rpc is not None else list(accounts.find().sort("balance", -1))
 if not account_list:
     st.info("📭 아직 생성된 지갑이 없습니다.")
 else:
@@ -102,9 +131,19 @@ with st.expander("⛓️ 블록체인 탐색기", expanded=True):
             format="%d"
         )
 
-        block = blocks.find_one({"index": search_index})
+        if rpc is not None:
+            try:
+                block = rpc.call("get_block", index=int(search_index))
+            except RPCError:
+                block = None
+        else:
+            block = load_block(blocks, search_index)   # 가지치기된 블록은 보관소(blocks_archive)에서 복원
+        if block and block.get("pruned"):
+            st.info("❗해당 블록의 본문은 저장 공간 절약을 위해 삭제(pruning)되었습니다. (헤더만 보관)")
         if block:
-            txs = list(transactions.find({"block_index": search_index}).sort("timestamp", -1))
+            txs = [] if rpc is not None else list(transactions.find({"block_index": search_index}).sort("timestamp", -1))
+            if not txs and block.get("transactions"):
+                txs = sorted(block["transactions"], key=lambda tx: tx.get("timestamp", 0), reverse=True)
 
             # 📋 블록 정보 (HTML)
             block_html = f"""
@@ -119,8 +158,9 @@ with st.expander("⛓️ 블록체인 탐색기", expanded=True):
                     <tr><td>블록 번호</td><td>{block.get("index")}</td></tr>
                     <tr><td>해시</td><td>{block.get("hash", "")[:10]}...</td></tr>
                     <tr><td>이전 해시</td><td>{block.get("previous_hash", "")[:10]}...</td></tr>
+                    <tr><td>머클 루트</td><td>{block.get("merkle_root", "-")[:10]}...</td></tr>
                     <tr><td>생성 시간</td><td>{datetime.fromtimestamp(block.get("timestamp", time.time()), tz=KST).strftime('%Y-%m-%d %H:%M:%S')}</td></tr>
-                    <tr><td>트랜잭션 수</td><td>{len(txs)}</td></tr>
+                    <tr><td>트랜잭션 수</td><td>{block.get("tx_count", len(txs))}</td></tr>
                 </tbody>
             </table>
             """
@@ -158,6 +198,21 @@ with st.expander("⛓️ 블록체인 탐색기", expanded=True):
 
                 tx_html += "</div></tbody></table>"
                 st.markdown(tx_html, unsafe_allow_html=True)
+
+            # 🧾 트랜잭션 포함 증명
+            proof_hash = st.text_input("🧾 트랜잭션 해시로 포함 증명 확인", key="proof_tx_hash").strip()
+            if proof_hash:
+                tx_proof = get_tx_proof(blocks, search_index, proof_hash)
+                header = fetch_peer_header(peers, search_index) if tx_proof is not None else None
+                if tx_proof is None:
+                    st.info("❗이 블록에서 머클 증명을 만들 수 없습니다. (미포함 또는 이전 버전 블록)")
+                elif header is None:
+                    st.warning("❗피어에서 블록 헤더를 받지 못해 포함 증명을 독립적으로 검증할 수 없습니다.")
+                elif verify_tx_proof(tx_proof, header=header):
+                    st.success(f"✅ 포함 확인 (피어 헤더 기준): 위치 {tx_proof['position']}, 증명 해시 {len(tx_proof['proof'])}개")
+                    st.json(tx_proof)
+                else:
+                    st.error("❌ 포함 증명 검증 실패 (피어 헤더와 불일치)")
         else:            
             st.info("❗해당 블록은 저장 공간 절약을 위해 삭제(pruning)되었습니다.")
     
@@ -11,6 +11,7 @@ import qrcode
 from ecdsa import SigningKey, SECP256k1
 
 from blockchain import *
+from rpc import RPCClient, RPCError
 import utils
 
 KST = timezone(timedelta(hours=9))  # KST timezone
@@ -22,11 +23,20 @@ db = client["blockchain_db"]
 transactions = db["transactions"]
 transaction_pool = db["transaction_pool"]
 accounts = db["accounts"]
+blocks = db["blocks"]
 users = db["users"]
 peers = db['peers']  # p2p network will be implemented
 
 BLOCK_INTERVAL = 6
 
+rpc = RPCClient(st.secrets["rpc"]["url"]) if "rpc" in st.secrets else None   # 노드 RPC 서버 (설정 시 잔고/내역 조회, 이체 제출)
+
+# 잔고 조회 (RPC 서버 설정 시 노드 메모리 캐시 사용)
+def fetch_balance(address):
+    if rpc is not None:
+        return rpc.call("get_balance", address=address)["balance"]
+    return get_balance(address, accounts)
+
 
 if "logged_in_user" not in st.session_state:
     st.session_state["logged_in_user"] = None   # 처음 접속 시 로그인 모드 진입을 위한 변수
@@ -94,7 +104,7 @@ if not st.session_state["logged_in_user"]:
                 else:                                                          
                     
                     st.session_state["logged_in_user"] = user
-                    st.session_state["balance"] = get_balance(user["public_key"], accounts) 
+                    st.session_state["balance"] = fetch_balance(user["public_key"]) 
                     st.session_state["public_key"] = user["public_key"]  
                     st.session_state["private_key"] = utils.decrypt_private_key(user["private_key"], password)  # 추후 보안 강화 필요요                    
                     st.success(f"환영합니다, {username}님!")                    
@@ -132,7 +142,7 @@ with st.expander("📂 내 지갑 정보", expanded=True):
             st.image(buf.getvalue(), width=300)              
     with col3:
         if st.button("🔄 새로고침", key="refresh_balance"):
-            st.session_state["balance"] = get_balance(public_key, accounts)   
+            st.session_state["balance"] = fetch_balance(public_key)   
             st.session_state["qr_generated"] = False
             st.rerun()            
 
@@ -195,6 +205,7 @@ with st.expander("📤 이체", expanded=True):
             st.error("❌ 잔고 부족(수수료 포함)")
         else:            
             tx_data = {
+                "version": TX_VERSION,
                 "sender": public_key,
                 "recipient": recipient_value,
                 "amount": amount_value,
@@ -202,22 +213,38 @@ with st.expander("📤 이체", expanded=True):
                 "timestamp": time.time()
             }
             tx_data["signature"] = sign_transaction(private_key, tx_data)
-            transaction_pool.insert_one(tx_data)                            
+            tx_data["tx_hash"] = compute_tx_hash(tx_data)
+            if rpc is not None:
+                try:
+                    rpc.call("submit_tx", tx=tx_data)
+                except RPCError as e:
+                    st.error(f"❌ 이체 거부: {e.message}")
+                    st.stop()
+            else:
+                try:
+                    admit_transaction(transaction_pool, tx_data, accounts=accounts, blocks=blocks)
+                except TransactionRejected as e:
+                    st.error(f"❌ 이체 거부: {e}")
+                    st.stop()
+            st.session_state["last_tx_hash"] = tx_data["tx_hash"]
             st.success("✅ 이체 트랜잭션이 처리중입니다...")     
                         
             # 입력값 초기화용 플래그 활성화         
             time.sleep(BLOCK_INTERVAL)  # 블록 생성 시간 동안 대기
             st.session_state["clear_inputs"] = True
-            st.session_state["balance"] = get_balance(public_key, accounts)            
+            st.session_state["balance"] = fetch_balance(public_key)            
             st.rerun()                        
 
 with st.expander("📥 이체 내역", expanded=True):    
-    txs = list(transactions.find({
-        "$or": [
-            {"sender": public_key},
-            {"recipient": public_key}
-        ]
-    }).sort("timestamp", -1).limit(100))
+    if rpc is not None:
+        txs = rpc.call("get_history", address=public_key, limit=100)
+    else:
+        txs = list(transactions.find({
+            "$or": [
+                {"sender": public_key},
+                {"recipient": public_key}
+            ]
+        }).sort("timestamp", -1).limit(100))
 
     if txs:
         table_html = """
@@ -275,3 +302,22 @@ with st.expander("📥 이체 내역", expanded=True):
     else:
         st.info("📭 이체 내역이 없습니다.")
 
+with st.expander("🧾 이체 확인 (블록 포함 증명)", expanded=False):
+    tx_hash_input = st.text_input("🔎 트랜잭션 해시", value=st.session_state.get("last_tx_hash", ""), key="proof_tx_hash")
+    if st.button("✅ 포함 여부 확인") and tx_hash_input.strip():
+        tx_hash_input = tx_hash_input.strip()
+        block_index = find_tx_block_index(transactions, tx_hash_input)
+        if block_index is None:
+            st.info("⏳ 아직 블록에 포함되지 않았습니다.")
+        else:
+            tx_proof = get_tx_proof(blocks, block_index, tx_hash_input)
+            header = fetch_peer_header(peers, block_index) if tx_proof is not None else None
+            if tx_proof is None:
+                st.info(f"📦 블록 #{block_index}에 포함됨 (머클 루트 이전 버전 블록이거나 본문이 보관되지 않음)")
+            elif header is None:
+                st.warning(f"📦 블록 #{block_index}에 포함됨 (피어에서 블록 헤더를 받지 못해 독립 검증 불가)")
+            elif verify_tx_proof(tx_proof, header=header):
+                st.success(f"✅ 블록 #{block_index}에 포함됨 (피어 헤더 기준 머클 증명 {len(tx_proof['proof'])}단계 검증)")
+                st.code(f"머클 루트: {header['merkle_root']}\n블록 해시: {header['hash']}")
+            else:
+                st.error("❌ 포함 증명 검증 실패 (피어 헤더와 불일치)")